@@ -1,11 +1,22 @@
-from flask import Flask, request, jsonify, send_from_directory, send_file
+from flask import Flask, request, jsonify, send_from_directory, send_file, Response
 import os
-import numpy as np
-from plyfile import PlyData
-import json
 from flask_cors import CORS
 import logging
-from downsample import downsample_ply  # 导入降采样功能
+from downsample import (run_downsample, remove_outliers_ply, METHODS, VOXEL_METHODS, MESH_METHODS,
+                        BLUE_NOISE_METHODS, OUTPUT_FORMATS)  # 导入降采样功能
+from pointstream import iter_binary, payload_size, LAYOUTS, ORDERS
+from payload_cache import quantized_payload, negotiate_encoding, remove_payloads
+from cloud_cache import cloud_cache, read_vertex
+from ply_io import read_header, parse_header, read_records
+from columnar import read_columns, ensure_columns, open_columns, remove_columns
+from octree import ensure_lod, remove_lod, node_path
+from spatial_index import ensure_index, remove_index, query_region
+from preprocess import ensure_stats, load_stats, remove_stats, OUTLIER_METHODS
+from jobs import JobManager
+from chunked_upload import UploadSessions, OffsetMismatch, validate_header
+from batch_downsample import downsample_batch_zip, parse_ratios, check_inputs, BATCH_METHODS
+from metrics import stage, timed_iter
+import metrics
 import uuid
 
 # 配置日志
@@ -24,13 +35,28 @@ if not os.path.exists(UPLOAD_FOLDER):
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 2 * 1024 * 1024 * 1024  # 限制上传大小为2gb
+app.config['DOWNSAMPLE_MAX_CONTENT_LENGTH'] = 64 * 1024 * 1024 * 1024  # 降采样接口使用流式处理，允许64gb
+app.config['DOWNSAMPLE_WORKERS'] = int(os.environ.get('DOWNSAMPLE_WORKERS', 2))  # 后台降采样任务的并发数
+app.config['DOWNSAMPLE_PARALLEL_WORKERS'] = int(os.environ.get('DOWNSAMPLE_PARALLEL_WORKERS', 1))  # 单次降采样的并行进程数
+# 同步接口上泊松圆盘 / 最远点采样的点数上限，更大的点云耗时可达数十秒，需通过 /api/jobs/downsample 提交
+app.config['SYNC_BLUE_NOISE_MAX_POINTS'] = int(os.environ.get('SYNC_BLUE_NOISE_MAX_POINTS', 500000))
+# 同步接口 (上传和 /api/downsample) 上离群点滤波的点数上限，100万点需要数十秒，更大的点云需通过后台任务滤波
+app.config['SYNC_OUTLIER_MAX_POINTS'] = int(os.environ.get('SYNC_OUTLIER_MAX_POINTS', 500000))
+
+app.config['UPLOAD_CHUNK_MAX_BYTES'] = 64 * 1024 * 1024  # 分块上传时单个分块的最大字节数
+
+app.config['PROFILE_REQUESTS'] = os.environ.get('PROFILE_REQUESTS', '0') == '1'  # 是否允许 ?profile=1 分析单个请求，默认关闭 (报告含服务器路径)
+
+# 任务状态保存在 uploads/.jobs/，多个服务进程共用
+job_manager = JobManager(app.config['DOWNSAMPLE_WORKERS'], state_dir=os.path.join(UPLOAD_FOLDER, '.jobs'))
+metrics.init_app(app)  # 请求和阶段耗时直方图，/metrics 接口
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def check_vertex_properties(vertex):
-    """检查顶点元素的属性，输出详细信息以帮助调试"""
-    property_names = [prop.name for prop in vertex.properties]
+    """检查顶点结构化数组 (只需前几条记录) 的属性，输出详细信息以帮助调试"""
+    property_names = list(vertex.dtype.names)
     logger.info(f"点云包含的属性: {property_names}")
     
     # 检查是否有颜色属性
@@ -45,7 +71,7 @@ def check_vertex_properties(vertex):
             r = vertex['red'][i]
             g = vertex['green'][i]
             b = vertex['blue'][i]
-            logger.info(f"颜色样本 {i+1}: R={r}, G={g}, B={b}")
+            logger.debug(f"颜色样本 {i+1}: R={r}, G={g}, B={b}")
     else:
         logger.info("未检测到标准颜色属性 (red, green, blue)")
         
@@ -64,48 +90,229 @@ def upload_file():
         return jsonify({'error': '没有选择文件'}), 400
     
     if file and allowed_file(file.filename):
+        # 可选的离群点滤波，保存后、转换列式数据之前执行
+        outliers, error = parse_outlier_options(request.form)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        # 保存前只解析头部，头部无效或点数超过限制时直接拒绝，不写入上传目录
+        try:
+            header = parse_header(file.stream)
+            file.stream.seek(0, os.SEEK_END)
+            summary = validate_header(header, MAX_POINTS, file.stream.tell())
+        except ValueError as e:
+            logger.warning(f"上传的PLY文件无效: {str(e)}")
+            return jsonify({'error': str(e)}), 400
+        finally:
+            file.stream.seek(0)
+        error = sync_limit_error(summary['vertex_count'], outliers=outliers)
+        if error:
+            return jsonify({'error': error}), 400
+        
         filename = file.filename
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        # 先写入临时文件再原子替换，避免覆盖正在被读取的同名文件
+        partial_path = f"{filepath}.{uuid.uuid4().hex[:8]}.part"
+        with stage('write'):
+            file.save(partial_path)
+        extra = None
+        if outliers:
+            filtered_path = f"{partial_path}.filtered"
+            try:
+                removed = remove_outliers_ply(partial_path, filtered_path, **outliers)
+                os.replace(filtered_path, partial_path)
+            except Exception as e:
+                logger.error(f"离群点滤波出错: {str(e)}")
+                for path in (partial_path, filtered_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                return jsonify({'error': f'离群点滤波出错: {str(e)}'}), 500
+            finally:
+                cloud_cache.invalidate(partial_path)
+            extra = {'outliers_removed': removed}
+        os.replace(partial_path, filepath)
         logger.info(f"文件已保存到 {filepath}")
         
-        # 解析PLY文件获取元数据
-        try:
-            plydata = PlyData.read(filepath)
-            vertex = plydata['vertex']
-            
-            # 获取点数
-            num_points = len(vertex)
-            logger.info(f"点云包含 {num_points} 个点")
-            
-            # 检查点数是否超过限制
-            if num_points > MAX_POINTS:
-                # 删除上传的文件
-                try:
-                    os.remove(filepath)
-                except:
-                    pass
-                logger.warning(f"点数超过限制 ({num_points} > {MAX_POINTS})")
-                return jsonify({
-                    'error': f'{num_points} points, exceeded 400M points limit. Please use the "point cloud down-sampling tool" at the top of the page to reduce the point cloud density first.'
-                }), 400
-            
-            # 检查是否有颜色信息
-            has_colors = check_vertex_properties(vertex)
-            
-            return jsonify({
-                'success': True,
-                'filename': filename,
-                'total_points': num_points,
-                'has_colors': has_colors
-            })
-        except Exception as e:
-            logger.error(f"解析PLY文件时出错: {str(e)}")
-            return jsonify({'error': f'解析PLY文件时出错: {str(e)}'}), 500
+        return process_uploaded_file(filepath, filename, extra)
     
     logger.warning("只允许上传PLY文件")
     return jsonify({'error': '只允许上传PLY文件'}), 400
 
+def sync_limit_error(vertex_count, method=None, outliers=None):
+    """
+    检查在请求线程中执行的耗时操作 (蓝噪声采样、离群点滤波) 的点数上限
+
+    返回:
+        str: 超过上限时的错误信息，否则为None
+    """
+    limit = app.config['SYNC_BLUE_NOISE_MAX_POINTS']
+    if method in BLUE_NOISE_METHODS and vertex_count > limit:
+        logger.warning(f"{method} 采样点数 {vertex_count} 超过同步接口上限 {limit}")
+        return f"{method} 采样的点数超过 {limit}，请通过 /api/jobs/downsample 提交后台任务"
+    limit = app.config['SYNC_OUTLIER_MAX_POINTS']
+    if outliers and vertex_count > limit:
+        logger.warning(f"离群点滤波点数 {vertex_count} 超过同步接口上限 {limit}")
+        return (f"离群点滤波的点数超过 {limit}，请通过 /api/jobs/downsample 提交后台任务 "
+                f"(outliers 参数，keep_ratio=1 时只滤波不采样)")
+    return None
+
+def upload_sessions():
+    return UploadSessions(app.config['UPLOAD_FOLDER'], MAX_POINTS)
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """
+    创建分块上传会话
+
+    请求体为JSON: {"filename": "cloud.ply", "size": 文件总字节数}。
+    之后依次 PUT /api/uploads/<id>?offset=N 发送分块 (请求体为原始字节)，
+    最后 POST /api/uploads/<id>/finalize 完成上传。
+    """
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename', '')
+    if not filename or not allowed_file(filename) or os.path.basename(filename) != filename:
+        return jsonify({'error': '只允许上传PLY文件'}), 400
+    size = data.get('size')
+    if size is not None and (not isinstance(size, int) or size <= 0):
+        return jsonify({'error': 'size 必须是正整数'}), 400
+    
+    status = upload_sessions().create(filename, size)
+    status['chunk_size'] = app.config['UPLOAD_CHUNK_MAX_BYTES']
+    return jsonify(status), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def append_upload_chunk(upload_id):
+    """追加分块，offset 必须等于服务器已接收的字节数，不一致时返回409和当前偏移"""
+    request.max_content_length = app.config['UPLOAD_CHUNK_MAX_BYTES']
+    try:
+        offset = int(request.args.get('offset', ''))
+    except ValueError:
+        return jsonify({'error': '缺少有效的 offset 参数'}), 400
+    
+    try:
+        status = upload_sessions().append(upload_id, offset, request.stream)
+    except OffsetMismatch as e:
+        return jsonify({'error': str(e), 'offset': e.expected}), 409
+    except ValueError as e:
+        logger.warning(f"上传会话 {upload_id} 校验失败: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+    if status is None:
+        return jsonify({'error': '上传会话不存在'}), 404
+    return jsonify(status)
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload_status(upload_id):
+    """查询已接收的字节数，断线后从返回的 offset 继续上传"""
+    status = upload_sessions().status(upload_id)
+    if status is None:
+        return jsonify({'error': '上传会话不存在'}), 404
+    return jsonify(status)
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload(upload_id):
+    if not upload_sessions().abort(upload_id):
+        return jsonify({'error': '上传会话不存在'}), 404
+    return jsonify({'success': True})
+
+@app.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_upload(upload_id):
+    """完成分块上传，内容与已有文件相同时直接复用已有文件"""
+    try:
+        result = upload_sessions().finalize(upload_id)
+    except OffsetMismatch as e:
+        return jsonify({'error': f'文件尚未上传完整: {str(e)}', 'offset': e.expected}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if result is None:
+        return jsonify({'error': '上传会话不存在'}), 404
+    
+    if not result['deduplicated']:
+        cloud_cache.invalidate(result['filepath'])
+    return process_uploaded_file(result['filepath'], result['filename'],
+                                 {'sha256': result['sha256'], 'deduplicated': result['deduplicated']})
+
+def process_uploaded_file(filepath, filename, extra=None):
+    """检查已保存的上传文件的点数和属性并构建LOD，返回上传接口的响应"""
+    # 只读取头部和前几个顶点获取元数据，完整解析留给列式转换
+    try:
+        with stage('parse'):
+            header = read_header(filepath)
+            vertex_header = header.element('vertex')
+            if vertex_header is None:
+                raise ValueError('PLY文件中没有 vertex 元素')
+            samples = read_records(filepath, 'vertex', 5, header)
+            if samples is None:
+                samples = read_vertex(filepath)
+        
+        # 获取点数
+        num_points = vertex_header.count
+        logger.info(f"点云包含 {num_points} 个点")
+        
+        # 检查点数是否超过限制
+        if num_points > MAX_POINTS:
+            # 删除上传的文件
+            cloud_cache.invalidate(filepath)
+            remove_lod(filepath)
+            remove_payloads(filepath)
+            remove_columns(filepath)
+            remove_index(filepath)
+            remove_stats(filepath)
+            try:
+                os.remove(filepath)
+            except:
+                pass
+            logger.warning(f"点数超过限制 ({num_points} > {MAX_POINTS})")
+            return jsonify({
+                'error': f'{num_points} points, exceeded 400M points limit. Please use the "point cloud down-sampling tool" at the top of the page to reduce the point cloud density first.'
+            }), 400
+        
+        # 检查是否有颜色信息
+        has_colors = check_vertex_properties(samples)
+        
+        # 转换为列式存储，之后的读取只需内存映射所需的列；失败时回退到读取原始PLY，
+        # 原始文件也无法解析时由外层返回错误
+        try:
+            with stage('columns'):
+                ensure_columns(filepath)
+        except Exception as columns_error:
+            logger.warning(f"转换列式数据失败: {str(columns_error)}")
+            read_vertex(filepath)
+        
+        # 构建空间索引，供区域查询使用；失败时查询接口会在首次请求时重新构建
+        try:
+            with stage('index'):
+                ensure_index(filepath)
+        except Exception as index_error:
+            logger.warning(f"构建空间索引失败: {str(index_error)}")
+        
+        # 统计包围盒、点间距、密度和颜色范围并缓存在文件旁；失败时统计接口会在首次请求时重新计算
+        try:
+            with stage('stats'):
+                ensure_stats(filepath)
+        except Exception as stats_error:
+            logger.warning(f"计算点云统计信息失败: {str(stats_error)}")
+        
+        # 构建LOD八叉树，供查看器渐进加载；失败时查看器回退到整体加载
+        lod_nodes = 0
+        try:
+            with stage('lod'):
+                lod_nodes = len(ensure_lod(filepath)['nodes'])
+        except Exception as lod_error:
+            logger.warning(f"构建LOD八叉树失败: {str(lod_error)}")
+        
+        response = {
+            'success': True,
+            'filename': filename,
+            'total_points': num_points,
+            'has_colors': has_colors,
+            'lod_nodes': lod_nodes
+        }
+        response.update(extra or {})
+        return jsonify(response)
+    except Exception as e:
+        logger.error(f"解析PLY文件时出错: {str(e)}")
+        return jsonify({'error': f'解析PLY文件时出错: {str(e)}'}), 500
+
 @app.route('/api/pointcloud/<filename>', methods=['GET'])
 def get_pointcloud(filename):
     filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
@@ -115,20 +322,42 @@ def get_pointcloud(filename):
         logger.warning(f"文件不存在: {filepath}")
         return jsonify({'error': '文件不存在'}), 404
     
+    # format=binary 时返回二进制点流，layout 可选 interleaved / planar
+    response_format = request.args.get('format', 'json')
+    layout = request.args.get('layout', 'interleaved')
+    if response_format == 'binary' and layout not in LAYOUTS:
+        return jsonify({'error': f'未知的数据布局: {layout}'}), 400
+    
+    # format=quantized 时返回16位量化坐标，order 可选 none / morton，delta=0 关闭差分编码
+    if response_format == 'quantized':
+        order = request.args.get('order', 'morton')
+        if order not in ORDERS:
+            return jsonify({'error': f'未知的点排序方式: {order}'}), 400
+        delta = request.args.get('delta', '1') != '0'
+        try:
+            return quantized_pointcloud_response(filepath, order, delta)
+        except Exception as e:
+            logger.error(f"生成量化点云时出错: {str(e)}")
+            return jsonify({'error': f'生成量化点云时出错: {str(e)}'}), 500
+    
     try:
-        plydata = PlyData.read(filepath)
-        vertex = plydata['vertex']
+        with stage('parse'):
+            vertex = read_columns(filepath)
+        
+        if response_format == 'binary':
+            return binary_pointcloud_response(vertex, layout)
         
         # 提取点坐标
         x = vertex['x']
         y = vertex['y']
         z = vertex['z']
         
-        points = [[float(x[i]), float(y[i]), float(z[i])] for i in range(len(vertex))]
+        with stage('extract'):
+            points = [[float(x[i]), float(y[i]), float(z[i])] for i in range(len(vertex))]
         logger.info(f"成功提取了 {len(points)} 个点的坐标")
         
         # 检查顶点属性
-        property_names = [prop.name for prop in vertex.properties]
+        property_names = list(vertex.dtype.names)
         logger.info(f"点云包含的属性: {property_names}")
         
         # 如果有颜色信息，提取出来
@@ -145,22 +374,23 @@ def get_pointcloud(filename):
                 # 先检查一些颜色样本
                 sample_count = min(5, len(vertex))
                 for i in range(sample_count):
-                    logger.info(f"颜色样本 {i+1}: R={r[i]}, G={g[i]}, B={b[i]}")
+                    logger.debug(f"颜色样本 {i+1}: R={r[i]}, G={g[i]}, B={b[i]}")
                 
                 # 确保颜色数据转换为整数
                 colors = []
-                for i in range(len(vertex)):
-                    r_val = int(r[i]) if hasattr(r[i], '__int__') else r[i]
-                    g_val = int(g[i]) if hasattr(g[i], '__int__') else g[i]
-                    b_val = int(b[i]) if hasattr(b[i], '__int__') else b[i]
-                    colors.append([r_val, g_val, b_val])
+                with stage('extract'):
+                    for i in range(len(vertex)):
+                        r_val = int(r[i]) if hasattr(r[i], '__int__') else r[i]
+                        g_val = int(g[i]) if hasattr(g[i], '__int__') else g[i]
+                        b_val = int(b[i]) if hasattr(b[i], '__int__') else b[i]
+                        colors.append([r_val, g_val, b_val])
                 
                 logger.info(f"成功提取了 {len(colors)} 个点的颜色")
                 
                 # 记录一些颜色样本用于调试
                 if len(colors) > 0:
                     samples = colors[:5]
-                    logger.info(f"颜色样本: {samples}")
+                    logger.debug(f"颜色样本: {samples}")
             except Exception as color_error:
                 logger.error(f"提取颜色时出错: {str(color_error)}")
         else:
@@ -175,11 +405,129 @@ def get_pointcloud(filename):
             response['colors'] = colors
             logger.info(f"响应包含 {len(colors)} 个颜色数据")
         
-        return jsonify(response)
+        with stage('serialize'):
+            return jsonify(response)
     except Exception as e:
         logger.error(f"读取点云数据时出错: {str(e)}")
         return jsonify({'error': f'读取点云数据时出错: {str(e)}'}), 500
 
+def binary_pointcloud_response(vertex, layout):
+    """直接从顶点数组分块输出二进制点云，不构造Python列表"""
+    property_names = vertex.dtype.names
+    names = ['x', 'y', 'z'] + [c for c in ('red', 'green', 'blue') if c in property_names]
+    if len(names) < 6:
+        names = names[:3]
+    columns = {name: vertex[name] for name in names}
+    count = len(vertex)
+    has_colors = len(names) == 6
+    logger.info(f"以二进制格式输出 {count} 个点 (layout={layout}, colors={has_colors})")
+    
+    response = Response(timed_iter('serialize', iter_binary(columns, count, layout)),
+                        mimetype='application/octet-stream')
+    response.headers['Content-Length'] = str(payload_size(count, has_colors))
+    return response
+
+def quantized_pointcloud_response(filepath, order, delta):
+    """返回磁盘缓存的量化点云，按 Accept-Encoding 选择压缩方式"""
+    encoding = negotiate_encoding(request.accept_encodings)
+    with stage('serialize'):
+        path = quantized_payload(filepath, order, delta, encoding)
+    logger.info(f"以量化格式输出点云 (order={order}, delta={delta}, encoding={encoding})")
+    
+    response = send_file(os.path.abspath(path), mimetype='application/octet-stream')
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+@app.route('/api/lod/<filename>', methods=['GET'])
+def get_lod_hierarchy(filename):
+    """返回LOD八叉树的层级信息，尚未构建时先构建"""
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    if not os.path.exists(filepath):
+        return jsonify({'error': '文件不存在'}), 404
+    
+    try:
+        return jsonify(ensure_lod(filepath))
+    except Exception as e:
+        logger.error(f"构建LOD八叉树时出错: {str(e)}")
+        return jsonify({'error': f'构建LOD八叉树时出错: {str(e)}'}), 500
+
+@app.route('/api/lod/<filename>/<node_id>', methods=['GET'])
+def get_lod_node(filename, node_id):
+    """返回单个LOD节点的二进制点数据，格式与 /api/pointcloud?format=binary 相同"""
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    if not os.path.exists(filepath):
+        return jsonify({'error': '文件不存在'}), 404
+    
+    path = node_path(filepath, node_id)
+    if path is None:
+        return jsonify({'error': f'无效的节点编号: {node_id}'}), 400
+    
+    try:
+        ensure_lod(filepath)
+    except Exception as e:
+        logger.error(f"构建LOD八叉树时出错: {str(e)}")
+        return jsonify({'error': f'构建LOD八叉树时出错: {str(e)}'}), 500
+    
+    if not os.path.exists(path):
+        return jsonify({'error': f'节点不存在: {node_id}'}), 404
+    return send_file(os.path.abspath(path), mimetype='application/octet-stream')
+
+@app.route('/api/query/<filename>', methods=['POST'])
+def query_pointcloud(filename):
+    """
+    返回区域内的点，格式与 /api/pointcloud?format=binary 相同
+
+    请求体为JSON，box、sphere、frustum 三选一:
+        {"box": {"min": [x, y, z], "max": [x, y, z]}}
+        {"sphere": {"center": [x, y, z], "radius": r}}
+        {"frustum": [[a, b, c, d], ... 6个平面]}  内侧满足 a*x + b*y + c*z + d >= 0
+    可选 "budget" 限制返回的点数 (区域内按网格分层采样)、"seed" 和 "layout"。
+    响应头 X-Total-Matches 为区域内的总点数。
+    """
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    if not os.path.exists(filepath):
+        return jsonify({'error': '文件不存在'}), 404
+    
+    data = request.get_json(silent=True) or {}
+    layout = data.get('layout', 'interleaved')
+    if layout not in LAYOUTS:
+        return jsonify({'error': f'未知的数据布局: {layout}'}), 400
+    try:
+        box = sphere = None
+        if 'box' in data:
+            box = (data['box']['min'], data['box']['max'])
+        if 'sphere' in data:
+            sphere = (data['sphere']['center'], float(data['sphere']['radius']))
+        budget = data.get('budget')
+        if budget is not None and (not isinstance(budget, int) or budget <= 0):
+            return jsonify({'error': 'budget 必须是正整数'}), 400
+        seed = int(data.get('seed', 0))
+        with stage('query'):
+            indices, total = query_region(filepath, box=box, sphere=sphere, frustum=data.get('frustum'),
+                                          budget=budget, seed=seed)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f'无效的查询参数: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f"区域查询时出错: {str(e)}")
+        return jsonify({'error': f'区域查询时出错: {str(e)}'}), 500
+    
+    vertex = read_columns(filepath)
+    names = ['x', 'y', 'z']
+    if all(c in vertex.dtype.names for c in ('red', 'green', 'blue')):
+        names += ['red', 'green', 'blue']
+    with stage('extract'):
+        columns = {name: vertex[name][indices] for name in names}
+    logger.info(f"区域查询返回 {len(indices)} / {total} 个点")
+    
+    response = Response(timed_iter('serialize', iter_binary(columns, len(indices), layout)),
+                        mimetype='application/octet-stream')
+    response.headers['Content-Length'] = str(payload_size(len(indices), len(names) == 6))
+    response.headers['X-Total-Matches'] = str(total)
+    response.headers['Access-Control-Expose-Headers'] = 'X-Total-Matches'
+    return response
+
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
@@ -193,14 +541,15 @@ def analyze_ply_file(filename):
         return jsonify({'error': '文件不存在'}), 404
     
     try:
-        plydata = PlyData.read(filepath)
+        with stage('parse'):
+            header = read_header(filepath)
         
         # 收集所有元素信息
         elements = []
-        for element in plydata.elements:
+        for element in header.elements:
             elem_info = {
                 'name': element.name,
-                'count': len(element),
+                'count': element.count,
                 'properties': []
             }
             
@@ -208,55 +557,252 @@ def analyze_ply_file(filename):
             for prop in element.properties:
                 prop_info = {
                     'name': prop.name,
-                    'dtype': str(prop.dtype)
+                    'dtype': prop.describe()
                 }
                 elem_info['properties'].append(prop_info)
             
             elements.append(elem_info)
         
         # 如果有顶点元素，收集一些样本数据
+        # 只读取前几条记录 (二进制文件直接定位，ascii文件逐行读取)，不解析整个文件
         samples = []
-        if 'vertex' in plydata:
-            vertex = plydata['vertex']
+        columns = open_columns(filepath)
+        if header.element('vertex') is not None:
+            vertex = read_records(filepath, 'vertex', 5, header)
+            if vertex is None:
+                vertex = read_vertex(filepath)
             sample_count = min(5, len(vertex))
             
             # 输出所有可用的属性名
-            property_names = [p.name for p in vertex.properties]
+            property_names = list(vertex.dtype.names)
             logger.info(f"点云包含的属性: {property_names}")
             
             for i in range(sample_count):
                 sample = {}
-                for prop in vertex.properties:
+                for name in property_names:
                     try:
-                        value = vertex[prop.name][i]
-                        # 将NumPy类型转换为Python原生类型
-                        if hasattr(value, 'item'):
-                            value = value.item()
-                        sample[prop.name] = value
+                        value = vertex[name][i]
+                        # 将NumPy类型 (含列表属性的数组) 转换为Python原生类型
+                        if hasattr(value, 'tolist'):
+                            value = value.tolist()
+                        sample[name] = value
                     except Exception as sample_error:
-                        sample[prop.name] = f"ERROR: {str(sample_error)}"
+                        sample[name] = f"ERROR: {str(sample_error)}"
                 samples.append(sample)
         
         result = {
             'file': filename,
-            'format': plydata.format,
-            'version': plydata.version,
+            'format': header.format,
+            'version': header.version,
             'elements': elements,
             'vertex_samples': samples if samples else None
         }
+        if columns is not None:
+            # 上传时统计的包围盒和颜色范围
+            result['bounds'] = columns.manifest['bounds']
+            result['color_stats'] = columns.manifest['color_stats']
+        stats = load_stats(filepath)
+        if stats is not None:
+            result['stats'] = public_stats(stats)
         
         return jsonify(result)
     except Exception as e:
         logger.error(f"分析PLY文件时出错: {str(e)}")
         return jsonify({'error': f'分析PLY文件时出错: {str(e)}'}), 500
 
+@app.route('/api/stats/<filename>', methods=['GET'])
+def get_pointcloud_stats(filename):
+    """
+    返回点云统计信息: 包围盒、稳健包围盒、质心、典型点间距、密度直方图和颜色范围
+    结果缓存在文件旁，文件变化后重新计算
+    """
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    if not os.path.exists(filepath):
+        return jsonify({'error': '文件不存在'}), 404
+    
+    try:
+        with stage('stats'):
+            stats = ensure_stats(filepath)
+        return jsonify(public_stats(stats))
+    except Exception as e:
+        logger.error(f"计算点云统计信息时出错: {str(e)}")
+        return jsonify({'error': f'计算点云统计信息时出错: {str(e)}'}), 500
+
+def public_stats(stats):
+    # 去掉缓存校验用的字段
+    return {key: value for key, value in stats.items() if key not in ('version', 'source')}
+
+def parse_outlier_options(form):
+    """
+    解析离群点滤波参数: outliers 为 statistical 或 radius，可选 outlier_k、outlier_std_ratio
+    (statistical) 和 outlier_radius、outlier_min_neighbors (radius)
+
+    返回:
+        (dict, str): 滤波参数 (不滤波时为None) 和错误信息
+    """
+    method = form.get('outliers', '')
+    if method == '':
+        return None, None
+    if method not in OUTLIER_METHODS:
+        return None, f"未知的离群点滤波方法: {method}，可选 {'、'.join(OUTLIER_METHODS)}"
+    fields = {
+        'statistical': (('k', 'outlier_k', int), ('std_ratio', 'outlier_std_ratio', float)),
+        'radius': (('radius', 'outlier_radius', float), ('min_neighbors', 'outlier_min_neighbors', int))
+    }
+    options = {'method': method}
+    for name, field, parse in fields[method]:
+        if form.get(field, '') == '':
+            continue
+        try:
+            value = parse(form[field])
+        except ValueError:
+            value = None
+        if value is None or not value > 0:
+            return None, f"无效的 {field}: {form[field]}"
+        options[name] = value
+    logger.info(f"离群点滤波参数: {options}")
+    return options, None
+
+def parse_output_format(form):
+    """
+    解析输出格式参数 output_format: 为空时与输入相同，binary 为 binary_little_endian
+
+    返回:
+        (str, str): 输出格式和错误信息
+    """
+    output_format = form.get('output_format', '')
+    if output_format == '':
+        return None, None
+    if output_format == 'binary':
+        output_format = 'binary_little_endian'
+    if output_format not in OUTPUT_FORMATS:
+        return None, f"未知的输出格式: {output_format}，可选 binary、{'、'.join(OUTPUT_FORMATS)}"
+    return output_format, None
+
+def parse_downsample_options(form):
+    """
+    解析降采样表单参数 (keep_ratio, method, voxel_size, seed, output_format, outliers)
+
+    返回:
+        (dict, str): 参数字典和错误信息，参数有效时错误信息为None
+    """
+    # 获取降采样比例参数，默认为0.5 (50%)
+    try:
+        keep_ratio = float(form.get('keep_ratio', 0.5))
+    except ValueError:
+        logger.warning(f"无效的保留率: {form.get('keep_ratio')}")
+        return None, f"无效的保留率: {form.get('keep_ratio')}"
+    
+    # 验证keep_ratio是否在有效范围内 (NaN也视为无效)
+    if not 0.01 <= keep_ratio <= 1.0:
+        logger.warning(f"无效的保留率: {keep_ratio}，使用默认值0.5")
+        keep_ratio = 0.5
+    
+    logger.info(f"用户选择的降采样保留率: {keep_ratio}")
+    
+    # 获取降采样方法和体素边长
+    method = form.get('method', 'auto')
+    if method not in METHODS:
+        logger.warning(f"未知的降采样方法: {method}")
+        return None, f'未知的降采样方法: {method}'
+    
+    voxel_size = None
+    if method in VOXEL_METHODS:
+        try:
+            voxel_size = float(form.get('voxel_size', ''))
+        except ValueError:
+            voxel_size = None
+        if voxel_size is None or not voxel_size > 0:
+            logger.warning("体素降采样缺少有效的 voxel_size")
+            return None, '体素降采样需要提供正的 voxel_size'
+        logger.info(f"用户选择的体素降采样: {method}, 体素边长: {voxel_size}")
+    elif method in MESH_METHODS and form.get('voxel_size', '') != '':
+        # 顶点聚类的体素边长可选，未提供时按保留率搜索
+        try:
+            voxel_size = float(form['voxel_size'])
+        except ValueError:
+            voxel_size = None
+        if voxel_size is None or not voxel_size > 0:
+            return None, f"无效的 voxel_size: {form['voxel_size']}"
+    
+    # 可选的随机种子，相同种子得到相同的降采样结果
+    seed = None
+    if form.get('seed', '') != '':
+        try:
+            seed = int(form['seed'])
+        except ValueError:
+            return None, f"无效的随机种子: {form['seed']}"
+        if seed < 0:
+            return None, f"无效的随机种子: {form['seed']}"
+    
+    output_format, error = parse_output_format(form)
+    if error:
+        return None, error
+    
+    outliers, error = parse_outlier_options(form)
+    if error:
+        return None, error
+    
+    return {'keep_ratio': keep_ratio, 'method': method, 'voxel_size': voxel_size, 'seed': seed,
+            'workers': app.config['DOWNSAMPLE_PARALLEL_WORKERS'], 'output_format': output_format,
+            'outliers': outliers}, None
+
+def save_downsample_upload(file):
+    """
+    将降采样请求上传的文件保存为唯一的临时文件
+
+    返回:
+        (str, str, str): 清理后的文件名、临时输入路径和输出路径
+    """
+    # 获取原始文件名并处理特殊字符
+    orig_filename = file.filename
+    # 清理文件名，移除或替换不允许的字符
+    safe_filename = "".join([c for c in orig_filename if c.isalnum() or c in "._- "]).rstrip()
+    if not safe_filename:
+        safe_filename = "file.ply"
+    
+    # 创建唯一的临时文件名
+    unique_id = str(uuid.uuid4())[:8]
+    temp_filename = f"temp_{unique_id}_{safe_filename}"
+    output_filename = f"downsampled_{unique_id}_{safe_filename}"
+    
+    # 完整路径
+    temp_upload_path = os.path.join(app.config['UPLOAD_FOLDER'], temp_filename)
+    output_path = os.path.join(app.config['UPLOAD_FOLDER'], output_filename)
+    
+    logger.info(f"保存上传文件到: {temp_upload_path}")
+    with stage('write'):
+        file.save(temp_upload_path)
+    
+    # 获取文件大小
+    file_size_mb = os.path.getsize(temp_upload_path) / (1024 * 1024)
+    logger.info(f"接收到的文件大小: {file_size_mb:.2f} MB")
+    
+    return safe_filename, temp_upload_path, output_path
+
+def downsample_download_name(options, safe_filename):
+    if options['voxel_size'] is not None:
+        return f"{options['method']}_{options['voxel_size']:g}_{safe_filename}"
+    return f"downsampled_{options['keep_ratio']:.2f}_{safe_filename}"
+
 @app.route('/api/downsample', methods=['POST'])
 def downsample_file():
     """
     对PLY文件进行降采样
     可以指定保留点的百分比 (10%, 25%, 50%, 75%)
+    method 为 poisson / fps 时按泊松圆盘 / 近似最远点采样，保留的点间距更均匀；
+    也可以通过 method 选择体素网格降采样 (voxel_first / voxel_centroid / voxel_nearest)，
+    此时需要提供 voxel_size
+    输入为网格时面片的顶点索引随保留的顶点重映射，引用了已删除顶点的面片被丢弃；
+    method 为 cluster 时按顶点聚类简化网格，voxel_size 可选 (默认按保留率确定)
+    output_format 为 binary 时把ascii文件输出为二进制，默认与输入格式相同
+    outliers 为 statistical / radius 时先删除离群点再采样 (参数见 parse_outlier_options)
+    poisson / fps 的点数超过 SYNC_BLUE_NOISE_MAX_POINTS、离群点滤波的点数超过 SYNC_OUTLIER_MAX_POINTS 时
+    返回400，需改用 /api/jobs/downsample
     """
     logger.info("接收到降采样请求")
+    # 降采样不受上传点数限制，大文件走流式降采样
+    request.max_content_length = app.config['DOWNSAMPLE_MAX_CONTENT_LENGTH']
     if 'file' not in request.files:
         logger.warning("没有选择文件")
         return jsonify({'error': '没有选择文件'}), 400
@@ -266,55 +812,36 @@ def downsample_file():
         logger.warning("没有选择文件")
         return jsonify({'error': '没有选择文件'}), 400
     
-    # 获取降采样比例参数，默认为0.5 (50%)
-    keep_ratio = float(request.form.get('keep_ratio', 0.5))
-    
-    # 验证keep_ratio是否在有效范围内
-    if keep_ratio < 0.01 or keep_ratio > 1.0:
-        logger.warning(f"无效的保留率: {keep_ratio}，使用默认值0.5")
-        keep_ratio = 0.5
-    
-    logger.info(f"用户选择的降采样保留率: {keep_ratio}")
+    options, error = parse_downsample_options(request.form)
+    if error:
+        return jsonify({'error': error}), 400
     
     if file and allowed_file(file.filename):
-        # 获取原始文件名并处理特殊字符
-        orig_filename = file.filename
-        # 清理文件名，移除或替换不允许的字符
-        safe_filename = "".join([c for c in orig_filename if c.isalnum() or c in "._- "]).rstrip()
-        if not safe_filename:
-            safe_filename = "file.ply"
-        
-        # 创建唯一的临时文件名
-        unique_id = str(uuid.uuid4())[:8]
-        temp_filename = f"temp_{unique_id}_{safe_filename}"
-        output_filename = f"downsampled_{unique_id}_{safe_filename}"
-        
-        # 完整路径
-        temp_upload_path = os.path.join(app.config['UPLOAD_FOLDER'], temp_filename)
-        output_path = os.path.join(app.config['UPLOAD_FOLDER'], output_filename)
-        
-        logger.info(f"保存上传文件到: {temp_upload_path}")
-        
+        temp_upload_path = None
         try:
             # 保存上传的文件
-            file.save(temp_upload_path)
+            safe_filename, temp_upload_path, output_path = save_downsample_upload(file)
             
-            # 获取文件大小
-            file_size_mb = os.path.getsize(temp_upload_path) / (1024 * 1024)
-            logger.info(f"接收到的文件大小: {file_size_mb:.2f} MB")
+            # 蓝噪声采样和离群点滤波耗时随点数增长较快，大点云在请求线程中执行可能超过worker超时
+            if options['method'] in BLUE_NOISE_METHODS or options['outliers']:
+                vertex_header = read_header(temp_upload_path).element('vertex')
+                error = vertex_header and sync_limit_error(vertex_header.count, options['method'], options['outliers'])
+                if error:
+                    return jsonify({'error': error}), 400
             
             # 降采样文件
-            logger.info(f"开始降采样过程，保留率: {keep_ratio}")
+            logger.info(f"开始降采样过程，保留率: {options['keep_ratio']}")
             
-            # 调用降采样功能
+            # 调用降采样功能，超过点数上限且使用网格分层采样时改用分块流式降采样
             try:
-                downsampled_path = downsample_ply(temp_upload_path, output_path, keep_ratio)
+                downsampled_path = run_downsample(temp_upload_path, output_path,
+                                                  streaming_threshold=MAX_POINTS, **options)
                 logger.info(f"降采样完成: {downsampled_path}")
                 
                 # 返回降采样后的文件
                 return send_file(downsampled_path, 
                                 as_attachment=True, 
-                                download_name=f"downsampled_{keep_ratio:.2f}_{safe_filename}")
+                                download_name=downsample_download_name(options, safe_filename))
             except Exception as e:
                 logger.error(f"降采样过程中出错: {str(e)}")
                 return jsonify({'error': f'降采样过程中出错: {str(e)}'}), 500
@@ -324,15 +851,202 @@ def downsample_file():
             return jsonify({'error': f'处理文件时出错: {str(e)}'}), 500
         finally:
             # 尝试清理临时文件
+            if temp_upload_path:
+                cloud_cache.invalidate(temp_upload_path)
+                try:
+                    if os.path.exists(temp_upload_path):
+                        os.unlink(temp_upload_path)
+                except Exception as e:
+                    logger.warning(f"清理临时文件时出错: {str(e)}")
+    
+    logger.warning("只允许上传PLY文件")
+    return jsonify({'error': '只允许上传PLY文件'}), 400
+
+@app.route('/api/jobs/downsample', methods=['POST'])
+def submit_downsample_job():
+    """
+    提交后台降采样任务，参数与 /api/downsample 相同
+    立即返回任务ID，通过 /api/jobs/<job_id> 查询进度
+    """
+    logger.info("接收到降采样任务请求")
+    request.max_content_length = app.config['DOWNSAMPLE_MAX_CONTENT_LENGTH']
+    if 'file' not in request.files or request.files['file'].filename == '':
+        logger.warning("没有选择文件")
+        return jsonify({'error': '没有选择文件'}), 400
+    
+    file = request.files['file']
+    if not allowed_file(file.filename):
+        logger.warning("只允许上传PLY文件")
+        return jsonify({'error': '只允许上传PLY文件'}), 400
+    
+    options, error = parse_downsample_options(request.form)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    try:
+        safe_filename, temp_upload_path, output_path = save_downsample_upload(file)
+        job_id = job_manager.submit(temp_upload_path, output_path,
+                                    downsample_download_name(options, safe_filename),
+                                    streaming_threshold=MAX_POINTS, **options)
+    except Exception as e:
+        logger.error(f"提交降采样任务时出错: {str(e)}")
+        return jsonify({'error': f'提交降采样任务时出错: {str(e)}'}), 500
+    
+    return jsonify({'job_id': job_id, 'status': 'queued'}), 202
+
+def parse_batch_request():
+    """
+    解析批量降采样请求: 多个 files、逗号分隔的 keep_ratios、method、seed 和 output_format
+
+    返回:
+        (list, dict, str): 上传的文件、参数字典和错误信息，参数有效时错误信息为None
+    """
+    files = [f for f in request.files.getlist('files') if f.filename]
+    if not files:
+        return None, None, '没有选择文件'
+    if not all(allowed_file(f.filename) for f in files):
+        return None, None, '只允许上传PLY文件'
+    try:
+        keep_ratios = parse_ratios(request.form.get('keep_ratios', '0.1,0.25,0.5,0.75'))
+    except ValueError as e:
+        return None, None, f'无效的保留率: {str(e)}'
+    method = request.form.get('method', 'auto')
+    if method not in BATCH_METHODS:
+        return None, None, f"批量降采样不支持的方法: {method}，可选 {', '.join(BATCH_METHODS)}"
+    seed = None
+    if request.form.get('seed', '') != '':
+        try:
+            seed = int(request.form['seed'])
+        except ValueError:
+            return None, None, f"无效的随机种子: {request.form['seed']}"
+    output_format, error = parse_output_format(request.form)
+    if error:
+        return None, None, error
+    logger.info(f"批量降采样: {len(files)} 个文件，保留率: {keep_ratios}，方法: {method}")
+    # 超过点数上限的文件逐个保留率流式降采样，不整体读入内存
+    return files, {'keep_ratios': keep_ratios, 'method': method, 'seed': seed,
+                   'output_format': output_format, 'streaming_threshold': MAX_POINTS}, None
+
+def save_batch_uploads(files, options):
+    """
+    保存批量降采样上传的文件，返回清理后的文件名、临时输入路径和输出zip路径
+
+    超过点数上限且无法流式降采样的文件 (含面片或指定了其他输出格式) 抛出ValueError，已保存的文件被删除
+    """
+    names, paths = [], []
+    try:
+        for file in files:
+            safe_filename, temp_upload_path, _ = save_downsample_upload(file)
+            names.append(safe_filename)
+            paths.append(temp_upload_path)
+        check_inputs(paths, options['streaming_threshold'], options['output_format'], names)
+    except Exception:
+        # 部分文件保存失败时删除已保存的文件
+        for path in paths:
+            if os.path.exists(path):
+                os.unlink(path)
+        raise
+    zip_path = os.path.join(app.config['UPLOAD_FOLDER'], f"batch_{uuid.uuid4().hex[:8]}.zip")
+    return names, paths, zip_path
+
+@app.route('/api/downsample/batch', methods=['POST'])
+def downsample_batch_files():
+    """
+    批量降采样: 多个文件 (files) 按多个保留率 (keep_ratios，如 0.1,0.25,0.5,0.75) 降采样，返回zip
+    每个文件只读取和分组一次，同一文件不同保留率的结果互为子集。method 可选 auto / random / grid
+    """
+    logger.info("接收到批量降采样请求")
+    request.max_content_length = app.config['DOWNSAMPLE_MAX_CONTENT_LENGTH']
+    files, options, error = parse_batch_request()
+    if error:
+        logger.warning(error)
+        return jsonify({'error': error}), 400
+    
+    paths = []
+    try:
+        names, paths, zip_path = save_batch_uploads(files, options)
+        downsample_batch_zip(paths, zip_path, names=names, **options)
+    except ValueError as e:
+        logger.warning(f"批量降采样参数无效: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"批量降采样过程中出错: {str(e)}")
+        return jsonify({'error': f'批量降采样过程中出错: {str(e)}'}), 500
+    finally:
+        for path in paths:
+            cloud_cache.invalidate(path)
             try:
-                if os.path.exists(temp_upload_path):
-                    os.unlink(temp_upload_path)
+                if os.path.exists(path):
+                    os.unlink(path)
             except Exception as e:
                 logger.warning(f"清理临时文件时出错: {str(e)}")
     
-    logger.warning("只允许上传PLY文件")
-    return jsonify({'error': '只允许上传PLY文件'}), 400
+    # 打开后即删除zip，文件在发送完成、句柄关闭后释放
+    archive = open(zip_path, 'rb')
+    try:
+        os.unlink(zip_path)
+    except OSError as e:
+        logger.warning(f"删除批量降采样结果时出错: {str(e)}")
+    return send_file(archive, mimetype='application/zip', as_attachment=True, download_name='downsampled.zip')
+
+@app.route('/api/jobs/downsample/batch', methods=['POST'])
+def submit_batch_job():
+    """提交后台批量降采样任务，参数与 /api/downsample/batch 相同，结果通过 /api/jobs/<job_id>/result 下载"""
+    logger.info("接收到批量降采样任务请求")
+    request.max_content_length = app.config['DOWNSAMPLE_MAX_CONTENT_LENGTH']
+    files, options, error = parse_batch_request()
+    if error:
+        logger.warning(error)
+        return jsonify({'error': error}), 400
+    
+    try:
+        names, paths, zip_path = save_batch_uploads(files, options)
+        job_id = job_manager.submit_batch(paths, zip_path, 'downsampled.zip', names=names, **options)
+    except ValueError as e:
+        logger.warning(f"批量降采样参数无效: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"提交批量降采样任务时出错: {str(e)}")
+        return jsonify({'error': f'提交批量降采样任务时出错: {str(e)}'}), 500
+    
+    return jsonify({'job_id': job_id, 'status': 'queued'}), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询任务状态: queued / running / cancelling / done / failed / cancelled，以及当前阶段和已处理点数"""
+    info = job_manager.get(job_id)
+    if info is None:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify(info)
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """取消任务"""
+    if not job_manager.cancel(job_id):
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify(job_manager.get(job_id))
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """下载已完成任务的降采样结果"""
+    info = job_manager.get(job_id)
+    if info is None:
+        return jsonify({'error': '任务不存在'}), 404
+    
+    result = job_manager.result(job_id)
+    if result is None:
+        return jsonify({'error': f"任务尚未完成: {info['status']}", 'status': info['status']}), 409
+    
+    output_path, download_name = result
+    return send_file(os.path.abspath(output_path), as_attachment=True, download_name=download_name)
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """返回点云缓存的命中、未命中和淘汰计数"""
+    return jsonify(cloud_cache.stats())
 
 if __name__ == '__main__':
-    logger.info("后端服务器启动在 http://0.0.0.0:8085")
-    app.run(host='0.0.0.0', port=8085, debug=True) 
\ No newline at end of file
+    # 开发服务器，生产环境使用 gunicorn -c gunicorn.conf.py wsgi:app (见 wsgi.py)
+    port = int(os.environ.get('PORT', 8085))
+    logger.info(f"后端开发服务器启动在 http://0.0.0.0:{port}")
+    app.run(host='0.0.0.0', port=port, debug=os.environ.get('FLASK_DEBUG') == '1', threaded=True) 
\ No newline at end of file
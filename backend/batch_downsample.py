@@ -0,0 +1,212 @@
+"""
+多文件、多保留率的批量降采样
+
+每个点云只读取和分组一次，按网格分层 (或随机) 排出一个保留顺序，各保留率的结果取该顺序的前缀，
+因此同一文件的不同保留率互为子集 (10% 的点都包含在 25% 的结果中)。
+点数超过 streaming_threshold 的文件无法整体读入内存，对每个保留率分别流式降采样，结果不再互为子集。
+
+用法:
+    python batch_downsample.py scan1.ply scan2.ply --ratios 0.1,0.25,0.5,0.75 --output-dir out
+    python batch_downsample.py scans/*.ply --zip scans_downsampled.zip --method grid --seed 0
+"""
+import os
+import sys
+import json
+import shutil
+import zipfile
+import argparse
+import tempfile
+import logging
+import numpy as np
+from cloud_cache import read_vertex
+from columnar import open_columns
+from ply_io import read_header
+from downsample import (grid_cell_ids, nested_sample_order, write_vertex_subset, report_progress,
+                        downsample_ply_streaming, can_stream, LARGE_CLOUD_POINTS, OUTPUT_FORMATS)
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+BATCH_METHODS = ('auto', 'random', 'grid')  # 可以得到嵌套结果的采样方法
+DEFAULT_RATIOS = (0.1, 0.25, 0.5, 0.75)
+MANIFEST_NAME = 'manifest.json'
+
+
+def parse_ratios(text):
+    """解析逗号分隔的保留率，去重后按从小到大排列，超出 (0.01, 1.0) 范围时抛出ValueError"""
+    ratios = set()
+    for item in text.split(','):
+        if not item.strip():
+            continue
+        ratio = float(item)
+        if ratio < 0.01 or ratio > 1.0:
+            raise ValueError(f'保留率必须在0.01到1之间: {item.strip()}')
+        ratios.add(ratio)
+    if not ratios:
+        raise ValueError('至少需要一个保留率')
+    return sorted(ratios)
+
+
+def output_name(name, keep_ratio):
+    return f"downsampled_{keep_ratio:.2f}_{name}"
+
+
+def _unique_names(names):
+    # 不同目录下的同名文件在输出中加序号区分
+    seen = {}
+    result = []
+    for name in names:
+        stem, ext = os.path.splitext(name)
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        result.append(name if count == 0 else f'{stem}_{count}{ext}')
+    return result
+
+
+def check_inputs(input_paths, streaming_threshold=None, output_format=None, names=None):
+    """
+    在开始批量降采样前检查输入，点数超过 streaming_threshold 且无法流式降采样时抛出ValueError
+
+    返回:
+        list: 每个输入是否需要流式降采样
+    """
+    names = names or [os.path.basename(path) for path in input_paths]
+    streamed = []
+    for input_path, name in zip(input_paths, names):
+        header = read_header(input_path)
+        vertex_header = header.element('vertex')
+        if vertex_header is None:
+            raise ValueError(f"{name}: PLY文件中没有 vertex 元素")
+        oversized = streaming_threshold is not None and vertex_header.count > streaming_threshold
+        if oversized and not can_stream(header, output_format):
+            raise ValueError(f"{name}: 点数 {vertex_header.count} 超过 {streaming_threshold}，"
+                             f"只有不含面片的点云且输出为 binary_little_endian 时才能批量降采样")
+        streamed.append(oversized)
+    return streamed
+
+
+def downsample_batch(input_paths, output_dir, keep_ratios=DEFAULT_RATIOS, method='auto', seed=None,
+                     names=None, progress_callback=None, output_format=None, streaming_threshold=None):
+    """
+    对多个PLY文件按多个保留率降采样
+
+    参数:
+        input_paths (list): 输入PLY文件路径
+        output_dir (str): 输出目录
+        keep_ratios (list): 保留率列表 (0.01-1.0)
+        method (str): 'auto' (超过100万点时网格分层，否则随机) / 'random' / 'grid'
+        seed (int): 随机种子，每个文件使用相同的种子
+        names (list): 输出使用的文件名，默认为输入文件名
+        progress_callback (callable): 进度回调 (stage, 已完成的输出数, 输出总数)
+        output_format (str): 输出格式，为None时与各输入文件相同
+        streaming_threshold (int): 点数超过该值的文件对每个保留率分别流式降采样 (网格分层，结果不互为子集)，
+            这类文件有面片或指定了其他输出格式时在开始前抛出ValueError
+
+    返回:
+        list: 每个输出的 {'input', 'name', 'keep_ratio', 'points', 'path'}
+    """
+    if method not in BATCH_METHODS:
+        raise ValueError(f"批量降采样不支持的方法: {method}，可选 {', '.join(BATCH_METHODS)}")
+    if output_format is not None and output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"未知的输出格式: {output_format}")
+    keep_ratios = sorted({max(0.01, min(1.0, float(r))) for r in keep_ratios})
+    names = _unique_names(names or [os.path.basename(path) for path in input_paths])
+    streamed = check_inputs(input_paths, streaming_threshold, output_format, names)
+    os.makedirs(output_dir, exist_ok=True)
+
+    total = len(input_paths) * len(keep_ratios)
+    results = []
+    report_progress(progress_callback, 'batch', 0, total)
+    for input_path, name, stream in zip(input_paths, names, streamed):
+        if stream:
+            # 超出内存的大点云无法共享一次读取，每个保留率分别流式降采样
+            logger.info(f"批量降采样: {input_path} 点数超过 {streaming_threshold}，使用流式降采样")
+            for keep_ratio in keep_ratios:
+                path = os.path.join(output_dir, output_name(name, keep_ratio))
+                downsample_ply_streaming(input_path, path, keep_ratio, progress_callback=progress_callback,
+                                         seed=seed)
+                results.append({'input': input_path, 'name': name, 'keep_ratio': keep_ratio,
+                                'points': read_header(path).element('vertex').count, 'path': path})
+                report_progress(progress_callback, 'batch', len(results), total)
+                logger.info(f"已写出 {path}: {results[-1]['points']} 个点")
+            continue
+        logger.info(f"批量降采样: {input_path}，保留率: {keep_ratios}，方法: {method}")
+        with stage('parse'):
+            header = read_header(input_path)
+            vertex = open_columns(input_path)
+            if vertex is None:
+                vertex = read_vertex(input_path)
+        count = len(vertex)
+
+        # 读取和分组只做一次，各保留率的结果取同一保留顺序的前缀
+        with stage('sample'):
+            rng = np.random.default_rng(seed)
+            use_grid = method == 'grid' or (method == 'auto' and count > LARGE_CLOUD_POINTS)
+            cells = grid_cell_ids(vertex['x'], vertex['y'], vertex['z']) if use_grid and count else None
+            order = nested_sample_order(count, rng, cells)
+
+        for keep_ratio in keep_ratios:
+            sample_count = max(1, int(count * keep_ratio)) if count else 0
+            indices = np.sort(order[:sample_count])
+            path = os.path.join(output_dir, output_name(name, keep_ratio))
+            write_vertex_subset(input_path, path, header, vertex, indices, output_format=output_format)
+            results.append({'input': input_path, 'name': name, 'keep_ratio': keep_ratio,
+                            'points': int(sample_count), 'path': path})
+            report_progress(progress_callback, 'batch', len(results), total)
+            logger.info(f"已写出 {path}: {sample_count}/{count} 个点")
+    return results
+
+
+def write_zip(results, zip_path):
+    """把批量降采样的结果和清单打包为zip (不压缩，PLY坐标数据压缩率低且压缩很慢)"""
+    manifest = [{'file': os.path.basename(r['path']), 'source': r['name'], 'keep_ratio': r['keep_ratio'],
+                 'points': r['points']} for r in results]
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+        with stage('write'):
+            for result in results:
+                archive.write(result['path'], os.path.basename(result['path']))
+            archive.writestr(MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False, indent=2))
+    return zip_path
+
+
+def downsample_batch_zip(input_paths, zip_path, keep_ratios=DEFAULT_RATIOS, method='auto', seed=None,
+                         names=None, progress_callback=None, output_format=None, streaming_threshold=None):
+    """批量降采样并打包为zip，中间文件写在zip所在目录的临时目录中，结束后删除"""
+    work_dir = tempfile.mkdtemp(prefix='batch_', dir=os.path.dirname(os.path.abspath(zip_path)))
+    try:
+        results = downsample_batch(input_paths, work_dir, keep_ratios, method, seed, names, progress_callback,
+                                   output_format, streaming_threshold)
+        return write_zip(results, zip_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='多文件、多保留率的批量点云降采样')
+    parser.add_argument('inputs', nargs='+', help='输入PLY文件')
+    parser.add_argument('--ratios', default=','.join(str(r) for r in DEFAULT_RATIOS), help='逗号分隔的保留率')
+    parser.add_argument('--method', default='auto', choices=BATCH_METHODS, help='采样方法')
+    parser.add_argument('--seed', type=int, help='随机种子')
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, help='输出格式，默认与输入相同')
+    parser.add_argument('--output-dir', default='.', help='输出目录')
+    parser.add_argument('--zip', help='把所有结果打包到该zip文件，而不是写入输出目录')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        ratios = parse_ratios(args.ratios)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.zip:
+        downsample_batch_zip(args.inputs, args.zip, ratios, args.method, args.seed,
+                             output_format=args.output_format)
+        print(args.zip)
+    else:
+        for result in downsample_batch(args.inputs, args.output_dir, ratios, args.method, args.seed,
+                                       output_format=args.output_format):
+            print(f"{result['path']}\t{result['points']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
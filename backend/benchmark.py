@@ -0,0 +1,240 @@
+"""
+后端热点路径的基准测试
+
+生成合成PLY文件 (ascii/二进制、有无颜色、有无面片)，测量以下操作的耗时、吞吐量和峰值内存:
+    - PlyData.read 完整解析
+    - read_vertex 读取顶点 (二进制文件为内存映射)
+    - downsample_ply 的各个分支 (<100万点的随机采样、>100万点的网格分层采样)
+    - /api/pointcloud、/api/upload、/api/downsample 接口 (Flask test client)
+
+用法:
+    python benchmark.py                                  # 默认规模 10K,100K,1M
+    python benchmark.py --sizes 10K,1M,10M --repeat 3
+    python benchmark.py --save-baseline benchmark_baseline.json
+    python benchmark.py --baseline benchmark_baseline.json --threshold 0.2
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+import logging
+import numpy as np
+from plyfile import PlyData, PlyElement
+
+DEFAULT_SIZES = '10K,100K,1M'
+DEFAULT_RATIOS = (0.1, 0.5)
+
+
+def parse_size(text):
+    """解析 10K / 1M 形式的点数"""
+    text = text.strip().upper()
+    multiplier = 1
+    if text.endswith('K'):
+        multiplier, text = 1000, text[:-1]
+    elif text.endswith('M'):
+        multiplier, text = 1000000, text[:-1]
+    return int(float(text) * multiplier)
+
+
+def generate_ply(path, count, text=False, colors=True, faces=False, seed=0):
+    """生成合成点云: 若干高斯团簇加均匀噪声，可选颜色和三角面片"""
+    rng = np.random.default_rng(seed)
+    dtype = [('x', 'f4'), ('y', 'f4'), ('z', 'f4')]
+    if colors:
+        dtype += [('red', 'u1'), ('green', 'u1'), ('blue', 'u1')]
+    vertex = np.empty(count, dtype=dtype)
+
+    centers = rng.uniform(-50, 50, size=(16, 3))
+    cluster = rng.integers(0, len(centers), count)
+    points = centers[cluster] + rng.normal(scale=3.0, size=(count, 3))
+    noise = rng.random(count) < 0.05
+    points[noise] = rng.uniform(-60, 60, size=(int(noise.sum()), 3))
+    vertex['x'], vertex['y'], vertex['z'] = points.T
+    if colors:
+        for channel in ('red', 'green', 'blue'):
+            vertex[channel] = rng.integers(0, 256, count)
+
+    elements = [PlyElement.describe(vertex, 'vertex')]
+    if faces:
+        face = np.empty(count // 2, dtype=[('vertex_indices', 'i4', (3,))])
+        face['vertex_indices'] = rng.integers(0, count, size=(count // 2, 3))
+        elements.append(PlyElement.describe(face, 'face'))
+    PlyData(elements, text=text).write(path)
+
+
+def measure(func, repeat=1):
+    """运行 repeat 次，返回最短耗时 (秒) 和峰值Python内存 (字节，由tracemalloc统计，包含NumPy数组)"""
+    best = None
+    peak = 0
+    for _ in range(repeat):
+        tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            func()
+        finally:
+            elapsed = time.perf_counter() - start
+            _, run_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        best = elapsed if best is None else min(best, elapsed)
+        peak = max(peak, run_peak)
+    return best, peak
+
+
+def build_cases(workdir, sizes, ratios, max_json_points, max_ascii_points):
+    """生成测试文件并返回 (名称, 点数, 函数) 列表"""
+    import app as backend
+    from cloud_cache import cloud_cache, read_vertex
+    from downsample import downsample_ply
+
+    upload_dir = os.path.join(workdir, 'uploads')
+    os.makedirs(upload_dir, exist_ok=True)
+    backend.app.config['UPLOAD_FOLDER'] = upload_dir
+    client = backend.app.test_client()
+
+    def cold(func):
+        # 每次运行前清空缓存，测量冷启动开销
+        def run():
+            cloud_cache.clear()
+            func()
+        return run
+
+    def expect_ok(response):
+        if response.status_code != 200:
+            raise RuntimeError(f'接口返回 {response.status_code}: {response.get_data(as_text=True)[:200]}')
+
+    cases = []
+    for count in sizes:
+        variants = [('binary', False, True, False), ('binary_nocolor', False, False, False),
+                    ('binary_faces', False, True, True)]
+        if count <= max_ascii_points:
+            variants.append(('ascii', True, True, False))
+
+        for label, text, colors, faces in variants:
+            name = f'{label}_{count}.ply'
+            path = os.path.join(upload_dir, name)
+            print(f'生成 {name} ...', flush=True)
+            generate_ply(path, count, text=text, colors=colors, faces=faces)
+
+            cases.append((f'PlyData.read[{label}]', count, lambda p=path: PlyData.read(p)))
+            cases.append((f'read_vertex[{label}]', count, cold(lambda p=path: np.asarray(read_vertex(p)['x']).sum())))
+            if label != 'binary':
+                continue
+
+            output = os.path.join(workdir, f'out_{count}.ply')
+            branch = 'grid' if count > 1000000 else 'random'
+            for ratio in ratios:
+                cases.append((f'downsample_ply[{branch},{ratio}]', count,
+                              cold(lambda p=path, r=ratio: downsample_ply(p, output, r))))
+            if branch != 'grid':
+                # 小点云也测一次网格分层采样
+                cases.append((f'downsample_ply[grid,{ratios[0]}]', count,
+                              cold(lambda p=path: downsample_ply(p, output, ratios[0], method='grid'))))
+
+            cases.append(('GET /api/pointcloud?format=binary', count,
+                          cold(lambda n=name: expect_ok(client.get(f'/api/pointcloud/{n}?format=binary')))))
+            if count <= max_json_points:
+                cases.append(('GET /api/pointcloud (json)', count,
+                              cold(lambda n=name: expect_ok(client.get(f'/api/pointcloud/{n}')))))
+
+            def upload(p=path, n=name):
+                with open(p, 'rb') as f:
+                    expect_ok(client.post('/api/upload', data={'file': (f, f'bench_{n}')}))
+            cases.append(('POST /api/upload', count, cold(upload)))
+
+            def downsample(p=path, n=name):
+                with open(p, 'rb') as f:
+                    expect_ok(client.post('/api/downsample', data={'file': (f, n), 'keep_ratio': str(ratios[0])}))
+            cases.append(('POST /api/downsample', count, cold(downsample)))
+    return cases
+
+
+def run(args):
+    logging.disable(logging.INFO)  # 后端INFO日志会淹没输出
+    sizes = [parse_size(s) for s in args.sizes.split(',') if s.strip()]
+    ratios = tuple(float(r) for r in args.ratios.split(','))
+
+    workdir = tempfile.mkdtemp(prefix='ply_bench_')
+    results = {}
+    try:
+        cases = build_cases(workdir, sizes, ratios, args.max_json_points, args.max_ascii_points)
+        print(f"\n{'case':<40} {'points':>10} {'seconds':>10} {'Mpts/s':>10} {'peak MB':>10}")
+        for name, count, func in cases:
+            seconds, peak = measure(func, args.repeat)
+            key = f'{name}@{count}'
+            results[key] = {'seconds': seconds, 'points_per_second': count / seconds if seconds else None,
+                            'peak_bytes': peak}
+            print(f'{name:<40} {count:>10} {seconds:>10.4f} {count / seconds / 1e6:>10.2f} {peak / 2 ** 20:>10.1f}',
+                  flush=True)
+    finally:
+        if args.keep_files:
+            print(f'\n测试文件保留在 {workdir}')
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f'\n基线已保存到 {args.save_baseline}')
+
+    if args.baseline:
+        return compare(results, args.baseline, args.threshold, args.min_seconds)
+    return 0
+
+
+def compare(results, baseline_path, threshold, min_seconds=0.01):
+    """
+    与基线比较，耗时或峰值内存增加超过 threshold 比例时视为回归，返回退出码
+
+    两次耗时都小于 min_seconds 的项只比较内存，避免计时噪声造成误报
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    regressions = []
+    print(f"\n{'case':<52} {'time':>10} {'memory':>10}")
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        time_change = current['seconds'] / previous['seconds'] - 1 if previous['seconds'] else 0.0
+        if max(current['seconds'], previous['seconds']) < min_seconds:
+            time_change = 0.0
+        memory_change = current['peak_bytes'] / previous['peak_bytes'] - 1 if previous['peak_bytes'] else 0.0
+        flag = ''
+        if time_change > threshold or memory_change > threshold:
+            regressions.append(key)
+            flag = '  REGRESSION'
+        print(f'{key:<52} {time_change:>+10.1%} {memory_change:>+10.1%}{flag}')
+
+    if regressions:
+        print(f'\n{len(regressions)} 项超过阈值 {threshold:.0%}')
+        return 1
+    print('\n没有发现回归')
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='PLY读取、降采样和API接口的基准测试')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='逗号分隔的点数，例如 10K,100K,1M,10M')
+    parser.add_argument('--ratios', default=','.join(str(r) for r in DEFAULT_RATIOS), help='降采样保留率')
+    parser.add_argument('--repeat', type=int, default=1, help='每项重复次数，取最短耗时')
+    parser.add_argument('--max-json-points', type=int, default=1000000, help='超过该点数时跳过JSON接口')
+    parser.add_argument('--max-ascii-points', type=int, default=1000000, help='超过该点数时不生成ascii文件')
+    parser.add_argument('--output', help='把结果写入JSON文件')
+    parser.add_argument('--save-baseline', help='把结果保存为基线')
+    parser.add_argument('--baseline', help='与基线文件比较')
+    parser.add_argument('--threshold', type=float, default=0.2, help='回归阈值 (比例)')
+    parser.add_argument('--min-seconds', type=float, default=0.01, help='耗时低于该值的项不比较时间')
+    parser.add_argument('--keep-files', action='store_true', help='保留生成的测试文件')
+    return run(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
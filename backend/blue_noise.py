@@ -0,0 +1,353 @@
+import numpy as np
+
+NEIGHBOR_OFFSETS = [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)]
+CHECK_BLOCK = 1 << 15  # 邻域检查每次处理的点数，限制临时数组的大小
+SEARCH_MIN_POINTS = 200000  # 搜索半径时使用的随机子集的最少点数
+SEARCH_STEPS = 8  # 半径搜索的最多迭代次数
+SEARCH_TOLERANCE = 0.03  # 搜索目标比所需点数多3%，多余的点由消除步骤删除
+MAX_LEVELS = 60
+MAX_CELLS_PER_AXIS = 1 << 20  # 每个轴的网格数上限，保证网格编号不溢出
+FPS_LEVELS = 4  # 近似最远点采样的半径层数，相邻两层半径相差一倍
+
+
+class SparseGrid:
+    """
+    边长为 cell_size 的稀疏网格，只记录非空网格
+
+    网格编号按坐标排序，查找相邻网格只需对编号做 searchsorted，不需要分配整个包围盒的稠密数组。
+    """
+
+    def __init__(self, coords, cell_size):
+        lo = coords.min(axis=0)
+        extent = float((coords.max(axis=0) - lo).max())
+        self.cell_size = max(cell_size, extent / MAX_CELLS_PER_AXIS, np.finfo(np.float64).tiny)
+        # 坐标整体加1，为相邻网格留出边界，避免编号越界后与其他网格混叠
+        cell = np.floor((coords - lo) / self.cell_size).astype(np.int64) + 1
+        dims = cell.max(axis=0) + 2
+        self.strides = np.array([dims[1] * dims[2], dims[2], 1], dtype=np.int64)
+        self.keys, self.point_cell = np.unique(cell @ self.strides, return_inverse=True)
+        self.point_cell = self.point_cell.reshape(-1)
+        cx = self.keys // self.strides[0]
+        cy = (self.keys // self.strides[1]) % dims[1]
+        cz = self.keys % dims[2]
+        # 奇偶类相同的两个网格至少相隔一个网格
+        self.parity = ((cx & 1) << 2) | ((cy & 1) << 1) | (cz & 1)
+
+    def neighbors(self, cells):
+        """返回 (len(cells), 27) 的相邻非空网格编号 (含自身)，不存在时为-1"""
+        result = np.full((len(cells), len(NEIGHBOR_OFFSETS)), -1, dtype=np.int64)
+        keys = self.keys[cells]
+        for j, offset in enumerate(NEIGHBOR_OFFSETS):
+            target = keys + int(np.dot(offset, self.strides))
+            pos = np.minimum(np.searchsorted(self.keys, target), len(self.keys) - 1)
+            hit = self.keys[pos] == target
+            result[hit, j] = pos[hit]
+        return result
+
+
+class CellSlots:
+    """每个网格中已选点的槽位表，slots[k][cell] 为该网格中第k个已选点，没有时为-1"""
+
+    def __init__(self, n_cells):
+        self.count = np.zeros(n_cells, dtype=np.int64)
+        self.slots = []
+
+    def add(self, points, cells):
+        order = np.argsort(cells, kind='stable')
+        points, cells = points[order], cells[order]
+        rank = np.arange(len(cells)) - np.searchsorted(cells, cells)
+        slot = self.count[cells] + rank
+        for k in range(int(slot.max()) + 1 if len(slot) else 0):
+            if k == len(self.slots):
+                self.slots.append(np.full(len(self.count), -1, dtype=np.int32))
+            mask = slot == k
+            self.slots[k][cells[mask]] = points[mask]
+        self.count += np.bincount(cells, minlength=len(self.count))
+
+
+def nearest_selected(grid, slots, coords, points, exclude_self=False):
+    """
+    返回每个点到相邻27个网格中已选点的最小平方距离和对应的点
+
+    相邻网格中没有已选点时距离为inf、最近点为-1。网格边长不小于查询半径时结果在该半径内是精确的。
+    """
+    d2 = np.full(len(points), np.inf)
+    nearest = np.full(len(points), -1, dtype=np.int64)
+    if not slots.slots:
+        return d2, nearest
+    for start in range(0, len(points), CHECK_BLOCK):
+        block = points[start:start + CHECK_BLOCK]
+        cells, inverse = np.unique(grid.point_cell[block], return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+        # 先按网格收集相邻的已选点，同一网格中的候选点共用一份列表
+        around = grid.neighbors(cells)
+        found = np.stack([np.where(around >= 0, slot[around], -1) for slot in slots.slots], axis=2)
+        found = found.reshape(len(cells), -1)
+        valid = found >= 0
+        per_cell = valid.sum(axis=1)
+        others_by_cell = found[valid]
+        cell_start = np.concatenate([[0], np.cumsum(per_cell)])
+
+        # 展开为 (候选点, 已选点) 对，逐对计算距离
+        counts = per_cell[inverse]
+        total = int(counts.sum())
+        if total == 0:
+            continue
+        owner = np.repeat(np.arange(len(block)), counts)
+        pair_start = np.cumsum(counts) - counts
+        offsets = np.repeat(cell_start[inverse] - pair_start, counts) + np.arange(total)
+        others = others_by_cell[offsets].astype(np.int64)
+        dist = ((coords[block[owner]] - coords[others]) ** 2).sum(axis=1)
+        if exclude_self:
+            dist[others == block[owner]] = np.inf
+
+        # 每个候选点的最小距离及对应的已选点
+        has = np.nonzero(counts)[0]
+        block_min = np.minimum.reduceat(dist, pair_start[has])
+        d2[start + has] = block_min
+        hit = np.nonzero((dist == block_min[np.searchsorted(has, owner)]) & np.isfinite(dist))[0]
+        first = np.unique(owner[hit], return_index=True)[1]
+        nearest[start + owner[hit[first]]] = others[hit[first]]
+    return d2, nearest
+
+
+def maximal_poisson_pass(coords, radius, priority, seeds=None, farthest=False, progress=None):
+    """
+    在半径 radius 下做一次最大泊松圆盘采样 (网格加速的并行掷镖)
+
+    网格边长不小于 radius，奇偶类相同的网格之间的距离不小于 radius，因此同一奇偶类的网格
+    可以同时各接受一个点；每个候选点只需与相邻27个网格中的已选点比较。
+
+    参数:
+        coords (ndarray): (N, 3) 坐标
+        radius (float): 已选点之间的最小距离
+        priority (ndarray): 候选顺序，值大的先尝试
+        seeds (ndarray): 已选中的点，彼此间距不小于 radius，新点与它们的距离也必须不小于 radius
+        farthest (bool): True 时每个网格内按到已选点的距离从远到近尝试
+        progress (callable): 每接受一批点后以本次已接受的点数调用，可以抛出异常来中止
+
+    返回:
+        (ndarray, ndarray): 新接受的点 (按接受顺序) 和接受时到已选点的最小平方距离
+    """
+    grid = SparseGrid(coords, radius)
+    r2 = radius ** 2
+    slots = CellSlots(len(grid.keys))
+    taken = np.zeros(len(coords), dtype=bool)
+    if seeds is not None and len(seeds):
+        slots.add(seeds, grid.point_cell[seeds])
+        taken[seeds] = True
+
+    accepted, spacing = [], []
+    accepted_count = 0
+    point_parity = grid.parity[grid.point_cell]
+    for phase in range(8):
+        candidates = np.nonzero((point_parity == phase) & ~taken)[0]
+        if len(candidates) == 0:
+            continue
+        # 按网格排序，使同一网格的候选点落在同一块中，只查找一次相邻网格
+        candidates = candidates[np.argsort(grid.point_cell[candidates], kind='stable')]
+        d2, _ = nearest_selected(grid, slots, coords, candidates)
+        alive = d2 >= r2
+        candidates, d2 = candidates[alive], d2[alive]
+        cells = grid.point_cell[candidates]
+
+        while len(candidates):
+            if farthest:
+                order = np.lexsort((-priority[candidates], -d2, cells))
+            else:
+                order = np.lexsort((-priority[candidates], cells))
+            candidates, d2, cells = candidates[order], d2[order], cells[order]
+            first = np.ones(len(cells), dtype=bool)
+            first[1:] = cells[1:] != cells[:-1]
+            winners, winner_cells = candidates[first], cells[first]
+            slots.add(winners, winner_cells)
+            accepted.append(winners)
+            spacing.append(d2[first])
+            accepted_count += len(winners)
+            if progress is not None:
+                progress(accepted_count)
+
+            # 同一网格中剩余的候选点只可能与本轮新接受的点冲突
+            rest = ~first
+            candidates, cells = candidates[rest], cells[rest]
+            owner = winners[np.searchsorted(winner_cells, cells)]
+            dist = ((coords[candidates] - coords[owner]) ** 2).sum(axis=1)
+            d2 = np.minimum(d2[rest], dist)
+            keep = dist >= r2
+            candidates, cells, d2 = candidates[keep], cells[keep], d2[keep]
+
+    if not accepted:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    return np.concatenate(accepted).astype(np.int64), np.concatenate(spacing)
+
+
+def _stack(x, y, z):
+    return np.column_stack([np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64),
+                            np.asarray(z, dtype=np.float64)])
+
+
+def _initial_radius(coords, sample_count):
+    extent = coords.max(axis=0) - coords.min(axis=0)
+    active = extent[extent > 0]
+    if len(active) == 0:
+        return 1.0
+    return float((np.prod(active) / sample_count) ** (1 / len(active)))
+
+
+def search_radius(coords, sample_count, priority, rng, progress=None):
+    """
+    估计使最大泊松圆盘采样点数略多于 sample_count 的半径
+
+    点数与半径近似满足幂律 count ∝ radius^-d (d为点云的局部维数，曲面约为2)。
+    在随机子集 (至少为目标点数的4倍) 上计数，在对数坐标下做割线迭代，通常3到4次即可收敛。
+    progress 原样传给每次计数的 maximal_poisson_pass。
+    """
+    n = len(coords)
+    m = min(n, max(SEARCH_MIN_POINTS, 4 * sample_count))
+    subset = np.sort(rng.choice(n, m, replace=False)) if m < n else np.arange(n)
+    sub_coords, sub_priority = coords[subset], priority[subset]
+    target = min(sample_count * (1 + SEARCH_TOLERANCE), m)
+
+    def count(radius):
+        return len(maximal_poisson_pass(sub_coords, radius, sub_priority, progress=progress)[0])
+
+    radius = _initial_radius(coords, sample_count)
+    found = count(radius)
+    best = radius if found >= sample_count else None
+    dimension = 2.0
+    for _ in range(SEARCH_STEPS):
+        next_radius = radius * (found / target) ** (1 / dimension)
+        next_found = count(next_radius)
+        if next_found >= sample_count and (best is None or next_radius > best):
+            best = next_radius
+        if abs(next_found / target - 1) <= SEARCH_TOLERANCE:
+            break
+        # 用最近两次的结果更新维数估计
+        if next_found != found and next_radius != radius:
+            dimension = float(np.clip(np.log(found / next_found) / np.log(next_radius / radius), 0.5, 3.0))
+        radius, found = next_radius, next_found
+    return best if best is not None else next_radius
+
+
+def _fill(selected, n, sample_count, rng):
+    # 重复点过多时可能无法选够，用随机点补齐
+    if len(selected) >= sample_count:
+        return selected
+    rest = np.setdiff1d(np.arange(n), selected)
+    extra = rng.choice(rest, sample_count - len(selected), replace=False)
+    return np.concatenate([selected, extra])
+
+
+def eliminate_crowded(coords, samples, sample_count, radius, priority, progress=None):
+    """
+    反复删除离最近邻最近的点，直到剩下 sample_count 个
+
+    互为最近邻的一对点只删除优先级较低的一个，避免成对删除留下空洞。
+    progress(removed, surplus) 每轮删除后调用一次。
+    """
+    samples = np.asarray(samples, dtype=np.int64)
+    initial_surplus = len(samples) - sample_count
+    while len(samples) > sample_count:
+        surplus = len(samples) - sample_count
+        local = coords[samples]
+        grid = SparseGrid(local, 2 * radius)
+        slots = CellSlots(len(grid.keys))
+        everyone = np.arange(len(samples))
+        slots.add(everyone, grid.point_cell)
+        d2, nearest = nearest_selected(grid, slots, local, everyone, exclude_self=True)
+
+        local_priority = priority[samples]
+        candidates = np.lexsort((local_priority, d2))[:surplus]
+        marked = np.zeros(len(samples), dtype=bool)
+        marked[candidates] = True
+        partner = nearest[candidates]
+        spared = (partner >= 0) & marked[partner] & (local_priority[partner] < local_priority[candidates])
+        samples = np.delete(samples, candidates[~spared])
+        if progress is not None:
+            progress(initial_surplus - (len(samples) - sample_count), initial_surplus)
+    return samples
+
+
+def _report(progress, processed, total):
+    if progress is not None:
+        progress(processed, total)
+
+
+def poisson_disk_indices(x, y, z, sample_count, rng, progress=None):
+    """
+    泊松圆盘消除采样，选出的点两两之间保持近似相同的最小间距 (蓝噪声分布)
+
+    先搜索半径使该半径下的最大泊松圆盘采样略多于目标点数，在全部点上采样后，
+    反复删除最拥挤的点直到恰好剩下 sample_count 个。
+    progress(processed, total) 的 total 为 sample_count，前一半对应全部点上的采样，后一半对应删除多余的点；
+    回调可以抛出异常来中止采样。
+
+    返回:
+        ndarray: 排序后的点索引
+    """
+    coords = _stack(x, y, z)
+    n = len(coords)
+    if sample_count >= n:
+        return np.arange(n)
+    priority = rng.random(n)
+    half = sample_count // 2
+    radius = search_radius(coords, sample_count, priority, rng,
+                           progress=lambda accepted: _report(progress, 0, sample_count))
+
+    def sampling(accepted):
+        _report(progress, min(accepted, sample_count) * half // sample_count, sample_count)
+
+    def eliminating(removed, surplus):
+        _report(progress, half + (sample_count - half) * removed // surplus, sample_count)
+
+    samples, _ = maximal_poisson_pass(coords, radius, priority, progress=sampling)
+    for _ in range(4):
+        # 子集上的计数只是估计，全部点上不够时略微缩小半径
+        if len(samples) >= sample_count:
+            break
+        radius /= 2 ** 0.25
+        samples, _ = maximal_poisson_pass(coords, radius, priority, progress=sampling)
+
+    samples = _fill(samples, n, sample_count, rng)
+    return np.sort(eliminate_crowded(coords, samples, sample_count, radius, priority, progress=eliminating))
+
+
+def farthest_point_indices(x, y, z, sample_count, rng, progress=None):
+    """
+    近似最远点采样
+
+    从粗到细逐层做最大泊松圆盘采样，每层半径减半，新点与之前所有层的点保持该层半径的距离；
+    每个网格内按到已选点的距离从远到近尝试，近似于每次选取离已选点最远的点。
+    最后一层按接受时到已选点的距离从远到近截取，使结果恰好为 sample_count 个点。
+    progress(processed, total) 以已选点数 / sample_count 报告进度，回调可以抛出异常来中止采样。
+
+    返回:
+        ndarray: 排序后的点索引
+    """
+    coords = _stack(x, y, z)
+    n = len(coords)
+    if sample_count >= n:
+        return np.arange(n)
+    priority = rng.random(n)
+    radius = search_radius(coords, sample_count, priority, rng,
+                           progress=lambda accepted: _report(progress, 0, sample_count))
+    radius *= 2 ** (FPS_LEVELS - 1)
+
+    def sampling(accepted):
+        _report(progress, min(len(selected) + accepted, sample_count), sample_count)
+
+    selected = np.zeros(0, dtype=np.int64)
+    new, spacing = selected, np.zeros(0)
+    for _ in range(MAX_LEVELS):
+        new, spacing = maximal_poisson_pass(coords, radius, priority, selected, farthest=True, progress=sampling)
+        if len(selected) + len(new) >= sample_count:
+            break
+        selected = np.concatenate([selected, new])
+        new, spacing = new[:0], spacing[:0]
+        radius /= 2
+
+    need = sample_count - len(selected)
+    keep = np.argsort(-spacing, kind='stable')[:need]
+    selected = np.concatenate([selected, new[keep]])
+    return np.sort(_fill(selected, n, sample_count, rng))
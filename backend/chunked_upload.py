@@ -0,0 +1,347 @@
+import os
+import io
+import json
+import time
+import uuid
+import hashlib
+import threading
+import logging
+from ply_io import parse_header, MAX_HEADER_BYTES
+from file_lock import FileLock, forget
+
+logger = logging.getLogger(__name__)
+
+SESSION_DIR = '.sessions'  # 上传会话保存在 uploads/.sessions/
+HASH_INDEX_FILE = '.hash_index.json'  # 内容哈希到已保存文件的索引，用于去重
+SESSION_TTL = 24 * 3600  # 超过该秒数未更新的会话被清理
+COPY_BUFFER = 1024 * 1024
+
+# 哈希对象无法序列化，只保存在内存中。多个worker进程时同一会话的分块可能由不同进程接收，
+# 哈希状态缺失或落后于 .part 文件时从磁盘补算 (.part 文件只追加)
+_hashers = {}
+_global_lock = threading.Lock()
+
+
+class OffsetMismatch(Exception):
+    """分块的起始偏移与服务器已接收的字节数不一致"""
+
+    def __init__(self, expected):
+        super().__init__(f'偏移不匹配，服务器已接收 {expected} 字节')
+        self.expected = expected
+
+
+def validate_header(header, max_points=None, declared_size=None):
+    """
+    检查PLY头部是否可以作为点云上传，不满足时抛出ValueError
+
+    返回:
+        dict: 头部摘要 (format, vertex_count, has_colors)
+    """
+    vertex = header.element('vertex')
+    if vertex is None:
+        raise ValueError('PLY文件中没有 vertex 元素')
+    names = [prop.name for prop in vertex.properties]
+    if not all(axis in names for axis in ('x', 'y', 'z')):
+        raise ValueError('vertex 元素缺少 x, y, z 属性')
+    if max_points is not None and vertex.count > max_points:
+        raise ValueError(f'{vertex.count} points, exceeded {max_points} points limit. Please use the '
+                         f'"point cloud down-sampling tool" at the top of the page to reduce the point cloud density first.')
+
+    # 二进制文件可以由头部算出顶点数据的结束位置，声明的文件大小不足时直接拒绝
+    if declared_size is not None and header.is_binary:
+        offset = header.data_offset('vertex')
+        dtype = vertex.dtype(header.byte_order)
+        if offset is not None and dtype is not None and declared_size < offset + dtype.itemsize * vertex.count:
+            raise ValueError('文件大小与PLY头部声明的点数不符')
+
+    return {
+        'format': header.format,
+        'vertex_count': vertex.count,
+        'has_colors': all(c in names for c in ('red', 'green', 'blue'))
+    }
+
+
+class UploadSessions:
+    """
+    分块断点续传上传
+
+    会话元数据和已接收的数据保存在 <directory>/.sessions/ 下，服务重启后仍可继续上传。
+    已接收的字节数以 .part 文件的大小为准，客户端断线后查询状态，从返回的偏移继续发送。
+    写入和完成上传由会话目录中的文件锁互斥，多个worker进程共用同一目录时不需要粘性路由。
+    """
+
+    def __init__(self, directory, max_points=None):
+        self.directory = directory
+        self.max_points = max_points
+        self.session_dir = os.path.join(directory, SESSION_DIR)
+
+    def _meta_path(self, upload_id):
+        return os.path.join(self.session_dir, f'{upload_id}.json')
+
+    def _part_path(self, upload_id):
+        return os.path.join(self.session_dir, f'{upload_id}.part')
+
+    def _lock(self, upload_id):
+        # 分块可能被路由到gunicorn的任意worker，偏移检查和写入必须在所有进程间互斥
+        return FileLock(os.path.join(self.session_dir, f'{upload_id}.lock'))
+
+    def _load(self, upload_id):
+        # 会话ID只允许十六进制字符，避免路径穿越
+        if not upload_id or not all(c in '0123456789abcdef' for c in upload_id):
+            return None
+        try:
+            with open(self._meta_path(upload_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, session):
+        session['updated_at'] = time.time()
+        path = self._meta_path(session['id'])
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+            json.dump(session, f)
+        os.replace(f'{path}.tmp', path)
+
+    def _remove(self, upload_id):
+        lock_path = os.path.join(self.session_dir, f'{upload_id}.lock')
+        for path in (self._meta_path(upload_id), self._part_path(upload_id), lock_path):
+            try:
+                if os.path.exists(path):
+                    os.unlink(path)
+            except OSError as e:
+                logger.warning(f"清理上传会话文件时出错: {str(e)}")
+        _hashers.pop(upload_id, None)
+        forget(lock_path)
+
+    def _hasher(self, upload_id, part_path, received):
+        """
+        返回已接收的 received 字节的哈希对象
+
+        本进程没有该会话的哈希状态 (服务重启或前面的分块由其他worker接收) 时，从磁盘补算缺少的部分。
+        """
+        hasher, hashed = _hashers.pop(upload_id, (None, 0))
+        if hasher is None or hashed > received:
+            hasher, hashed = hashlib.sha256(), 0
+        if hashed < received:
+            with open(part_path, 'rb') as f:
+                f.seek(hashed)
+                remaining = received - hashed
+                while remaining > 0:
+                    block = f.read(min(COPY_BUFFER, remaining))
+                    if not block:
+                        raise ValueError('上传的数据不完整')
+                    hasher.update(block)
+                    remaining -= len(block)
+        return hasher
+
+    def _prune(self):
+        # 删除长时间未更新的会话
+        now = time.time()
+        for name in os.listdir(self.session_dir):
+            if not name.endswith('.json'):
+                continue
+            session = self._load(name[:-5])
+            if session is not None and now - session['updated_at'] > SESSION_TTL:
+                logger.info(f"清理过期的上传会话: {session['id']}")
+                self._remove(session['id'])
+
+    def create(self, filename, size=None):
+        """
+        创建上传会话
+
+        参数:
+            filename (str): 最终保存的文件名
+            size (int): 文件总字节数，可选；提供时用于校验头部和完成上传
+
+        返回:
+            dict: 会话状态
+        """
+        os.makedirs(self.session_dir, exist_ok=True)
+        self._prune()
+        upload_id = uuid.uuid4().hex
+        session = {
+            'id': upload_id,
+            'filename': filename,
+            'size': size,
+            'created_at': time.time(),
+            'header': None
+        }
+        open(self._part_path(upload_id), 'wb').close()
+        _hashers[upload_id] = (hashlib.sha256(), 0)
+        self._save(session)
+        logger.info(f"创建上传会话 {upload_id}: {filename}，大小 {size}")
+        return self.status(upload_id)
+
+    def status(self, upload_id):
+        """返回会话状态，会话不存在时返回None"""
+        session = self._load(upload_id)
+        if session is None:
+            return None
+        return {
+            'upload_id': upload_id,
+            'filename': session['filename'],
+            'size': session['size'],
+            'offset': os.path.getsize(self._part_path(upload_id)),
+            'header': session['header']
+        }
+
+    def append(self, upload_id, offset, stream):
+        """
+        追加一个分块
+
+        参数:
+            upload_id (str): 会话ID
+            offset (int): 分块在文件中的起始偏移，必须等于已接收的字节数
+            stream: 分块数据的可读二进制流
+
+        返回:
+            dict: 更新后的会话状态，会话不存在时返回None
+        """
+        if self._load(upload_id) is None:
+            return None
+        lock = self._lock(upload_id)
+        if not lock.acquire(blocking=False):
+            # 同一会话的分块正在写入
+            current = self.status(upload_id)
+            if current is None:
+                return None
+            raise OffsetMismatch(current['offset'])
+        try:
+            session = self._load(upload_id)
+            if session is None:
+                return None
+            part_path = self._part_path(upload_id)
+            received = os.path.getsize(part_path)
+            if offset != received:
+                raise OffsetMismatch(received)
+
+            # 写入中途失败时哈希状态不再可信，成功后才放回
+            hasher = self._hasher(upload_id, part_path, received)
+            with open(part_path, 'ab') as f:
+                while True:
+                    block = stream.read(COPY_BUFFER)
+                    if not block:
+                        break
+                    if session['size'] is not None and received + len(block) > session['size']:
+                        f.truncate(offset)
+                        raise ValueError('上传的数据超过了声明的文件大小')
+                    f.write(block)
+                    received += len(block)
+                    hasher.update(block)
+            _hashers[upload_id] = (hasher, received)
+
+            if session['header'] is None:
+                try:
+                    session['header'] = self._check_header(part_path, received, session['size'])
+                except ValueError:
+                    self._remove(upload_id)
+                    raise
+            self._save(session)
+        finally:
+            lock.release()
+        return self.status(upload_id)
+
+    def _check_header(self, part_path, received, declared_size):
+        """头部完整时解析并校验，尚未接收完整时返回None"""
+        with open(part_path, 'rb') as f:
+            head = f.read(min(received, MAX_HEADER_BYTES))
+        if b'end_header' not in head:
+            if received >= MAX_HEADER_BYTES or (declared_size is not None and received >= declared_size):
+                raise ValueError('PLY头部不完整: 缺少 end_header')
+            return None
+        header = parse_header(io.BytesIO(head))
+        summary = validate_header(header, self.max_points, declared_size)
+        logger.info(f"上传的PLY头部有效: {summary}")
+        return summary
+
+    def finalize(self, upload_id):
+        """
+        完成上传: 计算内容哈希，内容与已保存的文件相同时直接复用，否则移动到上传目录
+
+        返回:
+            dict: filepath, filename, sha256, deduplicated；会话不存在时返回None
+        """
+        if self._load(upload_id) is None:
+            return None
+        with self._lock(upload_id):
+            session = self._load(upload_id)
+            if session is None:
+                return None
+            part_path = self._part_path(upload_id)
+            received = os.path.getsize(part_path)
+            if session['size'] is not None and received != session['size']:
+                raise OffsetMismatch(received)
+            if session['header'] is None:
+                raise ValueError('PLY头部不完整: 缺少 end_header')
+
+            digest = self._hasher(upload_id, part_path, received).hexdigest()
+
+            existing = lookup_hash(self.directory, digest)
+            if existing is not None:
+                logger.info(f"上传内容与已有文件 {existing} 相同，跳过保存")
+                self._remove(upload_id)
+                return {'filepath': os.path.join(self.directory, existing), 'filename': existing,
+                        'sha256': digest, 'deduplicated': True}
+
+            filepath = os.path.join(self.directory, session['filename'])
+            os.replace(part_path, filepath)
+            try:
+                record_hash(self.directory, digest, session['filename'])
+            except OSError as e:
+                # 文件已保存，哈希索引只用于去重，记录失败不影响本次上传
+                logger.warning(f"记录内容哈希失败: {str(e)}")
+            self._remove(upload_id)
+            logger.info(f"上传会话 {upload_id} 完成，文件已保存到 {filepath}")
+            return {'filepath': filepath, 'filename': session['filename'], 'sha256': digest, 'deduplicated': False}
+
+    def abort(self, upload_id):
+        """取消上传并删除已接收的数据"""
+        if self._load(upload_id) is None:
+            return False
+        with self._lock(upload_id):
+            self._remove(upload_id)
+        logger.info(f"已取消上传会话 {upload_id}")
+        return True
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def _load_index(directory):
+    try:
+        with open(os.path.join(directory, HASH_INDEX_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def lookup_hash(directory, digest):
+    """返回内容哈希对应的已保存文件名，文件已删除或被覆盖时返回None"""
+    with _global_lock:
+        entry = _load_index(directory).get(digest)
+    if entry is None:
+        return None
+    path = os.path.join(directory, entry['filename'])
+    if not os.path.exists(path) or _file_signature(path) != entry['source']:
+        return None
+    return entry['filename']
+
+
+def record_hash(directory, digest, filename):
+    """
+    记录文件的内容哈希
+
+    索引的读取-修改-写入由文件锁保护，多个worker同时完成上传时不会丢失记录；临时文件名含进程号和线程号。
+    """
+    path = os.path.join(directory, HASH_INDEX_FILE)
+    with FileLock(f'{path}.lock'):
+        index = _load_index(directory)
+        # 同名文件被新内容覆盖后，旧哈希不再有效
+        index = {key: entry for key, entry in index.items() if entry['filename'] != filename}
+        index[digest] = {'filename': filename, 'source': _file_signature(os.path.join(directory, filename))}
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(temp_path, path)
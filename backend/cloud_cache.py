@@ -0,0 +1,161 @@
+import os
+import threading
+import logging
+from collections import OrderedDict
+import numpy as np
+from plyfile import PlyData
+from ply_io import memmap_element
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # 默认缓存上限为1GB
+DEFAULT_MAX_ENTRIES = 256  # 默认最多缓存的条目数，限制同时打开的内存映射数量
+MAPPED_ENTRY_BYTES = 1024 * 1024  # 内存映射等不占常驻内存的条目按此名义大小计入上限
+
+
+def estimate_nbytes(value):
+    """
+    估算缓存值占用的内存字节数
+
+    内存映射的数组和列式表 (按列惰性映射) 不占常驻内存，按 MAPPED_ENTRY_BYTES 计，
+    保证这类条目也会按LRU顺序被淘汰。
+    """
+    if isinstance(value, np.memmap):
+        return MAPPED_ENTRY_BYTES
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    elements = getattr(value, 'elements', None)
+    if elements is None:
+        return MAPPED_ENTRY_BYTES
+    total = 0
+    for element in elements:
+        data = getattr(element, 'data', None)
+        if isinstance(data, np.memmap):
+            total += MAPPED_ENTRY_BYTES
+        elif data is not None:
+            total += data.nbytes
+    return max(total, MAPPED_ENTRY_BYTES)
+
+
+def load_vertex(path):
+    """
+    读取顶点数据为结构化数组
+
+    二进制文件直接内存映射顶点块，其他情况回退到 PlyData 完整解析
+    """
+    vertex = memmap_element(path, 'vertex')
+    if vertex is None:
+        vertex = PlyData.read(path)['vertex'].data
+    return vertex
+
+
+class CloudCache:
+    """
+    进程级的已解析点云缓存
+
+    以 (路径, 加载方式) 为键并记录修改时间和文件大小，文件被覆盖后旧条目自动失效。
+    按LRU顺序淘汰，总占用不超过 max_bytes，条目数不超过 max_entries。
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, loader=PlyData.read, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.loader = loader
+        self._entries = OrderedDict()  # (path, loader) -> (signature, value, nbytes)
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _signature(path):
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self, path, loader=None):
+        """读取并缓存PLY文件，命中时直接返回已解析的数据"""
+        loader = loader or self.loader
+        path = os.path.abspath(path)
+        key = (path, loader.__name__)
+        signature = self._signature(path)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            if entry is not None:
+                self._remove(key)
+
+        value = loader(path)
+        nbytes = estimate_nbytes(value)
+
+        with self._lock:
+            if nbytes > self.max_bytes:
+                logger.info(f"文件过大，不进入缓存: {path} ({nbytes} 字节)")
+                return value
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (signature, value, nbytes)
+            self.current_bytes += nbytes
+            self._evict()
+        return value
+
+    def invalidate(self, path):
+        """移除指定文件的所有缓存条目"""
+        path = os.path.abspath(path)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == path]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def resize(self, max_bytes):
+        """调整缓存上限，超出部分立即淘汰"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'current_bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+    def _remove(self, key):
+        _, _, nbytes = self._entries.pop(key)
+        self.current_bytes -= nbytes
+
+    def _evict(self):
+        while self._entries and (self.current_bytes > self.max_bytes or len(self._entries) > self.max_entries):
+            key, (_, _, nbytes) = self._entries.popitem(last=False)
+            self.current_bytes -= nbytes
+            self.evictions += 1
+            logger.info(f"缓存淘汰: {key[0]} ({nbytes} 字节)")
+
+
+# 全局共享缓存，上限可通过环境变量 PLY_CACHE_MAX_BYTES 和 PLY_CACHE_MAX_ENTRIES 配置
+cloud_cache = CloudCache(int(os.environ.get('PLY_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)),
+                         max_entries=int(os.environ.get('PLY_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)))
+
+
+def read_ply(path):
+    """通过全局缓存读取PLY文件"""
+    return cloud_cache.get(path)
+
+
+def read_vertex(path):
+    """通过全局缓存读取顶点结构化数组 (二进制文件为内存映射视图)"""
+    return cloud_cache.get(path, load_vertex)
@@ -0,0 +1,213 @@
+import os
+import json
+import shutil
+import threading
+import logging
+import numpy as np
+from cloud_cache import cloud_cache, read_vertex
+from ply_io import read_header, iter_element_chunks, PLY_TYPES
+from file_lock import FileLock, forget
+
+logger = logging.getLogger(__name__)
+
+COLUMNS_SUFFIX = '.columns'  # 列式数据保存在 uploads/<文件名>.columns/ 目录
+MANIFEST_FILE = 'manifest.json'
+COLUMNS_VERSION = 1
+BUILD_CHUNK_POINTS = 1000000
+COLOR_PROPS = ('red', 'green', 'blue')
+
+_build_lock = threading.Lock()
+
+
+def columns_dir(path):
+    return path + COLUMNS_SUFFIX
+
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+class ColumnTable:
+    """
+    列式存储的顶点数据，每个属性是一个单独的 .npy 文件
+
+    按属性名取列时才内存映射对应文件，只用到坐标的请求不会触碰颜色等其他列。
+    提供 len()、dtype.names 和 table[name]，可以替代顶点结构化数组使用。
+    """
+
+    def __init__(self, directory, manifest):
+        self.directory = directory
+        self.manifest = manifest
+        self.dtype = np.dtype([(prop['name'], prop['dtype']) for prop in manifest['properties']])
+        self._files = {prop['name']: prop['file'] for prop in manifest['properties']}
+        self._columns = {}
+
+    def __len__(self):
+        return self.manifest['count']
+
+    def __getitem__(self, name):
+        column = self._columns.get(name)
+        if column is None:
+            if name not in self._files:
+                raise KeyError(name)
+            path = os.path.join(self.directory, self._files[name])
+            column = np.load(path, mmap_mode='r' if len(self) else None)
+            self._columns[name] = column
+        return column
+
+
+def load_manifest(path):
+    """读取列式数据的清单，源文件已变化或尚未转换时返回None"""
+    manifest_path = os.path.join(columns_dir(path), MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"读取列式数据清单失败: {str(e)}")
+        return None
+    if manifest.get('version') != COLUMNS_VERSION or manifest.get('source') != _source_signature(path):
+        return None
+    return manifest
+
+
+def open_columns(path):
+    """打开已转换的列式数据，不存在或已过期时返回None"""
+    manifest = load_manifest(path)
+    if manifest is None:
+        return None
+    return ColumnTable(columns_dir(path), manifest)
+
+
+def build_columns(path, chunk_size=BUILD_CHUNK_POINTS):
+    """
+    将PLY文件的顶点数据转换为列式存储
+
+    逐块读取顶点 (ascii文件逐行解析，二进制文件内存映射)，每个标量属性写入一个 .npy 文件，
+    同时统计包围盒和颜色范围写入 manifest.json。列表属性不转换。
+
+    参数:
+        path (str): PLY文件路径
+        chunk_size (int): 每次读取的点数
+
+    返回:
+        dict: 清单信息
+    """
+    logger.info(f"开始转换列式数据: {path}")
+    header = read_header(path)
+    element = header.element('vertex')
+    if element is None:
+        raise ValueError('PLY文件中没有 vertex 元素')
+    count = element.count
+
+    if element.has_lists:
+        # 含列表属性的顶点无法分块读取，只能完整解析
+        chunks = iter([read_vertex(path)])
+    else:
+        chunks = iter_element_chunks(path, 'vertex', chunk_size, header)
+    properties = [prop for prop in element.properties if not prop.is_list]
+
+    target = columns_dir(path)
+    staging = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if os.path.exists(staging):
+        shutil.rmtree(staging)
+    os.makedirs(staging)
+
+    # 每列按PLY声明的类型以小端序保存
+    entries = [{'name': prop.name, 'ply_type': prop.ply_type, 'file': f'{i}.npy',
+                'dtype': np.dtype('<' + PLY_TYPES[prop.ply_type]).str}
+               for i, prop in enumerate(properties)]
+    outputs = {}
+    for entry in entries:
+        file_path = os.path.join(staging, entry['file'])
+        if count:
+            outputs[entry['name']] = np.lib.format.open_memmap(file_path, mode='w+', dtype=entry['dtype'],
+                                                               shape=(count,))
+        else:
+            np.save(file_path, np.zeros(0, dtype=entry['dtype']))
+
+    lo = np.full(3, np.inf)
+    hi = np.full(3, -np.inf)
+    has_colors = all(c in [entry['name'] for entry in entries] for c in COLOR_PROPS)
+    color_stats = {c: {'min': None, 'max': None, 'sum': 0.0} for c in COLOR_PROPS} if has_colors else None
+
+    start = 0
+    for chunk in chunks:
+        stop = start + len(chunk)
+        if stop > count:
+            raise ValueError('vertex 元素的记录数超过头部声明')
+        for name, output in outputs.items():
+            output[start:stop] = chunk[name]
+        if len(chunk):
+            coords = [np.asarray(chunk[axis]) for axis in ('x', 'y', 'z')]
+            lo = np.minimum(lo, [c.min() for c in coords])
+            hi = np.maximum(hi, [c.max() for c in coords])
+            if has_colors:
+                for c in COLOR_PROPS:
+                    values = np.asarray(chunk[c])
+                    stats = color_stats[c]
+                    low, high = values.min().item(), values.max().item()
+                    stats['min'] = low if stats['min'] is None else min(stats['min'], low)
+                    stats['max'] = high if stats['max'] is None else max(stats['max'], high)
+                    stats['sum'] += float(values.sum(dtype=np.float64))
+        start = stop
+
+    for output in outputs.values():
+        output.flush()
+    outputs.clear()
+
+    if has_colors:
+        for c in COLOR_PROPS:
+            stats = color_stats[c]
+            total = stats.pop('sum')
+            stats['mean'] = total / count if count else None
+
+    manifest = {
+        'version': COLUMNS_VERSION,
+        'source': _source_signature(path),
+        'format': header.format,
+        'count': int(count),
+        'properties': entries,
+        'bounds': [lo.tolist(), hi.tolist()] if count else None,
+        'has_colors': has_colors,
+        'color_stats': color_stats
+    }
+    with open(os.path.join(staging, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+
+    if os.path.exists(target):
+        shutil.rmtree(target)
+    os.replace(staging, target)
+    logger.info(f"列式数据转换完成: {len(entries)} 个属性，保存到 {target}")
+    return manifest
+
+
+def ensure_columns(path):
+    """返回最新的列式数据，不存在或已过期时重新转换"""
+    table = open_columns(path)
+    if table is not None:
+        return table
+    # 多个worker可能同时为同一文件构建，文件锁保证只构建一次，其他进程等待后直接读取结果
+    with _build_lock, FileLock(f'{columns_dir(path)}.lock'):
+        table = open_columns(path)
+        if table is None:
+            build_columns(path)
+            table = open_columns(path)
+    return table
+
+
+def read_columns(path):
+    """通过全局缓存读取列式数据，文件未变化时直接复用已打开的列"""
+    return cloud_cache.get(path, loader=ensure_columns)
+
+
+def remove_columns(path):
+    """删除文件对应的列式数据"""
+    target = columns_dir(path)
+    if os.path.exists(target):
+        shutil.rmtree(target, ignore_errors=True)
+    if os.path.exists(f'{target}.lock'):
+        os.unlink(f'{target}.lock')
+        forget(f'{target}.lock')
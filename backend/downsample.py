@@ -1,13 +1,423 @@
 import os
+import time
 import numpy as np
 from plyfile import PlyData, PlyElement
 import logging
 import tempfile
-import random
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from cloud_cache import read_ply, read_vertex
+from ply_io import read_header, iter_element_chunks, write_header, PLY_TYPES, BYTE_ORDERS
+from columnar import open_columns
+from blue_noise import poisson_disk_indices, farthest_point_indices
+from metrics import stage, timed_iter, record_stage
+from preprocess import outlier_mask, VertexSubset
+from mesh import (FACE_ELEMENT, face_index_property, read_faces, remap_face_data, face_element,
+                  face_records, vertex_map_from_indices, vertex_map_from_clusters)
 
 logger = logging.getLogger(__name__)
 
-def downsample_ply(input_path, output_path=None, keep_ratio=0.5):
+GRID_SIZE = 100  # 分层采样的网格数量 (每个轴)
+LARGE_CLOUD_POINTS = 1000000  # 超过该点数时使用分层采样
+STREAM_CHUNK_POINTS = 1000000  # 流式降采样每次读取的点数
+VOXEL_METHODS = ('voxel_first', 'voxel_centroid', 'voxel_nearest')
+BLUE_NOISE_METHODS = ('poisson', 'fps')
+MESH_METHODS = ('cluster',)
+METHODS = ('auto', 'random', 'grid') + BLUE_NOISE_METHODS + VOXEL_METHODS + MESH_METHODS
+OUTPUT_FORMATS = ('ascii', 'binary_little_endian', 'binary_big_endian')
+CLUSTER_SEARCH_STEPS = 16  # 顶点聚类自动选择体素边长时的最大搜索次数
+CLUSTER_TOLERANCE = 0.02  # 自动选择体素边长时允许的顶点数相对偏差
+
+
+def report_progress(progress_callback, stage, processed, total):
+    """调用进度回调 (stage, processed, total)，回调可以抛出异常来中止降采样"""
+    if progress_callback is not None:
+        progress_callback(stage, processed, total)
+
+
+def grid_cell_ids(x, y, z, grid_size=GRID_SIZE, bounds=None):
+    """
+    将点按包围盒划分到 grid_size^3 的均匀网格中
+
+    参数:
+        bounds: ((x_min, y_min, z_min), (x_max, y_max, z_max))，为None时由输入点计算
+
+    返回:
+        np.ndarray: 每个点所在网格的线性编号 (int64)
+    """
+    cells = np.zeros(len(x), dtype=np.int64)
+    for i, axis in enumerate((x, y, z)):
+        axis = np.asarray(axis, dtype=np.float64)
+        if bounds is None:
+            lo, hi = axis.min(), axis.max()
+        else:
+            lo, hi = bounds[0][i], bounds[1][i]
+        extent = hi - lo
+        if extent > 0:
+            idx = ((axis - lo) * (grid_size / extent)).astype(np.int64)
+            np.minimum(idx, grid_size - 1, out=idx)
+        else:
+            idx = np.zeros(len(axis), dtype=np.int64)
+        cells = cells * grid_size + idx
+    return cells
+
+
+def cell_priorities(cells, keys, keep_ratio):
+    """
+    网格内按随机键排序，每个网格的前 max(1, 点数 * keep_ratio) 个点标记为保留
+
+    结果只取决于每个点所在网格及其随机键，因此可以按网格划分后分别计算。
+
+    返回:
+        (selected, priority): 与输入顺序一致的保留标记和优先级，
+            优先级为 (网格内名次 + 随机键) / 网格点数，越小越先被保留
+    """
+    n = len(cells)
+    order = np.lexsort((keys, cells))
+    sorted_cells = cells[order]
+
+    _, starts, counts = np.unique(sorted_cells, return_index=True, return_counts=True)
+    group_counts = np.repeat(counts, counts)
+    rank = np.arange(n) - np.repeat(starts, counts)
+    quota = np.maximum(1, (counts * keep_ratio).astype(np.int64))
+
+    selected = np.empty(n, dtype=bool)
+    selected[order] = rank < np.repeat(quota, counts)
+    priority = np.empty(n)
+    priority[order] = (rank + keys[order]) / group_counts
+    return selected, priority
+
+
+def select_by_priority(selected, priority, sample_count):
+    """总数与 sample_count 不符时，按优先级删除多余的保留点或补充未保留的点"""
+    chosen = np.flatnonzero(selected)
+    if len(chosen) > sample_count:
+        keep = np.argpartition(priority[chosen], sample_count - 1)[:sample_count]
+        chosen = chosen[keep]
+    elif len(chosen) < sample_count:
+        rest = np.flatnonzero(~selected)
+        extra = sample_count - len(chosen)
+        add = np.argpartition(priority[rest], extra - 1)[:extra]
+        chosen = np.concatenate([chosen, rest[add]])
+    return np.sort(chosen)
+
+
+def stratified_indices(cells, keep_ratio, sample_count, rng):
+    """
+    按网格分层采样，每个非空网格保留约 keep_ratio 比例的点 (至少1个)
+
+    通过一次排序完成分组，网格内的点按随机键排序后取前 quota 个，
+    总数与 sample_count 不符时按 (网格内名次 + 随机键) / 网格点数 的优先级增删。
+
+    返回:
+        np.ndarray: 排序后的保留点索引
+    """
+    keys = rng.random(len(cells))
+    selected, priority = cell_priorities(cells, keys, keep_ratio)
+    return select_by_priority(selected, priority, sample_count)
+
+
+def nested_sample_order(count, rng, cells=None):
+    """
+    返回所有点的保留顺序，取前 sample_count 个即为该点数的采样结果
+
+    cells 为None时为随机顺序；否则按网格分层: 每个非空网格中随机键最小的点排在最前，
+    其余点按 (网格内名次 + 随机键) / 网格点数 排序。点数较少的结果总是包含在点数较多的结果中，
+    因此多个保留率只需分组和排序一次。
+
+    返回:
+        np.ndarray: 点索引的排列
+    """
+    if cells is None:
+        return rng.permutation(count)
+    keys = rng.random(count)
+    order = np.lexsort((keys, cells))
+    _, starts, counts = np.unique(cells[order], return_index=True, return_counts=True)
+    rank = np.arange(count) - np.repeat(starts, counts)
+    priority = (rank + keys[order]) / np.repeat(counts, counts)
+    return order[np.lexsort((priority, rank > 0))]
+
+
+def _attach_shared(name, shape, dtype):
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _partition_priorities(shared, n, cell_range, keep_ratio):
+    """工作进程：计算网格编号在 cell_range 内的点的保留标记和优先级，结果直接写入共享内存"""
+    handles = []
+    try:
+        arrays = {}
+        for key, (name, dtype) in shared.items():
+            shm, arrays[key] = _attach_shared(name, (n,), dtype)
+            handles.append(shm)
+        cells = arrays['cells']
+        idx = np.flatnonzero((cells >= cell_range[0]) & (cells < cell_range[1]))
+        selected, priority = cell_priorities(cells[idx], arrays['keys'][idx], keep_ratio)
+        arrays['selected'][idx] = selected
+        arrays['priority'][idx] = priority
+        del arrays, cells
+        return len(idx)
+    finally:
+        for shm in handles:
+            shm.close()
+
+
+def parallel_stratified_indices(cells, keep_ratio, sample_count, rng, workers):
+    """
+    多进程版本的 stratified_indices
+
+    按网格编号区间把点云划分为 workers 个点数大致相同的分区，每个分区在进程池中独立计算，
+    输入和输出数组通过共享内存传递。随机键在主进程按相同顺序生成，
+    因此相同种子下结果与 stratified_indices 完全一致。
+    """
+    n = len(cells)
+    keys = rng.random(n)
+
+    # 按累计点数的分位数确定分区边界，同一网格的点总在同一分区
+    cumulative = np.cumsum(np.bincount(cells))
+    cuts = np.searchsorted(cumulative, np.linspace(0, n, workers + 1)[1:-1], side='right')
+    bounds = np.unique(np.concatenate([[0], cuts, [len(cumulative)]]))
+    ranges = [(int(lo), int(hi)) for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+    buffers = {}
+    try:
+        shared = {}
+        views = {}
+        for key, source in (('cells', cells), ('keys', keys),
+                            ('selected', np.zeros(n, dtype=bool)), ('priority', np.zeros(n))):
+            shm = shared_memory.SharedMemory(create=True, size=max(1, source.nbytes))
+            buffers[key] = shm
+            views[key] = np.ndarray(source.shape, dtype=source.dtype, buffer=shm.buf)
+            views[key][:] = source
+            shared[key] = (shm.name, source.dtype.str)
+
+        logger.info(f"并行分层采样: {len(ranges)} 个分区, {workers} 个进程")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(_partition_priorities, [shared] * len(ranges), [n] * len(ranges),
+                              ranges, [keep_ratio] * len(ranges)))
+
+        selected = views['selected'].copy()
+        priority = views['priority'].copy()
+        views.clear()
+    finally:
+        for shm in buffers.values():
+            shm.close()
+            shm.unlink()
+
+    return select_by_priority(selected, priority, sample_count)
+
+
+def apportion_quotas(counts, keep_ratio, sample_count):
+    """
+    为每个非空网格分配保留点数
+
+    按最大余数法分配，使总数等于 sample_count；保留率过低时点数最少的网格可能被分到0个，
+    其余网格至少保留1个点
+    """
+    exact = counts * keep_ratio
+    base = np.floor(exact)
+    remainder = exact - base
+    quota = np.minimum(np.maximum(1, base.astype(np.int64)), counts)
+
+    diff = sample_count - int(quota.sum())
+    if diff > 0:
+        candidates = np.flatnonzero(quota < counts)
+        order = candidates[np.argsort(-remainder[candidates], kind='stable')]
+        quota[order[:diff]] += 1
+    elif diff < 0:
+        # 超出部分来自被提升到1个点的网格，从期望值最小的网格开始撤销
+        candidates = np.flatnonzero(exact < 1)
+        order = candidates[np.argsort(exact[candidates], kind='stable')]
+        quota[order[:-diff]] -= 1
+    return quota
+
+
+def voxel_groups(x, y, z, voxel_size):
+    """
+    按给定体素边长对点分组
+
+    返回:
+        (inverse, counts): 每个点所属体素的编号 (0..体素数-1) 及每个体素的点数
+    """
+    points = np.column_stack([np.asarray(x, dtype=np.float64),
+                              np.asarray(y, dtype=np.float64),
+                              np.asarray(z, dtype=np.float64)])
+    ijk = np.floor((points - points.min(axis=0)) / voxel_size).astype(np.int64)
+    dims = ijk.max(axis=0) + 1
+
+    # 体素编号可以放进int64时用线性编号，否则按行去重
+    if np.prod(dims.astype(np.float64)) < 2 ** 62:
+        keys = (ijk[:, 0] * dims[1] + ijk[:, 1]) * dims[2] + ijk[:, 2]
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    else:
+        _, inverse, counts = np.unique(ijk, axis=0, return_inverse=True, return_counts=True)
+    return inverse.ravel(), counts
+
+
+def voxel_first_indices(inverse):
+    """每个体素保留原始顺序中的第一个点"""
+    order = np.argsort(inverse, kind='stable')
+    starts = np.flatnonzero(np.r_[True, np.diff(inverse[order]) != 0])
+    return np.sort(order[starts])
+
+
+def voxel_centroids(columns, inverse, counts):
+    """计算每个体素内各属性的平均值"""
+    return {name: np.bincount(inverse, weights=np.asarray(values, dtype=np.float64)) / counts
+            for name, values in columns.items()}
+
+
+def voxel_nearest_indices(x, y, z, inverse, counts):
+    """每个体素保留距离体素质心最近的点"""
+    coords = {'x': x, 'y': y, 'z': z}
+    centroids = voxel_centroids(coords, inverse, counts)
+    dist2 = np.zeros(len(inverse))
+    for name, values in coords.items():
+        dist2 += (np.asarray(values, dtype=np.float64) - centroids[name][inverse]) ** 2
+    order = np.lexsort((dist2, inverse))
+    starts = np.flatnonzero(np.r_[True, np.diff(inverse[order]) != 0])
+    return np.sort(order[starts])
+
+
+def cluster_voxel_size(x, y, z, target):
+    """
+    搜索体素边长，使非空体素数接近 target
+
+    非空体素数随边长增大而减少，在对数尺度上二分，返回非空体素数不少于 target 的最大边长。
+    """
+    extent = max(float(np.max(axis)) - float(np.min(axis)) for axis in (x, y, z))
+    if extent == 0 or target <= 1:
+        return max(extent, 1.0) * 2
+    low, high = extent / len(x) ** (1 / 3) / 16, extent
+    best = low
+    for _ in range(CLUSTER_SEARCH_STEPS):
+        size = np.sqrt(low * high)
+        cells = len(voxel_groups(x, y, z, size)[1])
+        if abs(cells / target - 1) <= CLUSTER_TOLERANCE:
+            return size
+        if cells >= target:
+            low = best = size
+        else:
+            high = size
+    return best
+
+
+def vertex_subset(header, vertex, indices, centroids=None, byte_order='='):
+    """
+    按输入文件声明的类型构造输出顶点
+
+    类型来自PLY头部 (PLY_TYPES)，不做猜测。结构化数组 (内存映射或已解析的顶点) 一次取出全部保留行，
+    列式数据逐列取出。体素质心的整数属性四舍五入后写回。
+
+    返回:
+        np.ndarray: 按 byte_order 排列的结构化数组；顶点含列表属性时为带 object 列的数组
+    """
+    vertex_header = header.element('vertex')
+    dtype = vertex_header.dtype(byte_order)
+    if centroids is not None:
+        if dtype is None:
+            raise ValueError("顶点包含列表属性，无法计算体素质心")
+        data = np.empty(len(centroids['x']), dtype=dtype)
+        for name in dtype.names:
+            values = centroids[name]
+            if np.issubdtype(dtype[name], np.integer):
+                values = np.rint(values)
+            data[name] = values
+        return data
+    if isinstance(vertex, np.ndarray):
+        # 原始记录与输出布局相同时不需要再转换
+        data = vertex[indices]
+        return data if dtype is None or data.dtype == dtype else data.astype(dtype)
+    data = np.empty(len(indices), dtype=dtype)
+    for name in dtype.names:
+        data[name] = vertex[name][indices]
+    return data
+
+
+def write_vertex_subset(input_path, output_path, header, vertex, indices, centroids=None,
+                        vertex_map=None, collapse=False, output_format=None):
+    """
+    将选中的顶点写为新的PLY文件，保持输入文件的属性类型和注释
+
+    顶点和面片都是定长记录时 (输出为二进制，没有其他元素，面片顶点数一致)，写出头部后直接写出
+    各元素的原始字节，否则通过 plyfile 写出。
+
+    参数:
+        input_path (str): 输入PLY文件路径，有其他元素时从中读取
+        output_path (str): 输出PLY文件路径
+        header: 输入文件的PLY头部
+        vertex: 输入顶点 (结构化数组或列式数据)
+        indices: 保留的顶点索引
+        centroids (dict): 体素质心属性，提供时忽略 indices
+        vertex_map (np.ndarray): 原顶点编号到输出顶点编号的映射 (删除的顶点为-1)，
+            用于重映射面片；为None时按 indices 的顺序编号
+        collapse (bool): 多个顶点合并为一个时 (体素/聚类) 为True，同时丢弃退化和重复的面片
+        output_format (str): 输出格式 (OUTPUT_FORMATS)，为None时与输入相同
+    """
+    output_format = output_format or header.format
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"未知的输出格式: {output_format}")
+    byte_order = BYTE_ORDERS[output_format]
+    vertex_header = header.element('vertex')
+    if vertex_header.has_lists and not isinstance(vertex, np.ndarray):
+        # 列式数据不包含列表属性，需要完整解析的顶点
+        vertex = read_vertex(input_path)
+    
+    # 创建新的顶点数据
+    extract_start = time.perf_counter()
+    vertex_data = vertex_subset(header, vertex, indices, centroids, byte_order)
+    record_stage('extract', time.perf_counter() - extract_start)
+    
+    # 面片的顶点索引通过 vertex_map 重映射，丢弃引用了已删除顶点的面片
+    faces = None
+    face_prop = face_index_property(header)
+    if face_prop is not None:
+        with stage('parse'):
+            faces = read_faces(input_path, header)
+        if vertex_map is None:
+            vertex_map = vertex_map_from_indices(indices, len(vertex))
+        with stage('remap'):
+            faces = remap_face_data(faces, vertex_map, collapse)
+    others = [el.name for el in header.elements
+              if el.name != 'vertex' and not (faces is not None and el.name == FACE_ELEMENT)]
+    
+    # 只有定长记录时直接写出原始字节
+    records = {'vertex': vertex_data if not vertex_header.has_lists else None}
+    if faces is not None:
+        records[FACE_ELEMENT] = face_records(faces, face_prop, byte_order)
+    if output_format != 'ascii' and not others and all(r is not None for r in records.values()):
+        with stage('write'):
+            with open(output_path, 'wb') as f:
+                write_header(f, output_format, [(el.name, len(records[el.name]), el.properties)
+                                                for el in header.elements], header.comments)
+                for el in header.elements:
+                    records[el.name].tofile(f)
+        return
+    
+    # 其他元素原样输出，此时才完整解析文件
+    if others:
+        with stage('parse'):
+            plydata = read_ply(input_path)
+    elements = []
+    for el in header.elements:
+        if el.name == 'vertex':
+            list_props = [prop for prop in el.properties if prop.is_list]
+            elements.append(PlyElement.describe(
+                vertex_data, 'vertex',
+                len_types={prop.name: PLY_TYPES[prop.list_type] for prop in list_props},
+                val_types={prop.name: PLY_TYPES[prop.ply_type] for prop in list_props}))
+        elif el.name == FACE_ELEMENT and faces is not None:
+            elements.append(face_element(faces, face_prop))
+        else:
+            elements.append(plydata[el.name])
+    
+    with stage('write'):
+        PlyData(elements, output_format == 'ascii', byte_order, header.comments).write(output_path)
+
+
+def downsample_ply(input_path, output_path=None, keep_ratio=0.5, method='auto', voxel_size=None,
+                   progress_callback=None, seed=None, workers=1, output_format=None, outliers=None):
     """
     将PLY文件按指定保留比例进行降采样
     
@@ -15,11 +425,38 @@ def downsample_ply(input_path, output_path=None, keep_ratio=0.5):
         input_path (str): 输入PLY文件路径
         output_path (str): 输出PLY文件路径，如果为None则创建临时文件
         keep_ratio (float): 要保留的点云比例 (0.0-1.0)
+        method (str): 采样方法
+            'auto' - 小点云随机采样，超过100万点时按网格分层采样
+            'random' / 'grid' - 强制使用随机采样 / 网格分层采样
+            'poisson' - 泊松圆盘消除采样，保留的点间距均匀 (蓝噪声)
+            'fps' - 近似最远点采样，逐层从粗到细选点，保留的点均匀覆盖整个点云
+            'voxel_first' / 'voxel_centroid' / 'voxel_nearest' - 体素网格降采样，
+                每个体素保留第一个点 / 属性平均值 / 离质心最近的点，忽略 keep_ratio
+            'cluster' - 网格顶点聚类简化: 每个体素的顶点合并为其平均值，面片随之合并，
+                丢弃退化和重复的面片；未指定 voxel_size 时按 keep_ratio 搜索体素边长
+        voxel_size (float): 体素边长，体素方法必须指定
+        progress_callback (callable): 进度回调 (stage, processed, total)；离群点滤波 (preprocess) 每批点、
+            泊松圆盘 / 最远点采样 (sample) 每轮迭代调用一次，回调抛出异常即中止降采样
+        seed (int): 随机种子，相同种子得到相同结果 (与 workers 无关)
+        workers (int): 网格分层采样使用的进程数，大于1时按网格区间并行计算
+        output_format (str): 输出格式 ('ascii' / 'binary_little_endian' / 'binary_big_endian')，
+            为None时与输入相同；ascii输入可以输出为二进制，文件更小，之后加载更快
+        outliers (dict): 采样前的离群点滤波，如 {'method': 'statistical', 'k': 8, 'std_ratio': 2.0}
+            或 {'method': 'radius', 'radius': 0.05, 'min_neighbors': 4}，为None时不滤波
     
     返回:
         str: 降采样后的文件路径
     """
-    logger.info(f"开始降采样PLY文件: {input_path}，保留率: {keep_ratio}")
+    logger.info(f"开始降采样PLY文件: {input_path}，保留率: {keep_ratio}，方法: {method}")
+    
+    if method not in METHODS:
+        raise ValueError(f"未知的降采样方法: {method}")
+    if method in VOXEL_METHODS and (voxel_size is None or voxel_size <= 0):
+        raise ValueError("体素降采样需要指定正的 voxel_size")
+    if method in MESH_METHODS and voxel_size is not None and voxel_size <= 0:
+        raise ValueError("voxel_size 必须为正数")
+    if output_format is not None and output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"未知的输出格式: {output_format}")
     
     # 如果没有指定输出路径，创建临时文件
     if output_path is None:
@@ -33,15 +470,28 @@ def downsample_ply(input_path, output_path=None, keep_ratio=0.5):
     # 确保保留率在有效范围内
     keep_ratio = max(0.01, min(1.0, keep_ratio))
     
-    # 读取PLY文件
+    # 读取PLY文件，优先使用上传时转换的列式数据，否则二进制文件的顶点数据为内存映射视图
     try:
-        plydata = PlyData.read(input_path)
+        with stage('parse'):
+            header = read_header(input_path)
+            vertex = open_columns(input_path)
+            if vertex is None:
+                vertex = read_vertex(input_path)
     except Exception as e:
         logger.error(f"读取PLY文件出错: {str(e)}")
         raise
     
-    # 获取顶点数据
-    vertex = plydata['vertex']
+    # 离群点滤波: 之后只在保留的点中采样，网格的包围盒不会被离群点撑大
+    source = vertex
+    kept_points = None
+    if outliers:
+        with stage('preprocess'):
+            kept_points = np.flatnonzero(outlier_mask(
+                vertex, progress=lambda processed, total: report_progress(
+                    progress_callback, 'preprocess', processed, total), **outliers))
+        if len(kept_points) == 0:
+            raise ValueError("离群点滤波后没有剩余的点")
+        vertex = VertexSubset(source, kept_points)
     
     # 计算采样数量
     orig_vertex_count = len(vertex)
@@ -50,121 +500,269 @@ def downsample_ply(input_path, output_path=None, keep_ratio=0.5):
         sample_count = 1  # 确保至少有一个点
     
     logger.info(f"原始点数: {orig_vertex_count}, 采样点数: {sample_count}, 保留率: {keep_ratio}")
+    report_progress(progress_callback, 'sample', 0, orig_vertex_count)
+    
+    rng = np.random.default_rng(seed)
+    centroids = None
+    vertex_map = None
+    has_faces = face_index_property(header) is not None
+    sample_start = time.perf_counter()
     
-    # 随机采样索引 - 使用分层采样方式以保持原始点云的形状特征
-    if keep_ratio < 1.0:
-        # 分层采样：将点云划分为小区域，从每个区域采样
+    # 采样循环中的进度回调；回调抛出的异常 (如任务被取消) 不回退到随机采样
+    aborted = []
+    
+    def sample_progress(processed, total):
         try:
-            # 基于空间位置进行聚类采样
-            x = np.array(vertex['x'])
-            y = np.array(vertex['y'])
-            z = np.array(vertex['z'])
-            
-            # 计算点云的边界盒
-            x_min, x_max = x.min(), x.max()
-            y_min, y_max = y.min(), y.max()
-            z_min, z_max = z.min(), z.max()
-            
-            # 根据点云密度确定采样策略
-            if orig_vertex_count > 1000000:  # 对于大点云
-                # 空间哈希采样：将3D空间划分为网格
-                grid_size = 100  # 网格数量
-                x_bins = np.linspace(x_min, x_max, grid_size)
-                y_bins = np.linspace(y_min, y_max, grid_size)
-                z_bins = np.linspace(z_min, z_max, grid_size)
-                
-                x_indices = np.digitize(x, x_bins)
-                y_indices = np.digitize(y, y_bins)
-                z_indices = np.digitize(z, z_bins)
-                
-                # 组合索引形成空间哈希
-                grid_indices = x_indices * grid_size**2 + y_indices * grid_size + z_indices
-                unique_grids = np.unique(grid_indices)
-                
-                # 从每个非空网格中采样
-                indices = []
-                for grid_idx in unique_grids:
-                    grid_points = np.where(grid_indices == grid_idx)[0]
-                    # 从该网格中取样 keep_ratio 比例的点
-                    grid_sample_count = max(1, int(len(grid_points) * keep_ratio))
-                    if len(grid_points) > 0:
-                        grid_samples = np.random.choice(grid_points, min(grid_sample_count, len(grid_points)), replace=False)
-                        indices.extend(grid_samples)
-                
-                # 如果总采样点数与目标不符，调整
-                if len(indices) > sample_count:
-                    indices = np.random.choice(indices, sample_count, replace=False)
-                elif len(indices) < sample_count and len(indices) < orig_vertex_count:
-                    # 随机添加一些未被选中的点
-                    remaining = np.setdiff1d(np.arange(orig_vertex_count), indices)
-                    additional = np.random.choice(remaining, min(sample_count - len(indices), len(remaining)), replace=False)
-                    indices = np.concatenate([indices, additional])
-                
-                indices = sorted(indices)
+            report_progress(progress_callback, 'sample', processed, total)
+        except Exception as e:
+            aborted.append(e)
+            raise
+    
+    if method in MESH_METHODS:
+        # 顶点聚类: 同一体素的顶点合并为一个，面片的顶点映射到所在体素
+        x, y, z = vertex['x'], vertex['y'], vertex['z']
+        if voxel_size is None:
+            voxel_size = cluster_voxel_size(x, y, z, sample_count)
+        inverse, counts = voxel_groups(x, y, z, voxel_size)
+        logger.info(f"顶点聚类体素边长: {voxel_size}，聚类后顶点数: {len(counts)}")
+        columns = {name: vertex[name] for name in vertex.dtype.names}
+        centroids = voxel_centroids(columns, inverse, counts)
+        indices = None
+        vertex_map = vertex_map_from_clusters(inverse)
+    elif method in VOXEL_METHODS:
+        # 体素网格降采样：每个体素输出一个点
+        x, y, z = vertex['x'], vertex['y'], vertex['z']
+        inverse, counts = voxel_groups(x, y, z, voxel_size)
+        logger.info(f"体素边长: {voxel_size}，非空体素数: {len(counts)}")
+        
+        if method == 'voxel_first':
+            indices = voxel_first_indices(inverse)
+        elif method == 'voxel_nearest':
+            indices = voxel_nearest_indices(x, y, z, inverse, counts)
+        else:
+            columns = {name: vertex[name] for name in vertex.dtype.names}
+            centroids = voxel_centroids(columns, inverse, counts)
+            indices = None
+        if has_faces:
+            vertex_map = vertex_map_from_clusters(inverse, indices)
+    elif keep_ratio < 1.0:
+        # 随机采样索引 - 使用分层采样方式以保持原始点云的形状特征
+        use_grid = method == 'grid' or (method == 'auto' and orig_vertex_count > LARGE_CLOUD_POINTS)
+        try:
+            if method == 'poisson':
+                indices = poisson_disk_indices(vertex['x'], vertex['y'], vertex['z'], sample_count, rng,
+                                               progress=sample_progress)
+            elif method == 'fps':
+                indices = farthest_point_indices(vertex['x'], vertex['y'], vertex['z'], sample_count, rng,
+                                                 progress=sample_progress)
+            elif use_grid:
+                # 空间哈希采样：将3D空间划分为网格，从每个非空网格中采样
+                cells = grid_cell_ids(vertex['x'], vertex['y'], vertex['z'])
+                if workers > 1:
+                    indices = parallel_stratified_indices(cells, keep_ratio, sample_count, rng, workers)
+                else:
+                    indices = stratified_indices(cells, keep_ratio, sample_count, rng)
             else:
                 # 对于较小的点云，简单随机采样即可
-                indices = random.sample(range(orig_vertex_count), sample_count)
-                indices.sort()  # 排序以保留相对顺序
+                indices = np.sort(rng.choice(orig_vertex_count, sample_count, replace=False))  # 排序以保留相对顺序
         except Exception as e:
-            logger.error(f"分层采样失败: {str(e)}，回退到随机采样")
+            if aborted:
+                raise
+            logger.error(f"{method} 采样失败: {str(e)}，回退到随机采样")
             # 回退到普通随机采样
-            indices = random.sample(range(orig_vertex_count), sample_count)
-            indices.sort()  # 排序以保留相对顺序
+            indices = np.sort(rng.choice(orig_vertex_count, sample_count, replace=False))  # 排序以保留相对顺序
     else:
         # 保留所有点
         indices = list(range(orig_vertex_count))
     
-    # 提取属性名和数据类型
-    dtype_list = []
-    for prop in vertex.properties:
-        # 直接使用dtype的值而不是bound method
-        dtype_name = prop.dtype.__str__()
-        if 'float' in dtype_name.lower():
-            dtype = np.float32
-        elif 'double' in dtype_name.lower():
-            dtype = np.float64
-        elif 'int8' in dtype_name.lower() or 'uchar' in dtype_name.lower():
-            dtype = np.uint8
-        elif 'int16' in dtype_name.lower() or 'short' in dtype_name.lower():
-            dtype = np.int16
-        elif 'int32' in dtype_name.lower() or 'int' in dtype_name.lower():
-            dtype = np.int32
-        else:
-            # 默认使用float32
-            logger.warning(f"未知的数据类型: {dtype_name}, 使用float32代替")
-            dtype = np.float32
-        
-        dtype_list.append((prop.name, dtype))
+    record_stage('sample', time.perf_counter() - sample_start)
+    report_progress(progress_callback, 'write', orig_vertex_count, orig_vertex_count)
     
-    logger.info(f"属性数据类型: {dtype_list}")
+    if kept_points is not None:
+        # 把滤波后子集中的编号换回原始顶点编号，被滤除的顶点在 vertex_map 中为-1
+        if indices is not None:
+            indices = kept_points[np.asarray(indices, dtype=np.int64)]
+        if vertex_map is not None:
+            full_map = np.full(len(source), -1, dtype=np.int64)
+            full_map[kept_points] = vertex_map
+            vertex_map = full_map
+        vertex = source
     
-    # 创建新的顶点数据
-    vertex_data = np.zeros(len(indices), dtype=dtype_list)
+    write_vertex_subset(input_path, output_path, header, vertex, indices, centroids,
+                        vertex_map, collapse=vertex_map is not None, output_format=output_format)
+    logger.info(f"降采样完成，文件保存到: {output_path}")
     
-    # 复制采样顶点的属性
-    for prop in vertex.properties:
-        name = prop.name
-        vertex_data[name] = vertex[name][indices]
+    # 验证新文件大小
+    output_size_mb = os.path.getsize(output_path) / (1024 * 1024)
+    logger.info(f"输出文件大小: {output_size_mb:.2f} MB ({output_size_mb/input_size_mb:.2%} 的原始大小)")
+    report_progress(progress_callback, 'done', orig_vertex_count, orig_vertex_count)
     
-    # 创建新的PLY元素
-    new_vertex = PlyElement.describe(vertex_data, 'vertex')
+    return output_path 
+
+def downsample_ply_streaming(input_path, output_path=None, keep_ratio=0.5,
+                             chunk_size=STREAM_CHUNK_POINTS, grid_size=GRID_SIZE, progress_callback=None,
+                             seed=None):
+    """
+    分块流式降采样，内存占用与输入点数无关，适用于超出内存的大点云
+
+    第一遍计算包围盒，第二遍统计每个网格的点数并分配保留数，
+    第三遍逐块按超几何分布抽取每个网格在本块中的保留点，并直接追加写入输出文件。
+    输出为 binary_little_endian 格式，保留原始顶点属性类型；其他元素 (如face) 不输出。
+
+    参数:
+        input_path (str): 输入PLY文件路径
+        output_path (str): 输出PLY文件路径，如果为None则创建临时文件
+        keep_ratio (float): 要保留的点云比例 (0.0-1.0)
+        chunk_size (int): 每块读取的点数
+        grid_size (int): 分层采样的网格数量 (每个轴)
+        progress_callback (callable): 进度回调 (stage, processed, total)，每块调用一次
+        seed (int): 随机种子
+
+    返回:
+        str: 降采样后的文件路径
+    """
+    logger.info(f"开始流式降采样PLY文件: {input_path}，保留率: {keep_ratio}，分块大小: {chunk_size}")
     
-    # 如果有其他元素（如face），也需要处理
-    elements = [new_vertex]
+    if output_path is None:
+        temp_dir = tempfile.gettempdir()
+        output_path = os.path.join(temp_dir, f"downsampled_{os.path.basename(input_path)}")
     
-    for el in plydata.elements:
-        if el.name != 'vertex':
-            elements.append(el)
+    keep_ratio = max(0.01, min(1.0, keep_ratio))
+    header = read_header(input_path)
+    vertex_header = header.element('vertex')
+    if vertex_header is None:
+        raise ValueError("PLY文件中没有 vertex 元素")
     
-    # 创建新的PLY数据
-    new_plydata = PlyData(elements, plydata.text, plydata.byte_order, plydata.comments)
+    orig_vertex_count = vertex_header.count
+    sample_count = max(1, int(orig_vertex_count * keep_ratio))
+    out_dtype = vertex_header.dtype('<')
+    if out_dtype is None:
+        raise ValueError("顶点包含列表属性，无法流式降采样")
     
-    # 写入新文件
-    new_plydata.write(output_path)
-    logger.info(f"降采样完成，文件保存到: {output_path}")
+    dropped = [el.name for el in header.elements if el.name != 'vertex']
+    if dropped:
+        logger.warning(f"流式降采样只输出顶点，忽略元素: {dropped}")
     
-    # 验证新文件大小
-    output_size_mb = os.path.getsize(output_path) / (1024 * 1024)
-    logger.info(f"输出文件大小: {output_size_mb:.2f} MB ({output_size_mb/input_size_mb:.2%} 的原始大小)")
+    logger.info(f"原始点数: {orig_vertex_count}, 采样点数: {sample_count}, 保留率: {keep_ratio}")
+    
+    def chunks(stage):
+        # 逐块读取并报告进度
+        processed = 0
+        for chunk in timed_iter('parse', iter_element_chunks(input_path, 'vertex', chunk_size, header)):
+            yield chunk
+            processed += len(chunk)
+            report_progress(progress_callback, stage, processed, orig_vertex_count)
     
-    return output_path 
\ No newline at end of file
+    # 第一遍：计算包围盒
+    lo = np.full(3, np.inf)
+    hi = np.full(3, -np.inf)
+    for chunk in chunks('bounds'):
+        for i, name in enumerate(('x', 'y', 'z')):
+            values = chunk[name]
+            lo[i] = min(lo[i], float(values.min()))
+            hi[i] = max(hi[i], float(values.max()))
+    bounds = (lo, hi)
+    logger.info(f"包围盒: {lo.tolist()} - {hi.tolist()}")
+    
+    # 第二遍：统计每个网格的点数并分配保留数
+    cell_count = grid_size ** 3
+    counts = np.zeros(cell_count, dtype=np.int64)
+    for chunk in chunks('histogram'):
+        cells = grid_cell_ids(chunk['x'], chunk['y'], chunk['z'], grid_size, bounds)
+        counts += np.bincount(cells, minlength=cell_count)
+    
+    occupied = counts > 0
+    quota = np.zeros(cell_count, dtype=np.int64)
+    quota[occupied] = apportion_quotas(counts[occupied], keep_ratio, sample_count)
+    total = int(quota.sum())
+    logger.info(f"非空网格数: {int(occupied.sum())}，实际输出点数: {total}")
+    
+    # 第三遍：逐块采样并写出
+    rng = np.random.default_rng(seed)
+    remaining_points = counts
+    remaining_quota = quota
+    written = 0
+    with open(output_path, 'wb') as f:
+        write_header(f, 'binary_little_endian', [('vertex', total, out_dtype)], header.comments)
+        for chunk in chunks('sample'):
+            cells = grid_cell_ids(chunk['x'], chunk['y'], chunk['z'], grid_size, bounds)
+            uniq, inverse, chunk_counts = np.unique(cells, return_inverse=True, return_counts=True)
+            
+            # 每个网格在本块中应抽取的点数服从超几何分布，保证整体为无放回均匀抽样
+            take = rng.hypergeometric(chunk_counts, remaining_points[uniq] - chunk_counts, remaining_quota[uniq])
+            remaining_points[uniq] -= chunk_counts
+            remaining_quota[uniq] -= take
+            
+            order = np.lexsort((rng.random(len(cells)), inverse))
+            sorted_groups = inverse[order]
+            starts = np.searchsorted(sorted_groups, np.arange(len(uniq)))
+            rank = np.arange(len(cells)) - starts[sorted_groups]
+            mask = np.zeros(len(cells), dtype=bool)
+            mask[order] = rank < take[sorted_groups]
+            
+            selected = np.asarray(chunk[mask]).astype(out_dtype)
+            with stage('write'):
+                f.write(selected.tobytes())
+            written += len(selected)
+            logger.info(f"已写出 {written}/{total} 个点")
+    
+    logger.info(f"流式降采样完成，文件保存到: {output_path}")
+    report_progress(progress_callback, 'done', orig_vertex_count, orig_vertex_count)
+    return output_path
+
+
+def can_stream(header, output_format=None, outliers=None):
+    """
+    判断文件能否使用 downsample_ply_streaming 而不丢失信息
+
+    流式降采样只输出顶点且总是 binary_little_endian，离群点滤波需要全部坐标，
+    因此要求只有不含列表属性的顶点元素、输出格式为默认或 binary_little_endian，且不做离群点滤波。
+    """
+    vertex_header = header.element('vertex')
+    vertex_only = vertex_header is not None and not vertex_header.has_lists and all(
+        element is vertex_header or element.count == 0 for element in header.elements)
+    return vertex_only and output_format in (None, 'binary_little_endian') and not outliers
+
+
+def run_downsample(input_path, output_path, keep_ratio=0.5, method='auto', voxel_size=None,
+                   streaming_threshold=None, progress_callback=None, seed=None, workers=1, output_format=None,
+                   outliers=None):
+    """
+    根据点数选择降采样实现
+
+    点数超过 streaming_threshold 且使用网格分层采样 (auto / grid) 时改用分块流式降采样，
+    否则调用 downsample_ply。流式降采样总是输出 binary_little_endian，指定了其他 output_format 时
+    使用 downsample_ply；离群点滤波需要全部坐标，同样使用 downsample_ply。
+    流式降采样只输出顶点，输入还有面片等其他元素 (或顶点含列表属性) 时使用 downsample_ply，面片随顶点重映射。
+    """
+    header = read_header(input_path)
+    vertex_header = header.element('vertex')
+    if (streaming_threshold is not None and can_stream(header, output_format, outliers)
+            and vertex_header.count > streaming_threshold and method in ('auto', 'grid')):
+        logger.info(f"点数 {vertex_header.count} 超过 {streaming_threshold}，使用流式降采样")
+        return downsample_ply_streaming(input_path, output_path, keep_ratio,
+                                        progress_callback=progress_callback, seed=seed)
+    return downsample_ply(input_path, output_path, keep_ratio, method=method, voxel_size=voxel_size,
+                          progress_callback=progress_callback, seed=seed, workers=workers,
+                          output_format=output_format, outliers=outliers)
+
+
+def remove_outliers_ply(input_path, output_path, method='statistical', output_format=None, **params):
+    """
+    删除离群点后写为新的PLY文件，保留全部属性，面片随之重映射
+
+    参数:
+        method (str): 'statistical' 或 'radius'
+        params: statistical 为 k、std_ratio；radius 为 radius、min_neighbors
+
+    返回:
+        int: 删除的点数
+    """
+    header = read_header(input_path)
+    vertex = open_columns(input_path)
+    if vertex is None:
+        vertex = read_vertex(input_path)
+    with stage('preprocess'):
+        indices = np.flatnonzero(outlier_mask(vertex, method, **params))
+    write_vertex_subset(input_path, output_path, header, vertex, indices, output_format=output_format)
+    return len(vertex) - len(indices)
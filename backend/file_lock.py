@@ -0,0 +1,57 @@
+import threading
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，只能使用进程内的锁 (开发服务器为单进程)
+    fcntl = None
+
+_locks = {}  # 锁文件路径 -> 进程内的线程锁
+_global_lock = threading.Lock()
+
+
+class FileLock:
+    """
+    文件锁 (对多个worker进程有效) 加上进程内的线程锁
+
+    gunicorn的多个worker共用上传目录，同一资源 (上传会话、内容哈希索引、派生数据的构建) 的
+    检查和写入必须在所有进程间互斥。锁文件在首次加锁时创建，之后保留。
+    """
+
+    def __init__(self, lock_path):
+        self.lock_path = lock_path
+        with _global_lock:
+            self._thread_lock = _locks.setdefault(lock_path, threading.Lock())
+        self._file = None
+
+    def acquire(self, blocking=True):
+        if not self._thread_lock.acquire(blocking):
+            return False
+        if fcntl is not None:
+            f = open(self.lock_path, 'ab')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                self._thread_lock.release()
+                return False
+            self._file = f
+        return True
+
+    def release(self):
+        if self._file is not None:
+            # 关闭文件即释放文件锁
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def forget(lock_path):
+    """锁文件被删除后移除对应的线程锁"""
+    with _global_lock:
+        _locks.pop(lock_path, None)
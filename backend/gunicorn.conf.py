@@ -0,0 +1,59 @@
+"""
+gunicorn 配置: gunicorn -c gunicorn.conf.py wsgi:app
+
+环境变量:
+    PORT                   监听端口，默认8085
+    WEB_WORKERS            worker进程数，默认为CPU核数 (解析和降采样是CPU密集的numpy计算)
+    WEB_THREADS            每个worker的线程数，默认4；流式响应和文件下载主要等待网络，多线程可以重叠
+    WEB_TIMEOUT            worker无响应多少秒后被重启，默认300
+    WEB_GRACEFUL_TIMEOUT   收到SIGTERM后等待正在处理的请求完成的秒数，默认60
+    WEB_MAX_REQUESTS       每个worker处理多少个请求后重启，默认0 (不重启)。后台任务的进程池属于worker，
+                           worker重启时其运行中的任务会被取消；前端每秒轮询任务状态和加载LOD分块，
+                           请求数增长很快，设置时应取足够大的值
+    METRICS_DIR            各进程指标快照的目录，/metrics 汇总全部worker的计数，默认 uploads/.metrics
+
+请求体大小由Flask的 MAX_CONTENT_LENGTH 限制 (上传2GB，降采样接口64GB)。
+每个worker各有一个点云缓存和一个后台任务进程池 (DOWNSAMPLE_WORKERS 个进程)，任务状态保存在
+uploads/.jobs/，任何worker都可以查询。分块上传的会话数据和文件锁保存在 uploads/.sessions/，
+同一上传的分块可以由不同的worker接收，不需要粘性路由。耗时很长的降采样应使用 /api/jobs 接口，避免占用请求线程。
+"""
+import os
+import shutil
+import multiprocessing
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8085)}"
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 4))
+
+timeout = int(os.environ.get('WEB_TIMEOUT', 300))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 60))
+keepalive = 5
+
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+# 请求行和头部的大小限制 (请求体另由Flask限制)
+limit_request_line = 8190
+limit_request_fields = 100
+limit_request_field_size = 8190
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('WEB_LOG_LEVEL', 'info')
+
+# 每个worker各自导入应用，避免在master进程中打开的内存映射和进程池被fork共享
+preload_app = False
+
+
+def on_starting(server):
+    """master启动时清空指标快照目录，worker从master继承 METRICS_DIR 环境变量"""
+    directory = os.environ.setdefault('METRICS_DIR', os.path.join('uploads', '.metrics'))
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+
+
+def worker_exit(server, worker):
+    """worker退出时停止后台任务进程池，排队中的任务标记为已取消"""
+    from app import job_manager
+    job_manager.shutdown(wait=False)
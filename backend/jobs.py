@@ -0,0 +1,282 @@
+import os
+import json
+import time
+import uuid
+import tempfile
+import threading
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from cloud_cache import cloud_cache
+from downsample import run_downsample
+from batch_downsample import downsample_batch_zip
+
+logger = logging.getLogger(__name__)
+
+JOB_RESULT_TTL = 3600  # 已结束任务及其结果文件保留的秒数
+
+
+class JobCancelled(Exception):
+    """任务被用户取消"""
+
+
+def _write_json(path, data):
+    temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _unlink(path):
+    try:
+        if os.path.exists(path):
+            os.unlink(path)
+    except OSError as e:
+        logger.warning(f"删除文件 {path} 时出错: {str(e)}")
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # 没有权限发送信号等情况，视为进程仍在运行
+        return True
+    return True
+
+
+def _job_paths(state_dir, job_id):
+    base = os.path.join(state_dir, job_id)
+    return {'record': f'{base}.json', 'progress': f'{base}.progress.json', 'cancel': f'{base}.cancel'}
+
+
+def _progress_callback(job_id, state_dir):
+    paths = _job_paths(state_dir, job_id)
+
+    def callback(stage, processed, total):
+        if os.path.exists(paths['cancel']):
+            raise JobCancelled()
+        _write_json(paths['progress'], {'stage': stage, 'processed': processed, 'total': total})
+    return callback
+
+
+def _execute_downsample(job_id, input_path, output_path, options, state_dir):
+    """在工作进程中执行降采样，通过状态目录中的文件报告进度并检查取消标记"""
+    callback = _progress_callback(job_id, state_dir)
+    try:
+        callback('start', 0, 0)
+        return run_downsample(input_path, output_path, progress_callback=callback, **options)
+    finally:
+        # 输入文件只供本任务使用，结束后删除；工作进程长期存在，先释放缓存中的内存映射，否则已删除的文件仍占用磁盘
+        cloud_cache.invalidate(input_path)
+        _unlink(input_path)
+
+
+def _execute_batch(job_id, input_paths, output_path, options, state_dir):
+    """在工作进程中执行批量降采样，结果打包为zip"""
+    callback = _progress_callback(job_id, state_dir)
+    try:
+        callback('start', 0, 0)
+        return downsample_batch_zip(input_paths, output_path, progress_callback=callback, **options)
+    finally:
+        for path in input_paths:
+            cloud_cache.invalidate(path)
+            _unlink(path)
+
+
+class JobManager:
+    """
+    后台降采样任务队列
+
+    任务在进程池中执行，最多同时运行 max_workers 个，提交后立即返回任务ID。
+    任务状态、进度和取消标记都保存在 state_dir 下的文件中，多个服务进程 (如gunicorn的多个worker)
+    共用同一目录时，任何一个进程都可以查询、取消和下载其他进程提交的任务。
+    """
+
+    def __init__(self, max_workers=2, result_ttl=JOB_RESULT_TTL, state_dir=None):
+        self.max_workers = max_workers
+        self.result_ttl = result_ttl
+        self.state_dir = state_dir or tempfile.mkdtemp(prefix='jobs_')
+        os.makedirs(self.state_dir, exist_ok=True)
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _ensure_pool(self):
+        # 首次提交任务时才启动进程池，避免导入模块时创建子进程
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+    def submit(self, input_path, output_path, download_name, **options):
+        """
+        提交降采样任务
+
+        参数:
+            input_path (str): 输入文件路径，任务结束后删除
+            output_path (str): 输出文件路径
+            download_name (str): 下载结果时使用的文件名
+            options: 传给 run_downsample 的参数 (keep_ratio, method, voxel_size, streaming_threshold, output_format, outliers)
+
+        返回:
+            str: 任务ID
+        """
+        return self._submit(_execute_downsample, input_path, [input_path], output_path, download_name, options)
+
+    def submit_batch(self, input_paths, output_path, download_name, **options):
+        """
+        提交批量降采样任务，结果为包含所有输出的zip文件
+
+        参数:
+            input_paths (list): 输入文件路径，任务结束后删除
+            output_path (str): 输出zip文件路径
+            download_name (str): 下载结果时使用的文件名
+            options: 传给 downsample_batch_zip 的参数 (keep_ratios, method, seed, names, output_format, streaming_threshold)
+
+        返回:
+            str: 任务ID
+        """
+        return self._submit(_execute_batch, input_paths, input_paths, output_path, download_name, options)
+
+    def _submit(self, task, task_input, input_paths, output_path, download_name, options):
+        job_id = uuid.uuid4().hex
+        paths = _job_paths(self.state_dir, job_id)
+        with self._lock:
+            self._prune()
+            self._ensure_pool()
+            _write_json(paths['record'], {
+                'id': job_id,
+                'status': 'queued',
+                'created_at': time.time(),
+                'finished_at': None,
+                'owner_pid': os.getpid(),
+                'input_paths': input_paths,
+                'output_path': output_path,
+                'download_name': download_name,
+                'error': None,
+                'last_progress': None
+            })
+            future = self._executor.submit(task, job_id, task_input, output_path, options, self.state_dir)
+            self._futures[job_id] = future
+        future.add_done_callback(lambda f: self._finish(job_id, f))
+        logger.info(f"已提交降采样任务: {job_id}")
+        return job_id
+
+    def _finish(self, job_id, future):
+        paths = _job_paths(self.state_dir, job_id)
+        with self._lock:
+            self._futures.pop(job_id, None)
+            job = _read_json(paths['record'])
+            if job is None:
+                return
+            job['finished_at'] = time.time()
+            if future.cancelled():
+                job['status'] = 'cancelled'
+            else:
+                error = future.exception()
+                if error is None:
+                    job['status'] = 'done'
+                elif isinstance(error, JobCancelled):
+                    job['status'] = 'cancelled'
+                else:
+                    job['status'] = 'failed'
+                    job['error'] = str(error)
+            job['last_progress'] = _read_json(paths['progress'])
+            _write_json(paths['record'], job)
+            _unlink(paths['progress'])
+            _unlink(paths['cancel'])
+
+        if job['status'] != 'done':
+            for path in job['input_paths'] + [job['output_path']]:
+                _unlink(path)
+        logger.info(f"降采样任务结束: {job_id}，状态: {job['status']}")
+
+    def _load(self, job_id):
+        # 任务ID只允许十六进制字符，避免路径穿越
+        if not job_id or not all(c in '0123456789abcdef' for c in job_id):
+            return None
+        return _read_json(_job_paths(self.state_dir, job_id)['record'])
+
+    def get(self, job_id):
+        """返回任务状态和进度，任务不存在时返回None"""
+        job = self._load(job_id)
+        if job is None:
+            return None
+        paths = _job_paths(self.state_dir, job_id)
+        status = job['status']
+        progress = job.get('last_progress')
+        error = job['error']
+        if job['finished_at'] is None:
+            progress = _read_json(paths['progress'])
+            if not _process_alive(job['owner_pid']):
+                # 提交任务的服务进程已退出 (如重启时超过了优雅关闭的等待时间)，任务不会再完成
+                status = 'failed'
+                error = '执行任务的服务进程已退出'
+            elif progress is not None:
+                status = 'cancelling' if os.path.exists(paths['cancel']) else 'running'
+        return {
+            'id': job_id,
+            'status': status,
+            'created_at': job['created_at'],
+            'finished_at': job['finished_at'],
+            'stage': progress['stage'] if progress else None,
+            'processed': progress['processed'] if progress else 0,
+            'total': progress['total'] if progress else 0,
+            'error': error
+        }
+
+    def cancel(self, job_id):
+        """取消任务，本进程排队中的任务直接移除，其他任务在下一次报告进度时中止"""
+        job = self._load(job_id)
+        if job is None:
+            return False
+        if job['finished_at'] is not None:
+            return True
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is None or not future.cancel():
+            open(_job_paths(self.state_dir, job_id)['cancel'], 'w').close()
+        logger.info(f"已请求取消降采样任务: {job_id}")
+        return True
+
+    def result(self, job_id):
+        """返回已完成任务的 (结果路径, 下载文件名)，未完成时返回None"""
+        job = self._load(job_id)
+        if job is None or job['status'] != 'done':
+            return None
+        return job['output_path'], job['download_name']
+
+    def _prune(self):
+        # 删除过期的已结束任务及其结果文件
+        now = time.time()
+        for name in os.listdir(self.state_dir):
+            if not name.endswith('.json') or name.endswith('.progress.json'):
+                continue
+            job = _read_json(os.path.join(self.state_dir, name))
+            if job is None or job['finished_at'] is None or now - job['finished_at'] <= self.result_ttl:
+                continue
+            _unlink(job['output_path'])
+            _unlink(os.path.join(self.state_dir, name))
+
+    def shutdown(self, wait=True):
+        """
+        停止进程池，取消所有排队中的任务
+
+        wait 为False时不等待运行中的任务，并为它们设置取消标记，使其在下一次报告进度时中止。
+        """
+        if self._executor is None:
+            return
+        if not wait:
+            with self._lock:
+                running = list(self._futures)
+            for job_id in running:
+                open(_job_paths(self.state_dir, job_id)['cancel'], 'w').close()
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        self._executor = None
@@ -0,0 +1,258 @@
+"""
+并发负载测试
+
+多个线程在指定时间内按比例并发发送上传、查看 (二进制点流) 和降采样请求，统计每类请求的
+吞吐量和延迟分位数。可以连接已运行的服务，也可以依次以不同的 worker 数启动 gunicorn，
+比较吞吐量随 worker 数的变化。
+
+用法:
+    python loadtest.py --url http://localhost:8085 --concurrency 8 --duration 30
+    python loadtest.py --spawn-workers 1,2,4 --concurrency 16 --points 500K
+    python loadtest.py --mix view=8,upload=1,downsample=1 --output loadtest.json
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import signal
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from benchmark import generate_ply, parse_size
+
+DEFAULT_MIX = 'view=4,upload=1,downsample=1'
+READY_TIMEOUT = 60
+
+
+def multipart_body(fields, files):
+    """构造 multipart/form-data 请求体，files 为 {字段名: (文件名, 内容)}"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode())
+        parts.append(content)
+        parts.append(b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def request(url, data=None, content_type=None, timeout=600):
+    """发送请求并读完响应体，返回 (状态码, 响应字节数)"""
+    req = urllib.request.Request(url, data=data, method='POST' if data is not None else 'GET')
+    if content_type:
+        req.add_header('Content-Type', content_type)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            size = 0
+            while True:
+                block = response.read(1024 * 1024)
+                if not block:
+                    break
+                size += len(block)
+            return response.status, size
+    except urllib.error.HTTPError as e:
+        return e.code, len(e.read())
+
+
+class LoadTest:
+    """按比例并发发送请求并记录每个请求的延迟"""
+
+    def __init__(self, base_url, ply_bytes, view_name, keep_ratio=0.25):
+        self.base_url = base_url.rstrip('/')
+        self.ply_bytes = ply_bytes
+        self.view_name = view_name
+        self.keep_ratio = keep_ratio
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def upload(self, worker):
+        body, content_type = multipart_body({}, {'file': (f'loadtest_upload_{worker}.ply', self.ply_bytes)})
+        return request(f'{self.base_url}/api/upload', body, content_type)
+
+    def view(self, worker):
+        return request(f'{self.base_url}/api/pointcloud/{self.view_name}?format=binary')
+
+    def downsample(self, worker):
+        body, content_type = multipart_body({'keep_ratio': self.keep_ratio},
+                                            {'file': ('loadtest.ply', self.ply_bytes)})
+        return request(f'{self.base_url}/api/downsample', body, content_type)
+
+    def _worker(self, worker, operations, weights, deadline, seed):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            operation = rng.choices(operations, weights)[0]
+            start = time.perf_counter()
+            try:
+                status, size = getattr(self, operation)(worker)
+            except OSError as e:
+                status, size = f'error: {e}', 0
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.samples.append((operation, status, elapsed, size))
+
+    def run(self, mix, concurrency, duration, seed=0):
+        operations = list(mix)
+        weights = [mix[name] for name in operations]
+        deadline = time.perf_counter() + duration
+        threads = [threading.Thread(target=self._worker, args=(i, operations, weights, deadline, seed + i))
+                   for i in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return summarize(self.samples, time.perf_counter() - start)
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def summarize(samples, wall_time):
+    """按请求类型统计次数、失败数、吞吐量和延迟分位数"""
+    summary = {'wall_seconds': round(wall_time, 3), 'operations': {}}
+    ok_total = 0
+    for operation in sorted({s[0] for s in samples}):
+        rows = [s for s in samples if s[0] == operation]
+        latencies = [s[2] for s in rows if s[1] == 200]
+        ok_total += len(latencies)
+        summary['operations'][operation] = {
+            'requests': len(rows),
+            'errors': len(rows) - len(latencies),
+            'throughput': round(len(latencies) / wall_time, 3),
+            'p50_ms': _ms(percentile(latencies, 0.5)),
+            'p95_ms': _ms(percentile(latencies, 0.95)),
+            'p99_ms': _ms(percentile(latencies, 0.99)),
+            'mb_per_s': round(sum(s[3] for s in rows if s[1] == 200) / wall_time / 1e6, 3)
+        }
+    summary['throughput'] = round(ok_total / wall_time, 3)
+    return summary
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in ('upload', 'view', 'downsample'):
+            raise ValueError(f'未知的请求类型: {name}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def wait_ready(base_url, timeout=READY_TIMEOUT):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if request(f'{base_url}/api/cache/stats', timeout=5)[0] == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f'服务在 {timeout} 秒内没有就绪: {base_url}')
+
+
+def start_gunicorn(workers, port, threads):
+    """以指定的 worker 数启动 gunicorn，返回进程"""
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PORT=str(port), WEB_WORKERS=str(workers), WEB_THREADS=str(threads),
+               WEB_LOG_LEVEL='warning')
+    return subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+                            cwd=backend_dir, env=env, stdout=subprocess.DEVNULL)
+
+
+def stop_server(process):
+    # SIGTERM 触发 gunicorn 的优雅关闭
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=90)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def run_once(base_url, ply_bytes, args):
+    wait_ready(base_url)
+    test = LoadTest(base_url, ply_bytes, args.view_name)
+    # 先上传一次供查看请求使用，同时预热缓存
+    body, content_type = multipart_body({}, {'file': (args.view_name, ply_bytes)})
+    status, _ = request(f'{base_url}/api/upload', body, content_type)
+    if status != 200:
+        raise RuntimeError(f'上传测试文件失败: HTTP {status}')
+    return test.run(parse_mix(args.mix), args.concurrency, args.duration, args.seed)
+
+
+def print_summary(label, summary):
+    print(f"\n{label}: 总吞吐量 {summary['throughput']} 请求/秒 ({summary['wall_seconds']} 秒)")
+    print(f"{'请求':<12}{'次数':>8}{'失败':>6}{'请求/秒':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'MB/s':>9}")
+    for name, row in summary['operations'].items():
+        print(f"{name:<12}{row['requests']:>8}{row['errors']:>6}{row['throughput']:>10}"
+              f"{str(row['p50_ms']):>10}{str(row['p95_ms']):>10}{str(row['p99_ms']):>10}{row['mb_per_s']:>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='上传、查看和降采样接口的并发负载测试')
+    parser.add_argument('--url', default='http://localhost:8085', help='已运行的服务地址')
+    parser.add_argument('--spawn-workers', help='逗号分隔的 worker 数，依次启动 gunicorn 测试 (忽略 --url)')
+    parser.add_argument('--port', type=int, default=8095, help='启动 gunicorn 时使用的端口')
+    parser.add_argument('--threads', type=int, default=4, help='启动 gunicorn 时每个 worker 的线程数')
+    parser.add_argument('--concurrency', type=int, default=8, help='并发的客户端线程数')
+    parser.add_argument('--duration', type=float, default=30, help='每轮测试的秒数')
+    parser.add_argument('--points', default='200K', help='测试点云的点数，例如 200K、1M')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='请求类型及权重')
+    parser.add_argument('--view-name', default='loadtest_view.ply', help='查看请求使用的文件名')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--output', help='把结果写入JSON文件')
+    args = parser.parse_args(argv)
+
+    try:
+        parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'loadtest.ply')
+        generate_ply(path, parse_size(args.points), seed=args.seed)
+        with open(path, 'rb') as f:
+            ply_bytes = f.read()
+
+    results = {}
+    if args.spawn_workers:
+        base_url = f'http://127.0.0.1:{args.port}'
+        for workers in [int(w) for w in args.spawn_workers.split(',')]:
+            process = start_gunicorn(workers, args.port, args.threads)
+            try:
+                results[f'workers={workers}'] = run_once(base_url, ply_bytes, args)
+            finally:
+                stop_server(process)
+            print_summary(f'workers={workers}', results[f'workers={workers}'])
+        print('\nworker数与总吞吐量:')
+        for label, summary in results.items():
+            print(f"  {label:<14}{summary['throughput']:>10} 请求/秒")
+    else:
+        results[args.url] = run_once(args.url, ply_bytes, args)
+        print_summary(args.url, results[args.url])
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,204 @@
+import os
+import logging
+import numpy as np
+from plyfile import PlyElement
+from cloud_cache import read_ply
+from ply_io import PLY_TYPES, read_records
+
+logger = logging.getLogger(__name__)
+
+FACE_ELEMENT = 'face'
+FACE_INDEX_PROPS = ('vertex_indices', 'vertex_index')  # 常见的面片顶点索引属性名
+
+
+def face_index_property(header):
+    """返回面片元素的顶点索引列表属性，没有面片时返回None"""
+    element = header.element(FACE_ELEMENT)
+    if element is None:
+        return None
+    for prop in element.properties:
+        if prop.is_list and prop.name in FACE_INDEX_PROPS:
+            return prop
+    return None
+
+
+def _fixed_length_faces(path, header, prop):
+    """
+    二进制文件中所有面片顶点数相同 (如全是三角形) 时，把面片块映射为定长结构化数组
+
+    由第一个面片确定顶点数，再检查全部记录的长度字段；不满足条件时返回None。
+    """
+    element = header.element(FACE_ELEMENT)
+    offset = header.data_offset(FACE_ELEMENT)
+    if not header.is_binary or offset is None or element.count == 0:
+        return None
+    if any(p.is_list for p in element.properties if p is not prop):
+        return None
+    first = read_records(path, FACE_ELEMENT, 1, header)
+    size = len(first[prop.name][0])
+    order = header.byte_order
+    fields = []
+    for p in element.properties:
+        if p is prop:
+            fields.append((f'_len_{p.name}', order + PLY_TYPES[p.list_type]))
+            fields.append((p.name, order + PLY_TYPES[p.ply_type], (size,)))
+        else:
+            fields.append((p.name, order + PLY_TYPES[p.ply_type]))
+    dtype = np.dtype(fields)
+    if offset + dtype.itemsize * element.count > os.path.getsize(path):
+        return None
+    data = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(element.count,))
+    if not np.all(data[f'_len_{prop.name}'] == size):
+        return None
+    return data
+
+
+def read_faces(path, header):
+    """
+    读取面片，顶点索引转换为 (flat, lengths) 的压缩行形式
+
+    二进制三角网格等定长面片直接内存映射，不逐个解析；其他情况通过 plyfile 完整读取。
+
+    返回:
+        dict: data (面片结构化数组)、prop (索引属性)、flat (全部顶点索引)、lengths (每个面片的顶点数)；
+            没有面片时返回None
+    """
+    prop = face_index_property(header)
+    if prop is None:
+        return None
+    data = _fixed_length_faces(path, header, prop)
+    if data is not None:
+        indices = np.asarray(data[prop.name], dtype=np.int64)
+        lengths = np.full(len(data), indices.shape[1], dtype=np.int64)
+        return {'data': data, 'prop': prop, 'flat': indices.ravel(), 'lengths': lengths}
+
+    data = read_ply(path)[FACE_ELEMENT].data
+    column = data[prop.name]
+    lengths = np.fromiter((len(face) for face in column), dtype=np.int64, count=len(column))
+    flat = np.concatenate(list(column)).astype(np.int64) if lengths.sum() else np.zeros(0, dtype=np.int64)
+    return {'data': data, 'prop': prop, 'flat': flat, 'lengths': lengths}
+
+
+def remap_faces(flat, lengths, vertex_map, collapse=False):
+    """
+    通过 vertex_map (原顶点编号 -> 新顶点编号，删除的顶点为-1) 重映射面片，丢弃引用了已删除顶点的面片
+
+    collapse 为True时 (顶点聚类，多个顶点映射到同一个新顶点)，还丢弃不同顶点少于3个的退化面片，
+    顶点集合相同的重复面片只保留一个。
+
+    返回:
+        (keep, flat, lengths): 保留的原面片编号，以及重映射后的索引和每个面片的顶点数
+    """
+    count = len(lengths)
+    mapped = vertex_map[flat]
+    if count == 0:
+        return np.zeros(0, dtype=np.int64), mapped, lengths
+    face_id = np.repeat(np.arange(count), lengths)
+    starts = np.cumsum(lengths) - lengths
+
+    # 面片中的最小编号为-1说明引用了已删除的顶点
+    valid = lengths > 0
+    valid[valid] = np.minimum.reduceat(mapped, starts[valid]) >= 0
+
+    if collapse:
+        # 面片内按顶点编号排序 (面片之间的顺序不变)，统计不同顶点数
+        order = np.lexsort((mapped, face_id))
+        sorted_vertices = mapped[order]
+        new_vertex = np.ones(len(order), dtype=bool)
+        new_vertex[1:] = (face_id[1:] != face_id[:-1]) | (sorted_vertices[1:] != sorted_vertices[:-1])
+        valid &= np.bincount(face_id, weights=new_vertex, minlength=count) >= 3
+
+        # 顶点数相同的面片按排序后的顶点序列去重
+        for size in np.unique(lengths[valid]):
+            candidates = np.flatnonzero(valid & (lengths == size))
+            key = sorted_vertices[starts[candidates, None] + np.arange(size)]
+            _, first = np.unique(key, axis=0, return_index=True)
+            duplicate = np.ones(len(candidates), dtype=bool)
+            duplicate[first] = False
+            valid[candidates[duplicate]] = False
+
+    keep = np.flatnonzero(valid)
+    return keep, mapped[valid[face_id]], lengths[keep]
+
+
+def vertex_map_from_indices(indices, vertex_count):
+    """保留的顶点按 indices 的顺序重新编号，其余顶点映射为-1"""
+    vertex_map = np.full(vertex_count, -1, dtype=np.int64)
+    vertex_map[np.asarray(indices, dtype=np.int64)] = np.arange(len(indices))
+    return vertex_map
+
+
+def vertex_map_from_clusters(inverse, indices=None):
+    """
+    顶点聚类后的映射: 同一体素的顶点都映射到该体素的代表点
+
+    indices 为每个体素保留的原始顶点 (按原始顺序排列)；为None时输出按体素编号排列 (如体素质心)。
+    """
+    if indices is None:
+        return np.asarray(inverse, dtype=np.int64)
+    row_of_cluster = np.empty(int(inverse.max()) + 1, dtype=np.int64)
+    row_of_cluster[inverse[indices]] = np.arange(len(indices))
+    return row_of_cluster[inverse]
+
+
+def remap_face_data(faces, vertex_map, collapse=False):
+    """
+    重映射面片，返回保留的面片数据 (结构化数组)
+
+    面片的其他属性 (如面片颜色) 随保留的面片一起输出。
+    所有面片顶点数相同时索引列为定长子数组，写出时不需要逐个面片转换，否则为 object 列。
+    """
+    prop = faces['prop']
+    keep, flat, lengths = remap_faces(faces['flat'], faces['lengths'], vertex_map, collapse)
+    source = faces['data']
+    names = [name for name in source.dtype.names if not name.startswith('_len_')]
+    index_dtype = PLY_TYPES[prop.ply_type]
+    uniform = len(lengths) == 0 or np.all(lengths == lengths[0])
+    size = int(lengths[0]) if len(lengths) else 3
+
+    fields = []
+    for name in names:
+        if name == prop.name:
+            fields.append((name, index_dtype, (size,)) if uniform else (name, object))
+        else:
+            fields.append((name, source.dtype[name]))
+    data = np.empty(len(keep), dtype=fields)
+    for name in names:
+        if name != prop.name:
+            data[name] = source[name][keep]
+        elif uniform:
+            data[name] = flat.reshape(len(keep), size)
+        else:
+            for i, face in enumerate(np.split(flat.astype(index_dtype), np.cumsum(lengths)[:-1])):
+                data[name][i] = face
+    logger.info(f"面片重映射: 保留 {len(keep)}/{len(source)} 个面片")
+    return data
+
+
+def face_element(data, prop):
+    """构造面片的 PlyElement，列表属性的长度和数值类型与输入一致"""
+    return PlyElement.describe(data, FACE_ELEMENT, len_types={prop.name: PLY_TYPES[prop.list_type]},
+                               val_types={prop.name: PLY_TYPES[prop.ply_type]})
+
+
+def face_records(data, prop, byte_order):
+    """
+    把定长面片转换为二进制PLY的记录布局 (长度字段 + 定长索引 + 其他属性)，可以直接写出原始字节
+
+    面片顶点数不一致时返回None
+    """
+    if data.dtype[prop.name].shape == ():
+        return None
+    size = data.dtype[prop.name].shape[0]
+    fields = []
+    for name in data.dtype.names:
+        if name == prop.name:
+            fields.append((f'_len_{name}', byte_order + PLY_TYPES[prop.list_type]))
+            fields.append((name, byte_order + PLY_TYPES[prop.ply_type], (size,)))
+        else:
+            fields.append((name, data.dtype[name].newbyteorder(byte_order)))
+    records = np.empty(len(data), dtype=fields)
+    records[f'_len_{prop.name}'] = size
+    for name in data.dtype.names:
+        records[name] = data[name]
+    return records
@@ -0,0 +1,356 @@
+import io
+import os
+import json
+import time
+import uuid
+import atexit
+import pstats
+import cProfile
+import threading
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# 直方图的桶上限 (秒)，覆盖从毫秒级的缓存命中到分钟级的大文件降采样
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+BACKGROUND = 'background'  # 不在请求中执行时 (如启动时的预处理) 使用的 endpoint 标签
+PROFILE_TOP_FUNCTIONS = 30
+METRICS_DIR_ENV = 'METRICS_DIR'  # 多进程部署时各进程的指标快照目录，/metrics 汇总目录中的全部快照
+FLUSH_INTERVAL = 1.0  # 写出本进程快照的最短间隔 (秒)
+
+_context = threading.local()
+_profile_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_last_flush = 0.0
+# 快照文件名含随机后缀，进程号被复用时不会覆盖已退出进程的计数
+_snapshot_name = None
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    """
+    按标签分组的累积直方图，输出 Prometheus 文本格式
+
+    参数:
+        name (str): 指标名
+        help_text (str): 指标说明
+        label_names (tuple): 标签名，observe 时按相同顺序传入标签值
+    """
+
+    def __init__(self, name, help_text, label_names, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        labels = tuple(str(v) for v in labels)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+        flush_snapshot()
+
+    def snapshot(self):
+        """返回各标签组合的计数副本"""
+        with self._lock:
+            return {labels: dict(s, buckets=list(s['buckets'])) for labels, s in self._series.items()}
+
+    def render(self, series=None):
+        """输出 Prometheus 文本行，series 为None时使用本进程的计数"""
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        if series is None:
+            series = self.snapshot()
+        for labels in sorted(series):
+            s = series[labels]
+            base = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            prefix = base + ',' if base else ''
+            for bound, count in zip(self.buckets, s['buckets']):
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound:g}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {s["count"]}')
+            lines.append(f'{self.name}_sum{{{base}}} {s["sum"]:.6f}')
+            lines.append(f'{self.name}_count{{{base}}} {s["count"]}')
+        return lines
+
+
+REQUEST_SECONDS = Histogram('pointcloud_request_duration_seconds', '请求处理耗时 (含流式响应的发送)',
+                            ('endpoint', 'method', 'status'))
+STAGE_SECONDS = Histogram('pointcloud_stage_duration_seconds',
+                          '各处理阶段的耗时 (parse / extract / sample / serialize / write 等)',
+                          ('endpoint', 'stage'))
+
+
+def current_endpoint():
+    return getattr(_context, 'endpoint', None) or BACKGROUND
+
+
+def begin_request(endpoint, collect=False):
+    """标记当前线程开始处理请求，collect 为True时同时记录本请求的各阶段耗时"""
+    _context.endpoint = endpoint
+    _context.stages = [] if collect else None
+
+
+def end_request():
+    """结束当前线程的请求，返回本请求记录的阶段耗时列表 (未开启记录时为None)"""
+    stages = getattr(_context, 'stages', None)
+    _context.endpoint = None
+    _context.stages = None
+    return stages
+
+
+def record_stage(name, seconds, endpoint=None):
+    STAGE_SECONDS.observe((endpoint or current_endpoint(), name), seconds)
+    stages = getattr(_context, 'stages', None)
+    if stages is not None:
+        stages.append((name, seconds))
+
+
+@contextmanager
+def stage(name):
+    """记录代码块的耗时，计入当前请求 endpoint 的阶段直方图"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def timed_iter(name, iterable):
+    """
+    包装生成器，累计每次取值的耗时，迭代结束时记为一个阶段
+
+    流式响应的数据在请求处理函数返回之后才生成，endpoint 在调用时确定。
+    """
+    endpoint = current_endpoint()
+
+    def generate():
+        iterator = iter(iterable)
+        elapsed = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    elapsed += time.perf_counter() - start
+                    break
+                elapsed += time.perf_counter() - start
+                yield item
+        finally:
+            record_stage(name, elapsed, endpoint)
+
+    return generate()
+
+
+HISTOGRAMS = (REQUEST_SECONDS, STAGE_SECONDS)
+
+
+def metrics_dir():
+    return os.environ.get(METRICS_DIR_ENV) or None
+
+
+def flush_snapshot(force=False):
+    """
+    把本进程的计数写入 METRICS_DIR 下的快照文件 (未配置目录时不写)
+
+    非强制时最多每 FLUSH_INTERVAL 秒写一次，/metrics 汇总时强制写出本进程的最新计数。
+    """
+    global _last_flush, _snapshot_name
+    directory = metrics_dir()
+    if directory is None:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < FLUSH_INTERVAL:
+        return
+    if not _flush_lock.acquire(blocking=force):
+        return
+    try:
+        _last_flush = now
+        if _snapshot_name is None:
+            _snapshot_name = f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json'
+        data = {h.name: [[list(labels), series] for labels, series in h.snapshot().items()] for h in HISTOGRAMS}
+        path = os.path.join(directory, _snapshot_name)
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"写出指标快照失败: {str(e)}")
+    finally:
+        _flush_lock.release()
+
+
+def _merged_series(directory):
+    # 汇总目录中全部进程的快照 (包括已退出的进程，计数不会回退)
+    merged = {h.name: {} for h in HISTOGRAMS}
+    for name in os.listdir(directory):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for histogram_name, rows in data.items():
+            target = merged.get(histogram_name)
+            if target is None:
+                continue
+            for labels, series in rows:
+                labels = tuple(labels)
+                current = target.get(labels)
+                if current is None:
+                    target[labels] = dict(series, buckets=list(series['buckets']))
+                    continue
+                current['buckets'] = [a + b for a, b in zip(current['buckets'], series['buckets'])]
+                current['sum'] += series['sum']
+                current['count'] += series['count']
+    return merged
+
+
+def render_metrics():
+    """
+    返回 Prometheus 文本格式的全部指标
+
+    配置了 METRICS_DIR 时 (gunicorn 多worker部署) 汇总所有进程的快照，否则只输出本进程的计数。
+    """
+    directory = metrics_dir()
+    if directory is None:
+        lines = REQUEST_SECONDS.render() + STAGE_SECONDS.render()
+    else:
+        flush_snapshot(force=True)
+        merged = _merged_series(directory)
+        lines = []
+        for histogram in HISTOGRAMS:
+            lines += histogram.render(merged[histogram.name])
+    return '\n'.join(lines) + '\n'
+
+
+def _reset_after_fork():
+    # 子进程 (gunicorn worker、后台任务进程池) 从空计数开始并写自己的快照，汇总时不会重复计算父进程的计数
+    global _flush_lock, _last_flush, _snapshot_name
+    for histogram in HISTOGRAMS:
+        histogram._lock = threading.Lock()
+        histogram._series = {}
+    _flush_lock = threading.Lock()
+    _last_flush = 0.0
+    _snapshot_name = None
+
+
+if hasattr(os, 'register_at_fork'):  # Windows 没有 fork
+    os.register_at_fork(after_in_child=_reset_after_fork)
+# 进程退出前写出最后一次计数
+atexit.register(flush_snapshot, True)
+
+
+def profile_summary(profiler, limit=PROFILE_TOP_FUNCTIONS):
+    """将 cProfile 结果整理为按累计耗时排序的函数列表和 pstats 文本"""
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats('cumulative').print_stats(limit)
+    rows = []
+    for (filename, line, function), (_, calls, total, cumulative, _) in stats.stats.items():
+        rows.append({
+            'function': f'{filename}:{line}({function})',
+            'calls': calls,
+            'total_ms': round(total * 1000, 3),
+            'cumulative_ms': round(cumulative * 1000, 3)
+        })
+    rows.sort(key=lambda row: row['cumulative_ms'], reverse=True)
+    return rows[:limit], stream.getvalue()
+
+
+def init_app(app):
+    """
+    为Flask应用注册请求计时和 /metrics 接口
+
+    请求带 profile=1 参数时 (且 PROFILE_REQUESTS 配置开启，默认关闭)，用 cProfile 分析本次请求，
+    响应替换为JSON格式的阶段耗时和函数耗时报告。同一时刻只分析一个请求。
+    报告包含服务器的源码路径，且分析时整个响应体被读入内存，只应在调试时由运维开启 (PROFILE_REQUESTS=1)。
+    未配置 METRICS_DIR 时指标只属于本进程，后台任务 (子进程) 的阶段耗时不计入；多worker部署必须配置
+    METRICS_DIR (gunicorn.conf.py 会自动设置)，否则每次抓取只能看到处理该请求的worker的计数。
+    """
+    from flask import request, g, jsonify, Response
+
+    app.config.setdefault('PROFILE_REQUESTS', False)
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+        g.profiler = None
+        profile = request.args.get('profile') == '1' and app.config['PROFILE_REQUESTS']
+        if profile and _profile_lock.acquire(blocking=False):
+            g.profiler = cProfile.Profile()
+        begin_request(request.endpoint or 'unknown', collect=profile)
+        if g.profiler is not None:
+            g.profiler.enable()
+
+    @app.after_request
+    def _finish_timer(response):
+        endpoint = request.endpoint or 'unknown'
+        start = g.get('metrics_start')
+        if start is None:
+            return response
+        labels = (endpoint, request.method, response.status_code)
+        if request.args.get('profile') == '1' and app.config['PROFILE_REQUESTS']:
+            response = _profile_response(response, endpoint, start)
+        end_request()
+
+        if response.direct_passthrough:
+            # send_file 的文件响应由服务器直接发送，不会调用 call_on_close 注册的回调
+            REQUEST_SECONDS.observe(labels, time.perf_counter() - start)
+        else:
+            # 流式响应在发送完成后才计入总耗时
+            response.call_on_close(lambda: REQUEST_SECONDS.observe(labels, time.perf_counter() - start))
+        return response
+
+    @app.teardown_request
+    def _clear_context(error=None):
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            # 请求异常中断时 after_request 不会执行，这里释放分析器
+            profiler.disable()
+            _profile_lock.release()
+        end_request()
+
+    def _profile_response(response, endpoint, start):
+        # 在分析器开启时读完响应体，使流式响应的序列化耗时也计入报告
+        response.direct_passthrough = False
+        body_size = len(response.get_data())
+        total = time.perf_counter() - start
+        profiler = g.pop('profiler', None)
+        report = {
+            'endpoint': endpoint,
+            'status': response.status_code,
+            'content_type': response.content_type,
+            'content_length': body_size,
+            'total_ms': round(total * 1000, 3),
+            'stages': [{'stage': name, 'ms': round(seconds * 1000, 3)}
+                       for name, seconds in (getattr(_context, 'stages', None) or [])]
+        }
+        if profiler is not None:
+            profiler.disable()
+            _profile_lock.release()
+            report['functions'], report['profile'] = profile_summary(profiler)
+        else:
+            report['functions'] = None
+            report['profile'] = '其他请求正在分析中，本次只记录阶段耗时'
+        logger.info(f"请求分析 {endpoint}: 总耗时 {report['total_ms']} ms，阶段 {report['stages']}")
+        return jsonify(report)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Prometheus 格式的请求和阶段耗时直方图"""
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,179 @@
+import os
+import re
+import json
+import shutil
+import threading
+import logging
+import numpy as np
+from columnar import read_columns
+from downsample import grid_cell_ids, stratified_indices
+from pointstream import iter_binary
+from file_lock import FileLock, forget
+
+logger = logging.getLogger(__name__)
+
+LOD_SUFFIX = '.lod'  # LOD数据保存在 uploads/<文件名>.lod/ 目录
+HIERARCHY_FILE = 'hierarchy.json'
+LOD_VERSION = 1
+MAX_POINTS_PER_NODE = 65536  # 每个节点最多保存的点数
+MAX_DEPTH = 16  # 超过该深度的节点直接保存剩余全部点，避免重复点导致无限细分
+NODE_ID_PATTERN = re.compile(r'^r[0-7]*$')  # 节点编号: 根节点为 r，子节点依次追加八分体编号
+
+_build_lock = threading.Lock()
+
+
+def lod_dir(path):
+    return path + LOD_SUFFIX
+
+
+def node_path(path, node_id):
+    """返回节点数据文件路径，节点编号无效时返回None"""
+    if not NODE_ID_PATTERN.match(node_id):
+        return None
+    return os.path.join(lod_dir(path), f'{node_id}.bin')
+
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def load_hierarchy(path):
+    """读取已构建的LOD层级，源文件已变化或尚未构建时返回None"""
+    hierarchy_path = os.path.join(lod_dir(path), HIERARCHY_FILE)
+    if not os.path.exists(hierarchy_path):
+        return None
+    try:
+        with open(hierarchy_path, 'r', encoding='utf-8') as f:
+            hierarchy = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"读取LOD层级失败: {str(e)}")
+        return None
+    if hierarchy.get('version') != LOD_VERSION or hierarchy.get('source') != _source_signature(path):
+        return None
+    return hierarchy
+
+
+def build_lod(path, max_points_per_node=MAX_POINTS_PER_NODE):
+    """
+    为点云构建八叉树LOD层级 (Potree风格)
+
+    每个节点保存其空间范围内最多 max_points_per_node 个按网格分层采样的点，
+    其余点分配到8个子节点继续细分。根节点即为整个点云的粗略预览，
+    逐层加载子节点后可以得到完整点云 (所有节点的点互不重复)。
+
+    节点数据使用与 /api/pointcloud?format=binary 相同的二进制格式。
+
+    参数:
+        path (str): PLY文件路径
+        max_points_per_node (int): 每个节点的最大点数
+
+    返回:
+        dict: 层级信息，同时写入 <path>.lod/hierarchy.json
+    """
+    logger.info(f"开始构建LOD八叉树: {path}，每节点最多 {max_points_per_node} 个点")
+    vertex = read_columns(path)
+    count = len(vertex)
+    names = ['x', 'y', 'z']
+    if all(c in vertex.dtype.names for c in ('red', 'green', 'blue')):
+        names += ['red', 'green', 'blue']
+    columns = {name: np.asarray(vertex[name]) for name in names}
+
+    # 八叉树使用立方体包围盒，边长取最长轴
+    coords = [columns[name].astype(np.float64) for name in ('x', 'y', 'z')]
+    if count > 0:
+        lo = np.array([c.min() for c in coords])
+        size = float(max(c.max() - l for c, l in zip(coords, lo)))
+    else:
+        lo, size = np.zeros(3), 0.0
+    size = size or 1.0
+
+    # 先写入临时目录，完成后整体替换，避免读取到构建一半的数据
+    target = lod_dir(path)
+    staging = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if os.path.exists(staging):
+        shutil.rmtree(staging)
+    os.makedirs(staging)
+
+    rng = np.random.default_rng(0)
+    grid_size = max(1, int(round(max_points_per_node ** (1 / 3))))
+    nodes = {}
+    stack = [('r', np.arange(count), lo, size, 0)]
+    while stack:
+        node_id, idx, origin, node_size, level = stack.pop()
+
+        if len(idx) <= max_points_per_node or level >= MAX_DEPTH:
+            keep, rest = idx, idx[:0]
+        else:
+            bounds = (origin, origin + node_size)
+            cells = grid_cell_ids(coords[0][idx], coords[1][idx], coords[2][idx], grid_size, bounds)
+            selected = stratified_indices(cells, max_points_per_node / len(idx), max_points_per_node, rng)
+            mask = np.zeros(len(idx), dtype=bool)
+            mask[selected] = True
+            keep, rest = idx[mask], idx[~mask]
+
+        children = []
+        if len(rest):
+            half = node_size / 2
+            mid = origin + half
+            octant = ((coords[0][rest] >= mid[0]).astype(np.int64) << 2) \
+                | ((coords[1][rest] >= mid[1]).astype(np.int64) << 1) \
+                | (coords[2][rest] >= mid[2]).astype(np.int64)
+            for o in np.unique(octant):
+                child_origin = origin + half * np.array([(o >> 2) & 1, (o >> 1) & 1, o & 1])
+                child_id = f'{node_id}{o}'
+                children.append(child_id)
+                stack.append((child_id, rest[octant == o], child_origin, half, level + 1))
+
+        node_columns = {name: values[keep] for name, values in columns.items()}
+        with open(os.path.join(staging, f'{node_id}.bin'), 'wb') as f:
+            for block in iter_binary(node_columns, len(keep)):
+                f.write(block)
+
+        nodes[node_id] = {
+            'level': level,
+            'count': int(len(keep)),
+            'bounds': [origin.tolist(), (origin + node_size).tolist()],
+            'children': sorted(children)
+        }
+
+    hierarchy = {
+        'version': LOD_VERSION,
+        'source': _source_signature(path),
+        'total_points': int(count),
+        'has_colors': len(names) == 6,
+        'max_points_per_node': max_points_per_node,
+        'bounds': [lo.tolist(), (lo + size).tolist()],
+        'nodes': nodes
+    }
+    with open(os.path.join(staging, HIERARCHY_FILE), 'w', encoding='utf-8') as f:
+        json.dump(hierarchy, f)
+
+    if os.path.exists(target):
+        shutil.rmtree(target)
+    os.replace(staging, target)
+    logger.info(f"LOD八叉树构建完成: {len(nodes)} 个节点，保存到 {target}")
+    return hierarchy
+
+
+def ensure_lod(path):
+    """返回最新的LOD层级，不存在或已过期时重新构建"""
+    hierarchy = load_hierarchy(path)
+    if hierarchy is not None:
+        return hierarchy
+    # 多个worker可能同时为同一文件构建，文件锁保证只构建一次，其他进程等待后直接读取结果
+    with _build_lock, FileLock(f'{lod_dir(path)}.lock'):
+        hierarchy = load_hierarchy(path)
+        if hierarchy is None:
+            hierarchy = build_lod(path)
+    return hierarchy
+
+
+def remove_lod(path):
+    """删除文件对应的LOD数据"""
+    target = lod_dir(path)
+    if os.path.exists(target):
+        shutil.rmtree(target, ignore_errors=True)
+    if os.path.exists(f'{target}.lock'):
+        os.unlink(f'{target}.lock')
+        forget(f'{target}.lock')
@@ -0,0 +1,128 @@
+import os
+import json
+import zlib
+import gzip
+import shutil
+import threading
+import logging
+import numpy as np
+from columnar import read_columns
+from pointstream import encode_quantized
+
+try:
+    import brotli  # 可选依赖，未安装时不提供 br 压缩
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+PAYLOAD_SUFFIX = '.enc'  # 编码后的数据保存在 uploads/<文件名>.enc/ 目录
+SOURCE_FILE = 'source.json'
+COMPRESSION_LEVEL = 6
+
+# 按优先级排列的传输压缩方式，identity 表示不压缩
+COMPRESSORS = {
+    'identity': lambda data: data,
+    'gzip': lambda data: gzip.compress(data, COMPRESSION_LEVEL, mtime=0),
+    'deflate': lambda data: zlib.compress(data, COMPRESSION_LEVEL)
+}
+if brotli is not None:
+    COMPRESSORS['br'] = lambda data: brotli.compress(data, quality=5)
+ENCODING_PREFERENCE = ('br', 'gzip', 'deflate')
+
+_encode_lock = threading.Lock()
+
+
+def payload_dir(path):
+    return path + PAYLOAD_SUFFIX
+
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def negotiate_encoding(accept_encodings):
+    """
+    根据请求的 Accept-Encoding 选择压缩方式
+
+    参数:
+        accept_encodings: werkzeug 的 request.accept_encodings
+
+    返回:
+        str: 'br'、'gzip'、'deflate' 或 'identity'
+    """
+    available = [name for name in ENCODING_PREFERENCE if name in COMPRESSORS]
+    return accept_encodings.best_match(available) or 'identity'
+
+
+def _check_source(path):
+    """源文件变化后清空旧的编码数据"""
+    directory = payload_dir(path)
+    signature = _source_signature(path)
+    source_path = os.path.join(directory, SOURCE_FILE)
+    try:
+        with open(source_path, 'r', encoding='utf-8') as f:
+            if json.load(f) == signature:
+                return directory
+    except (OSError, ValueError):
+        pass
+    if os.path.exists(directory):
+        shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+    with open(source_path, 'w', encoding='utf-8') as f:
+        json.dump(signature, f)
+    return directory
+
+
+def quantized_payload(path, order='morton', delta=True, encoding='identity'):
+    """
+    返回量化点云数据的缓存文件路径，不存在时编码并压缩后写入
+
+    同一文件、同一参数只编码一次，之后直接从磁盘发送。
+
+    参数:
+        path (str): PLY文件路径
+        order (str): 'none' 或 'morton'
+        delta (bool): 是否对坐标做差分编码
+        encoding (str): 传输压缩方式，见 COMPRESSORS
+
+    返回:
+        str: 缓存文件路径
+    """
+    if encoding not in COMPRESSORS:
+        raise ValueError(f'不支持的压缩方式: {encoding}')
+
+    with _encode_lock:
+        directory = _check_source(path)
+        variant = f"q16-{order}{'-delta' if delta else ''}.bin"
+        target = os.path.join(directory, variant if encoding == 'identity' else f'{variant}.{encoding}')
+        if os.path.exists(target):
+            return target
+
+        raw_path = os.path.join(directory, variant)
+        if os.path.exists(raw_path):
+            with open(raw_path, 'rb') as f:
+                data = f.read()
+        else:
+            vertex = read_columns(path)
+            names = ['x', 'y', 'z']
+            if all(c in vertex.dtype.names for c in ('red', 'green', 'blue')):
+                names += ['red', 'green', 'blue']
+            columns = {name: np.asarray(vertex[name]) for name in names}
+            data = encode_quantized(columns, len(vertex), order, delta)
+
+        payload = COMPRESSORS[encoding](data)
+        temp_path = f'{target}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(temp_path, target)
+        logger.info(f"已生成量化点云缓存 {target}: {len(data)} -> {len(payload)} 字节")
+        return target
+
+
+def remove_payloads(path):
+    """删除文件对应的编码缓存"""
+    directory = payload_dir(path)
+    if os.path.exists(directory):
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,379 @@
+import numpy as np
+import logging
+from itertools import islice
+
+logger = logging.getLogger(__name__)
+
+# PLY标量类型到NumPy类型的映射
+PLY_TYPES = {
+    'char': 'i1', 'int8': 'i1',
+    'uchar': 'u1', 'uint8': 'u1',
+    'short': 'i2', 'int16': 'i2',
+    'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4',
+    'uint': 'u4', 'uint32': 'u4',
+    'float': 'f4', 'float32': 'f4',
+    'double': 'f8', 'float64': 'f8'
+}
+
+# NumPy类型到PLY类型名的映射，用于写出头部
+NUMPY_TO_PLY = {
+    'i1': 'char', 'u1': 'uchar',
+    'i2': 'short', 'u2': 'ushort',
+    'i4': 'int', 'u4': 'uint',
+    'f4': 'float', 'f8': 'double'
+}
+
+BYTE_ORDERS = {
+    'ascii': '=',
+    'binary_little_endian': '<',
+    'binary_big_endian': '>'
+}
+
+MAX_HEADER_BYTES = 1024 * 1024  # 头部超过1MB视为无效文件
+
+
+class PlyProperty:
+    """PLY属性描述，列表属性的 list_type 为长度字段的类型"""
+
+    def __init__(self, name, ply_type, list_type=None):
+        self.name = name
+        self.ply_type = ply_type
+        self.list_type = list_type
+
+    @property
+    def is_list(self):
+        return self.list_type is not None
+
+    def describe(self):
+        """返回与PLY头部一致的类型描述，例如 'float' 或 'list uchar int'"""
+        if self.is_list:
+            return f'list {self.list_type} {self.ply_type}'
+        return self.ply_type
+
+
+class PlyElementHeader:
+    """PLY元素描述: 名称、数量和属性列表"""
+
+    def __init__(self, name, count):
+        self.name = name
+        self.count = count
+        self.properties = []
+
+    @property
+    def has_lists(self):
+        return any(prop.is_list for prop in self.properties)
+
+    def dtype(self, byte_order='='):
+        """返回该元素的结构化dtype，含列表属性时返回None"""
+        if self.has_lists:
+            return None
+        return np.dtype([(prop.name, byte_order + PLY_TYPES[prop.ply_type]) for prop in self.properties])
+
+
+class PlyHeader:
+    """解析后的PLY头部信息"""
+
+    def __init__(self):
+        self.format = None
+        self.version = None
+        self.elements = []
+        self.comments = []
+        self.obj_info = []
+        self.header_size = 0  # 头部字节数，即数据区的起始偏移
+
+    @property
+    def byte_order(self):
+        return BYTE_ORDERS[self.format]
+
+    @property
+    def is_binary(self):
+        return self.format != 'ascii'
+
+    def element(self, name):
+        for element in self.elements:
+            if element.name == name:
+                return element
+        return None
+
+    def data_offset(self, name):
+        """
+        计算二进制文件中某元素数据块的字节偏移
+
+        前面的元素若含列表属性则无法直接计算，返回None
+        """
+        offset = self.header_size
+        for element in self.elements:
+            if element.name == name:
+                return offset
+            dtype = element.dtype(self.byte_order)
+            if dtype is None:
+                return None
+            offset += dtype.itemsize * element.count
+        return None
+
+
+def parse_header(stream):
+    """
+    从二进制流中解析PLY头部，读取位置停在数据区起始处
+
+    参数:
+        stream: 以二进制模式打开的文件对象
+
+    返回:
+        PlyHeader: 头部信息
+    """
+    header = PlyHeader()
+    magic = stream.readline()
+    if magic.strip() != b'ply':
+        raise ValueError('不是有效的PLY文件: 缺少 ply 标识')
+
+    size = len(magic)
+    current = None
+    while True:
+        raw = stream.readline()
+        if not raw:
+            raise ValueError('PLY头部不完整: 缺少 end_header')
+        size += len(raw)
+        if size > MAX_HEADER_BYTES:
+            raise ValueError('PLY头部过长')
+
+        line = raw.decode('ascii', errors='replace').strip()
+        if not line:
+            continue
+        keyword, _, rest = line.partition(' ')
+
+        if keyword == 'format':
+            fmt, _, version = rest.partition(' ')
+            if fmt not in BYTE_ORDERS:
+                raise ValueError(f'未知的PLY格式: {fmt}')
+            header.format = fmt
+            header.version = version.strip()
+        elif keyword == 'comment':
+            header.comments.append(rest)
+        elif keyword == 'obj_info':
+            header.obj_info.append(rest)
+        elif keyword == 'element':
+            fields = rest.split()
+            if len(fields) != 2:
+                raise ValueError(f'无效的element定义: {line}')
+            current = PlyElementHeader(fields[0], int(fields[1]))
+            header.elements.append(current)
+        elif keyword == 'property':
+            if current is None:
+                raise ValueError(f'property 出现在 element 之前: {line}')
+            fields = rest.split()
+            if fields[0] == 'list':
+                if len(fields) != 4 or fields[1] not in PLY_TYPES or fields[2] not in PLY_TYPES:
+                    raise ValueError(f'无效的列表属性定义: {line}')
+                current.properties.append(PlyProperty(fields[3], fields[2], fields[1]))
+            else:
+                if len(fields) != 2 or fields[0] not in PLY_TYPES:
+                    raise ValueError(f'无效的属性定义: {line}')
+                current.properties.append(PlyProperty(fields[1], fields[0]))
+        elif keyword == 'end_header':
+            break
+        else:
+            raise ValueError(f'无法识别的头部行: {line}')
+
+    if header.format is None:
+        raise ValueError('PLY头部缺少 format 行')
+    header.header_size = size
+    return header
+
+
+def read_header(path):
+    """只读取PLY文件的头部"""
+    with open(path, 'rb') as f:
+        return parse_header(f)
+
+
+def memmap_element(path, name='vertex', header=None, mode='r'):
+    """
+    将二进制PLY文件中的某个元素映射为结构化的 np.memmap
+
+    ascii文件、含列表属性的元素或无法计算偏移时返回None，由调用方回退到完整解析
+    """
+    if header is None:
+        header = read_header(path)
+    element = header.element(name)
+    if element is None or not header.is_binary:
+        return None
+
+    dtype = element.dtype(header.byte_order)
+    offset = header.data_offset(name)
+    if dtype is None or offset is None:
+        return None
+    if element.count == 0:
+        return np.zeros(0, dtype=dtype)
+
+    return np.memmap(path, dtype=dtype, mode=mode, offset=offset, shape=(element.count,))
+
+
+def iter_element_chunks(path, name='vertex', chunk_size=1000000, header=None):
+    """
+    按固定点数分块读取某个元素，内存占用与文件大小无关
+
+    二进制文件对内存映射分片，ascii文件逐行解析。元素含列表属性时无法分块读取。
+
+    返回:
+        generator: 依次产生结构化数组块
+    """
+    if header is None:
+        header = read_header(path)
+    element = header.element(name)
+    if element is None:
+        raise ValueError(f'PLY文件中没有 {name} 元素')
+    if element.has_lists:
+        raise ValueError(f'{name} 元素包含列表属性，无法分块读取')
+
+    if header.is_binary:
+        data = memmap_element(path, name, header)
+        if data is None:
+            raise ValueError(f'无法定位 {name} 元素的数据块')
+        for start in range(0, element.count, chunk_size):
+            yield data[start:start + chunk_size]
+        return
+
+    # ascii: 跳过头部和前面元素的记录 (每条记录占一行)
+    dtype = element.dtype()
+    skip = 0
+    for other in header.elements:
+        if other.name == name:
+            break
+        skip += other.count
+    with open(path, 'rb') as f:
+        f.seek(header.header_size)
+        for _ in islice(f, skip):
+            pass
+        remaining = element.count
+        while remaining > 0:
+            lines = list(islice(f, min(chunk_size, remaining)))
+            if not lines:
+                raise ValueError(f'{name} 元素的记录数不足')
+            remaining -= len(lines)
+            yield np.loadtxt([line.decode('ascii') for line in lines], dtype=dtype, ndmin=1)
+
+
+def _record_dtype(element, byte_order):
+    # 列表属性以 object 字段保存
+    return np.dtype([(prop.name, object if prop.is_list else byte_order + PLY_TYPES[prop.ply_type])
+                     for prop in element.properties])
+
+
+def _read_exact(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError('PLY文件数据不完整')
+    return data
+
+
+def _read_binary_record(stream, element, byte_order):
+    values = []
+    for prop in element.properties:
+        dtype = np.dtype(byte_order + PLY_TYPES[prop.ply_type])
+        if prop.is_list:
+            size_dtype = np.dtype(byte_order + PLY_TYPES[prop.list_type])
+            size = int(np.frombuffer(_read_exact(stream, size_dtype.itemsize), size_dtype)[0])
+            values.append(np.frombuffer(_read_exact(stream, size * dtype.itemsize), dtype).copy())
+        else:
+            values.append(np.frombuffer(_read_exact(stream, dtype.itemsize), dtype)[0])
+    return values
+
+
+def _parse_ascii_record(line, element):
+    tokens = line.split()
+    position = 0
+    values = []
+    for prop in element.properties:
+        dtype = PLY_TYPES[prop.ply_type]
+        if prop.is_list:
+            size = int(tokens[position])
+            items = tokens[position + 1:position + 1 + size]
+            if len(items) != size:
+                raise ValueError(f'{element.name} 元素的记录不完整: {line.strip()}')
+            values.append(np.array(items, dtype=float).astype(dtype))
+            position += 1 + size
+        else:
+            if position >= len(tokens):
+                raise ValueError(f'{element.name} 元素的记录不完整: {line.strip()}')
+            values.append(np.array(float(tokens[position])).astype(dtype)[()])
+            position += 1
+    return values
+
+
+def read_records(path, name='vertex', count=5, header=None):
+    """
+    只读取某个元素的前 count 条记录，耗时与文件大小无关
+
+    二进制文件直接定位到元素的数据块读取 (元素含列表属性时逐条解析)，ascii文件跳过前面元素的行后逐行读取。
+    列表属性以 object 字段返回。二进制文件中位于含列表属性的元素之后的元素无法直接定位，返回None。
+
+    返回:
+        np.ndarray: 结构化数组，元素不存在时返回None
+    """
+    if header is None:
+        header = read_header(path)
+    element = header.element(name)
+    if element is None:
+        return None
+    count = min(count, element.count)
+    byte_order = header.byte_order if header.is_binary else '='
+    result = np.empty(count, dtype=_record_dtype(element, byte_order))
+
+    with open(path, 'rb') as f:
+        if header.is_binary:
+            offset = header.data_offset(name)
+            if offset is None:
+                return None
+            f.seek(offset)
+            if not element.has_lists:
+                data = np.frombuffer(_read_exact(f, element.dtype(byte_order).itemsize * count),
+                                     dtype=element.dtype(byte_order))
+                return data.copy()
+            records = [_read_binary_record(f, element, byte_order) for _ in range(count)]
+        else:
+            skip = 0
+            for other in header.elements:
+                if other.name == name:
+                    break
+                skip += other.count
+            f.seek(header.header_size)
+            for _ in islice(f, skip):
+                pass
+            lines = list(islice(f, count))
+            if len(lines) != count:
+                raise ValueError(f'{name} 元素的记录数不足')
+            records = [_parse_ascii_record(line.decode('ascii'), element) for line in lines]
+
+    for i, values in enumerate(records):
+        for prop, value in zip(element.properties, values):
+            result[prop.name][i] = value
+    return result
+
+
+def write_header(stream, fmt, elements, comments=()):
+    """
+    写出PLY头部
+
+    参数:
+        stream: 以二进制模式打开的文件对象
+        fmt (str): 'ascii'、'binary_little_endian' 或 'binary_big_endian'
+        elements (list): (元素名, 数量, 结构化dtype 或 PlyProperty 列表) 列表，含列表属性的元素使用后者
+        comments (list): 注释行
+    """
+    lines = ['ply', f'format {fmt} 1.0']
+    lines += [f'comment {comment}' for comment in comments]
+    for name, count, dtype in elements:
+        lines.append(f'element {name} {count}')
+        if not isinstance(dtype, np.dtype):
+            lines += [f'property {prop.describe()} {prop.name}' for prop in dtype]
+            continue
+        for field in dtype.names:
+            field_dtype = dtype.fields[field][0]
+            key = f'{field_dtype.kind}{field_dtype.itemsize}'
+            if key not in NUMPY_TO_PLY:
+                raise ValueError(f'无法写出的数据类型: {field_dtype}')
+            lines.append(f'property {NUMPY_TO_PLY[key]} {field}')
+    lines.append('end_header')
+    stream.write(('\n'.join(lines) + '\n').encode('ascii'))
@@ -0,0 +1,194 @@
+import struct
+import numpy as np
+
+# 二进制点云传输格式 (小端序)
+#
+#   偏移  长度  字段
+#   0     4     magic: b'PCLD'
+#   4     1     version: 1
+#   5     1     layout: 0 = interleaved (xyzxyz..., rgbrgb...), 1 = planar (xx..yy..zz.., rr..gg..bb..)
+#   6     1     flags: bit0 = 含颜色
+#   7     1     保留
+#   8     4     point count (uint32)
+#   12    4     保留
+#
+# 头部之后依次是 count*3 个 float32 坐标，若含颜色再接 count*3 个 uint8 颜色。
+# 头部长度为16字节，保证坐标区按4字节对齐，前端可以直接用 Float32Array 包装。
+
+BINARY_MAGIC = b'PCLD'
+BINARY_VERSION = 1
+HEADER_SIZE = 16
+LAYOUTS = {'interleaved': 0, 'planar': 1}
+FLAG_COLORS = 0x01
+CHUNK_POINTS = 1 << 20  # 每次输出的点数，约12MB坐标数据
+
+_HEADER_STRUCT = struct.Struct('<4sBBBBII')
+
+
+def pack_header(count, layout='interleaved', has_colors=False):
+    """生成二进制点云的16字节头部"""
+    flags = FLAG_COLORS if has_colors else 0
+    return _HEADER_STRUCT.pack(BINARY_MAGIC, BINARY_VERSION, LAYOUTS[layout], flags, 0, count, 0)
+
+
+def payload_size(count, has_colors=False):
+    """计算完整响应的字节数，用于设置 Content-Length"""
+    return HEADER_SIZE + count * 12 + (count * 3 if has_colors else 0)
+
+
+def to_uint8(channel):
+    """将颜色通道转换为uint8，超出范围的值被截断"""
+    channel = np.asarray(channel)
+    if channel.dtype == np.uint8:
+        return channel
+    return np.clip(channel, 0, 255).astype(np.uint8)
+
+
+def iter_binary(columns, count, layout='interleaved', chunk_points=CHUNK_POINTS):
+    """
+    以分块方式生成二进制点云数据，避免一次性构造完整的大数组
+
+    参数:
+        columns (dict): 属性名到NumPy数组的映射，至少包含 x, y, z，可选 red, green, blue
+        count (int): 点数
+        layout (str): 'interleaved' 或 'planar'
+        chunk_points (int): 每块包含的点数
+
+    返回:
+        generator: 依次产生 bytes 块
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f'未知的数据布局: {layout}')
+
+    has_colors = all(name in columns for name in ('red', 'green', 'blue'))
+    yield pack_header(count, layout, has_colors)
+
+    groups = [(('x', 'y', 'z'), np.dtype('<f4'))]
+    if has_colors:
+        groups.append((('red', 'green', 'blue'), None))
+
+    for names, dtype in groups:
+        if layout == 'interleaved':
+            for start in range(0, count, chunk_points):
+                stop = min(start + chunk_points, count)
+                block = np.empty((stop - start, 3), dtype=dtype or np.uint8)
+                for axis, name in enumerate(names):
+                    values = columns[name][start:stop]
+                    block[:, axis] = values if dtype is not None else to_uint8(values)
+                yield block.tobytes()
+        else:
+            for name in names:
+                for start in range(0, count, chunk_points):
+                    values = columns[name][start:start + chunk_points]
+                    if dtype is not None:
+                        yield np.asarray(values, dtype=dtype).tobytes()
+                    else:
+                        yield to_uint8(values).tobytes()
+
+
+# 量化点云格式 (小端序)，坐标相对包围盒量化为16位整数
+#
+#   偏移  长度  字段
+#   0     4     magic: b'PCLQ'
+#   4     1     version: 1
+#   5     1     保留
+#   6     1     flags: bit0 = 含颜色, bit1 = Morton顺序, bit2 = 坐标差分编码
+#   7     1     保留
+#   8     4     point count (uint32)
+#   12    4     保留
+#   16    24    scale: 3 x float64
+#   40    24    offset: 3 x float64
+#
+# 头部之后是 count*3 个 uint16 坐标 (xyzxyz...)，若含颜色再接 count*3 个 uint8 颜色。
+# 还原公式: 坐标 = offset + q * scale。差分编码时 q 保存与前一点的差值 (按uint16回绕)，
+# 前端做一次前缀和即可还原。
+
+QUANTIZED_MAGIC = b'PCLQ'
+QUANTIZED_VERSION = 1
+QUANTIZED_HEADER_SIZE = 64
+FLAG_MORTON = 0x02
+FLAG_DELTA = 0x04
+QUANTIZE_LEVELS = 65535
+ORDERS = ('none', 'morton')
+
+_QUANTIZED_STRUCT = struct.Struct('<4sBBBBII3d3d')
+
+
+def quantize_positions(x, y, z):
+    """
+    将坐标相对包围盒量化为uint16
+
+    返回:
+        (q, scale, offset): (N, 3) 的uint16数组、每轴的缩放和偏移
+    """
+    q = np.empty((len(x), 3), dtype=np.uint16)
+    scale = np.ones(3)
+    offset = np.zeros(3)
+    for axis, values in enumerate((x, y, z)):
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            continue
+        lo, hi = values.min(), values.max()
+        offset[axis] = lo
+        if hi > lo:
+            scale[axis] = (hi - lo) / QUANTIZE_LEVELS
+        q[:, axis] = np.rint((values - lo) / scale[axis])
+    return q, scale, offset
+
+
+def _spread_bits(v):
+    """把16位整数的每一位间隔两位展开，用于计算Morton码"""
+    v = v.astype(np.uint64)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x0000FF0000FF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00F00F00F00F)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0C30C30C30C3)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x249249249249)
+    return v
+
+
+def morton_order(q):
+    """返回按量化坐标Morton码 (Z序) 排序的索引，空间上相邻的点在数据中也相邻"""
+    codes = (_spread_bits(q[:, 0]) << np.uint64(2)) | (_spread_bits(q[:, 1]) << np.uint64(1)) | _spread_bits(q[:, 2])
+    return np.argsort(codes, kind='stable')
+
+
+def encode_quantized(columns, count, order='none', delta=False):
+    """
+    生成量化点云数据
+
+    参数:
+        columns (dict): 属性名到NumPy数组的映射，至少包含 x, y, z，可选 red, green, blue
+        count (int): 点数
+        order (str): 'none' 保持原始顺序，'morton' 按Morton码排序 (配合压缩效果更好)
+        delta (bool): 坐标是否做差分编码
+
+    返回:
+        bytes: 完整的量化点云数据
+    """
+    if order not in ORDERS:
+        raise ValueError(f'未知的点排序方式: {order}')
+
+    has_colors = all(name in columns for name in ('red', 'green', 'blue'))
+    q, scale, offset = quantize_positions(columns['x'], columns['y'], columns['z'])
+
+    permutation = morton_order(q) if order == 'morton' else None
+    if permutation is not None:
+        q = q[permutation]
+    if delta and count > 0:
+        # uint16 减法自动回绕，前端按uint16做前缀和还原
+        q[1:] = np.diff(q, axis=0)
+
+    flags = (FLAG_COLORS if has_colors else 0) | (FLAG_MORTON if permutation is not None else 0) \
+        | (FLAG_DELTA if delta else 0)
+    parts = [_QUANTIZED_STRUCT.pack(QUANTIZED_MAGIC, QUANTIZED_VERSION, 0, flags, 0, count, 0,
+                                    *scale, *offset),
+             q.astype('<u2').tobytes()]
+
+    if has_colors:
+        colors = np.empty((count, 3), dtype=np.uint8)
+        for axis, name in enumerate(('red', 'green', 'blue')):
+            colors[:, axis] = to_uint8(columns[name])
+        if permutation is not None:
+            colors = colors[permutation]
+        parts.append(colors.tobytes())
+    return b''.join(parts)
@@ -0,0 +1,430 @@
+import os
+import json
+import threading
+import logging
+import numpy as np
+from cloud_cache import read_vertex
+from columnar import read_columns
+
+logger = logging.getLogger(__name__)
+
+STATS_SUFFIX = '.stats.json'  # 点云统计信息保存在 uploads/<文件名>.stats.json
+STATS_VERSION = 1
+STATS_SAMPLE_POINTS = 1000000  # 分位数按最多这么多个点的样本估计
+SPACING_SAMPLE_POINTS = 20000  # 点间距按这么多个点的最近邻距离估计
+ROBUST_QUANTILE = 0.001  # 稳健包围盒去掉两端各0.1%的点
+COLOR_PROPS = ('red', 'green', 'blue')
+
+OUTLIER_METHODS = ('statistical', 'radius')
+DEFAULT_NEIGHBORS = 8  # 统计滤波的近邻数
+DEFAULT_STD_RATIO = 2.0  # 平均近邻距离超过 均值 + std_ratio * 标准差 的点视为离群点
+DEFAULT_MIN_NEIGHBORS = 4  # 半径滤波中半径内至少需要的近邻数
+DEFAULT_RADIUS_SPACING = 5.0  # 未指定半径时取典型点间距的倍数
+QUERY_CHUNK_POINTS = 65536  # 邻域查询每批的点数
+MAX_PAIRS = 1 << 23  # 每批展开的候选点对上限，限制内存占用
+CELL_SIZE_STEPS = 6  # 估计邻域网格边长的最大迭代次数
+CELL_SIZE_TOLERANCE = 1.5  # 网格平均点数与目标相差不超过该倍数时停止迭代
+EXACT_FALLBACK_FRACTION = 16  # 相邻网格包含超过该比例分之一的点时，改为与全部点逐个比较
+COARSEN_FACTOR = 4  # 近邻不完整的点每轮在边长放大该倍数的网格上重新查找
+
+_stats_lock = threading.Lock()
+
+
+def _coords(vertex, indices=None):
+    columns = []
+    for axis in ('x', 'y', 'z'):
+        values = vertex[axis] if indices is None else vertex[axis][indices]
+        columns.append(np.asarray(values, dtype=np.float64))
+    return np.column_stack(columns)
+
+
+class NeighborGrid:
+    """
+    均匀网格邻域查找
+
+    点按所在网格编号排序后保存 (sorted_points)，查询时检查点所在网格及相邻的26个网格，
+    因此距离不超过网格边长的近邻一定能找到。查询点和候选点都用排序后的位置表示，
+    同一网格的点在内存中连续，所有查询按批展开为候选点对后向量化计算。
+    """
+
+    def __init__(self, points, cell_size):
+        lo = points.min(axis=0)
+        extent = points.max(axis=0) - lo
+        # 网格编号需要放进int64，范围过大 (如离群点极远) 时放大网格
+        while np.prod(extent / cell_size + 3) >= 2 ** 62:
+            cell_size *= 2
+            logger.warning(f"点云范围过大，邻域网格边长放大到 {cell_size}")
+        self.cell_size = cell_size
+        # 四周各留一格，相邻网格的编号不会越界到另一行
+        ijk = np.floor((points - lo) / cell_size).astype(np.int64) + 1
+        self.dims = ijk.max(axis=0) + 2
+        keys = (ijk[:, 0] * self.dims[1] + ijk[:, 1]) * self.dims[2] + ijk[:, 2]
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+        self.sorted_points = points[self.order]
+        self.cells, self.starts, self.counts = np.unique(self.keys, return_index=True, return_counts=True)
+        d = np.arange(-1, 2)
+        di, dj, dk = np.meshgrid(d, d, d, indexing='ij')
+        self.offsets = ((di * self.dims[1] + dj) * self.dims[2] + dk).ravel()
+
+    def candidate_pairs(self, queries):
+        """
+        逐批返回 (本批查询点, 查询点在本批中的序号, 候选点)，候选点为查询点所在网格及相邻网格内的点 (不含查询点本身)
+
+        查询点和候选点都是排序后的位置。每批的点对数不超过 MAX_PAIRS (单个点的候选数超过上限时该点单独成批)。
+        """
+        for begin in range(0, len(queries), QUERY_CHUNK_POINTS):
+            chunk = queries[begin:begin + QUERY_CHUNK_POINTS]
+            starts, counts = self._neighbor_cells(chunk)
+
+            totals = np.cumsum(counts.sum(axis=1))
+            lo = 0
+            while lo < len(chunk):
+                done = totals[lo - 1] if lo else 0
+                hi = max(lo + 1, int(np.searchsorted(totals, done + MAX_PAIRS, side='right')))
+                batch = chunk[lo:hi]
+                local, candidates = self._expand(batch, starts[lo:hi].ravel(), counts[lo:hi].ravel())
+                yield batch, local, candidates
+                lo = hi
+
+    def _neighbor_cells(self, queries):
+        # 每个查询点的27个相邻网格在排序后数组中的起点和点数，空网格的点数为0
+        neighbor_keys = self.keys[queries][:, None] + self.offsets
+        pos = np.minimum(np.searchsorted(self.cells, neighbor_keys), len(self.cells) - 1)
+        found = self.cells[pos] == neighbor_keys
+        return np.where(found, self.starts[pos], 0), np.where(found, self.counts[pos], 0)
+
+    def candidate_counts(self, queries):
+        """每个查询点的候选点数 (含自身)"""
+        return self._neighbor_cells(queries)[1].sum(axis=1)
+
+    def _expand(self, queries, starts, counts):
+        total = int(counts.sum())
+        # 把各网格的 [start, start+count) 区间拼接为一个位置数组
+        candidates = np.repeat(starts - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts) + np.arange(total)
+        local = np.repeat(np.repeat(np.arange(len(queries)), len(self.offsets)), counts)
+        distinct = candidates != queries[local]
+        return local[distinct], candidates[distinct]
+
+    def distances(self, queries, candidates):
+        diff = self.sorted_points[queries] - self.sorted_points[candidates]
+        return np.sqrt(np.einsum('ij,ij->i', diff, diff))
+
+
+def _occupancy(points, cell_size):
+    # 每个点所在网格的平均点数；只用于估计，网格编号溢出时的哈希冲突可以忽略
+    ijk = np.floor((points - points.min(axis=0)) / cell_size).astype(np.int64)
+    keys = (ijk[:, 0] * np.int64(2654435761) + ijk[:, 1]) * np.int64(805459861) + ijk[:, 2]
+    counts = np.unique(keys, return_counts=True)[1].astype(np.float64)
+    return float((counts ** 2).sum() / len(points))
+
+
+def estimate_cell_size(points, target):
+    """
+    估计使每个点所在网格平均约有 target 个点的网格边长
+
+    初值由稳健包围盒 (不受离群点影响) 计算，之后按实测点数迭代修正。扫描点云多为曲面，
+    点数随边长增长的幂次介于1和3之间，每次由边长减半前后的点数估计。
+    """
+    sample = _sample_indices(len(points), SPACING_SAMPLE_POINTS)
+    lo, hi = np.quantile(points if sample is None else points[sample], [0.01, 0.99], axis=0)
+    extent = float((hi - lo).max()) or float((points.max(axis=0) - points.min(axis=0)).max())
+    if extent == 0 or len(points) < 2:
+        return max(extent, 1.0)
+    size = extent / len(points) ** (1 / 3)
+    occupancy = _occupancy(points, size)
+    for _ in range(CELL_SIZE_STEPS):
+        if target / CELL_SIZE_TOLERANCE <= occupancy <= target * CELL_SIZE_TOLERANCE:
+            break
+        half = _occupancy(points, size / 2)
+        exponent = float(np.clip(np.log2(occupancy / half), 1.0, 3.0))
+        size *= (target / occupancy) ** (1 / exponent)
+        occupancy = _occupancy(points, size)
+    return size
+
+
+def _knn_pass(grid, queries, k, progress=None):
+    """
+    在网格的相邻27个网格内查找近邻，返回 (平均距离, 是否完整)
+
+    网格边长以内的近邻一定能找到，第 k 个近邻的距离不超过网格边长时结果是精确的；
+    否则标记为不完整，平均距离无效。
+    """
+    limit = grid.cell_size
+    result = np.zeros(len(queries))
+    complete = np.zeros(len(queries), dtype=bool)
+    position = 0
+    for batch, local, candidates in grid.candidate_pairs(queries):
+        dist = grid.distances(batch[local], candidates)
+        # 只有网格边长以内的近邻是完整的，其余不参与排序
+        within = dist <= limit
+        local, dist = local[within], dist[within]
+        # 按 (查询点, 距离) 排序，每个查询点取前 k 个
+        order = np.argsort(local + dist / (2 * limit))
+        local, dist = local[order], dist[order]
+        rank = np.arange(len(local)) - np.searchsorted(local, np.arange(len(batch)))[local]
+        nearest = rank < k
+        total = np.bincount(local[nearest], weights=dist[nearest], minlength=len(batch))
+        found = np.bincount(local[nearest], minlength=len(batch))
+        result[position:position + len(batch)] = total / k
+        complete[position:position + len(batch)] = found >= k
+        position += len(batch)
+        if progress is not None:
+            progress(position, len(queries))
+    return result, complete
+
+
+def _knn_exact(points, queries, k):
+    # 逐个与全部点比较，只用于邻域已覆盖大部分点云的少量查询点
+    columns = [np.ascontiguousarray(points[:, axis]) for axis in range(3)]
+    result = np.empty(len(queries))
+    for i, query in enumerate(queries):
+        dist = np.zeros(len(points))
+        for axis, column in enumerate(columns):
+            diff = column - column[query]
+            dist += diff * diff
+        dist[query] = np.inf
+        result[i] = np.sqrt(np.partition(dist, k - 1)[:k]).mean()
+    return result
+
+
+def knn_mean_distances(grid, queries, k, progress=None):
+    """
+    查询点 (网格排序后的位置) 到 k 个最近邻的精确平均距离
+
+    先在相邻网格内搜索；第 k 个近邻超出网格边长的点 (稀疏区域和离群点) 在边长放大 COARSEN_FACTOR 倍的网格上重新查找。
+    相邻网格已包含超过 1/EXACT_FALLBACK_FRACTION 的点时 (远离点云的离群点)，网格不比逐点比较更快，
+    这些点直接与全部点比较。
+    progress(processed, total) 在第一轮每批查询点计算完后调用一次。
+    """
+    points = grid.sorted_points
+    if len(points) <= k:
+        raise ValueError(f"点数 {len(points)} 不足 {k + 1} 个，无法计算 {k} 近邻距离")
+    result, complete = _knn_pass(grid, queries, k, progress)
+    pending = np.flatnonzero(~complete)
+    exact = []
+    coarse = grid
+    while len(pending):
+        coarse = NeighborGrid(points, coarse.cell_size * COARSEN_FACTOR)
+        position = np.empty(len(points), dtype=np.int64)
+        position[coarse.order] = np.arange(len(points))
+        coarse_queries = position[queries[pending]]
+        crowded = coarse.candidate_counts(coarse_queries) * EXACT_FALLBACK_FRACTION > len(points)
+        exact.append(pending[crowded])
+        pending, coarse_queries = pending[~crowded], coarse_queries[~crowded]
+        distances, complete = _knn_pass(coarse, coarse_queries, k)
+        result[pending[complete]] = distances[complete]
+        pending = pending[~complete]
+    exact = np.concatenate(exact) if exact else np.zeros(0, dtype=np.int64)
+    if len(exact):
+        logger.info(f"{len(exact)} 个点的近邻距离逐点计算")
+        result[exact] = _knn_exact(points, queries[exact], k)
+    return result
+
+
+def statistical_outlier_mask(points, k=DEFAULT_NEIGHBORS, std_ratio=DEFAULT_STD_RATIO, progress=None):
+    """
+    统计离群点滤波
+
+    计算每个点到 k 个最近邻的平均距离，超过全体的 均值 + std_ratio * 标准差 的点视为离群点。
+
+    返回:
+        np.ndarray: 保留标记 (True为保留)
+    """
+    if len(points) <= k:
+        return np.ones(len(points), dtype=bool)
+    grid = NeighborGrid(points, estimate_cell_size(points, k))
+    mean_distance = np.empty(len(points))
+    mean_distance[grid.order] = knn_mean_distances(grid, np.arange(len(points)), k, progress)
+    threshold = mean_distance.mean() + std_ratio * mean_distance.std()
+    return mean_distance <= threshold
+
+
+def radius_outlier_mask(points, radius=None, min_neighbors=DEFAULT_MIN_NEIGHBORS, progress=None):
+    """
+    半径离群点滤波: 半径内的近邻少于 min_neighbors 个的点视为离群点
+
+    radius 为None时取 DEFAULT_RADIUS_SPACING 倍的典型点间距
+
+    返回:
+        np.ndarray: 保留标记 (True为保留)
+    """
+    if len(points) == 0:
+        return np.ones(0, dtype=bool)
+    if radius is None:
+        radius = DEFAULT_RADIUS_SPACING * point_spacing(points)
+    if not radius > 0:
+        return np.ones(len(points), dtype=bool)
+    grid = NeighborGrid(points, radius)
+    keep = np.empty(len(points), dtype=bool)
+    processed = 0
+    for batch, local, candidates in grid.candidate_pairs(np.arange(len(points))):
+        within = grid.distances(batch[local], candidates) <= radius
+        keep[grid.order[batch]] = np.bincount(local[within], minlength=len(batch)) >= min_neighbors
+        processed += len(batch)
+        if progress is not None:
+            progress(processed, len(points))
+    return keep
+
+
+def outlier_mask(vertex, method, progress=None, **params):
+    """
+    按 method ('statistical' / 'radius') 计算离群点滤波的保留标记
+
+    参数:
+        vertex: 顶点 (结构化数组或列式数据)
+        progress (callable): 进度回调 (processed, total)，每批点计算完后调用，可以抛出异常来中止
+        params: statistical 为 k、std_ratio；radius 为 radius、min_neighbors
+    """
+    if method not in OUTLIER_METHODS:
+        raise ValueError(f"未知的离群点滤波方法: {method}")
+    points = _coords(vertex)
+    if method == 'statistical':
+        keep = statistical_outlier_mask(points, progress=progress, **params)
+    else:
+        keep = radius_outlier_mask(points, progress=progress, **params)
+    logger.info(f"离群点滤波 ({method}): 删除 {int(len(keep) - keep.sum())}/{len(keep)} 个点")
+    return keep
+
+
+def point_spacing(points, sample=SPACING_SAMPLE_POINTS, seed=0):
+    """用随机样本点到最近邻的距离中位数估计典型点间距"""
+    if len(points) < 2:
+        return 0.0
+    grid = NeighborGrid(points, estimate_cell_size(points, 2.0))
+    queries = np.arange(len(points))
+    if len(points) > sample:
+        queries = np.sort(np.random.default_rng(seed).choice(len(points), sample, replace=False))
+    return float(np.median(knn_mean_distances(grid, queries, 1)))
+
+
+class VertexSubset:
+    """
+    顶点的子集视图，提供 len()、dtype.names 和 subset[name]，可以替代顶点结构化数组使用
+
+    按属性名取列时才取出子集，结果缓存。
+    """
+
+    def __init__(self, vertex, indices):
+        self.vertex = vertex
+        self.indices = indices
+        self.dtype = vertex.dtype
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, name):
+        column = self._columns.get(name)
+        if column is None:
+            column = np.asarray(self.vertex[name][self.indices])
+            self._columns[name] = column
+        return column
+
+
+def stats_path(path):
+    return path + STATS_SUFFIX
+
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def _sample_indices(count, sample, seed=0):
+    if count <= sample:
+        return None
+    return np.sort(np.random.default_rng(seed).choice(count, sample, replace=False))
+
+
+def compute_stats(path):
+    """
+    计算点云统计信息
+
+    包括包围盒和去掉两端 ROBUST_QUANTILE 的稳健包围盒、质心、典型点间距、
+    密度直方图 (按网格统计每个非空网格的点数，以2的幂分箱) 和颜色范围。
+    """
+    try:
+        vertex = read_columns(path)
+    except Exception as e:
+        logger.warning(f"读取列式数据失败，改为读取顶点: {str(e)}")
+        vertex = read_vertex(path)
+    count = len(vertex)
+    stats = {'version': STATS_VERSION, 'source': _source_signature(path), 'count': int(count)}
+    if count == 0:
+        stats.update({'bounds': None, 'robust_bounds': None, 'centroid': None, 'spacing': None,
+                      'density': None, 'colors': None})
+        return stats
+
+    points = _coords(vertex)
+    sample = _sample_indices(count, STATS_SAMPLE_POINTS)
+    sampled = points if sample is None else points[sample]
+    stats['bounds'] = [points.min(axis=0).tolist(), points.max(axis=0).tolist()]
+    stats['robust_bounds'] = np.quantile(sampled, [ROBUST_QUANTILE, 1 - ROBUST_QUANTILE], axis=0).tolist()
+    stats['centroid'] = points.mean(axis=0).tolist()
+    stats['spacing'] = point_spacing(points)
+
+    # 密度直方图: 网格边长取典型点间距的4倍，hist[i] 为点数在 [2^i, 2^(i+1)) 内的网格数
+    cell_size = 4 * stats['spacing'] if stats['spacing'] > 0 else 1.0
+    grid = NeighborGrid(points, cell_size)
+    bins = np.floor(np.log2(grid.counts)).astype(np.int64)
+    stats['density'] = {
+        'cell_size': grid.cell_size,
+        'occupied_cells': int(len(grid.counts)),
+        'mean_points_per_cell': float(grid.counts.mean()),
+        'histogram': np.bincount(bins).tolist()
+    }
+
+    if all(c in vertex.dtype.names for c in COLOR_PROPS):
+        colors = {}
+        for c in COLOR_PROPS:
+            values = np.asarray(vertex[c])
+            sampled_values = values if sample is None else values[sample]
+            low, high = np.quantile(sampled_values, [0.01, 0.99]).tolist()
+            colors[c] = {'min': values.min().item(), 'max': values.max().item(),
+                         'mean': float(values.mean(dtype=np.float64)), 'p1': low, 'p99': high}
+        stats['colors'] = colors
+    else:
+        stats['colors'] = None
+    return stats
+
+
+def load_stats(path):
+    """读取缓存的统计信息，源文件已变化或尚未计算时返回None"""
+    target = stats_path(path)
+    if not os.path.exists(target):
+        return None
+    try:
+        with open(target, 'r', encoding='utf-8') as f:
+            stats = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"读取统计信息失败: {str(e)}")
+        return None
+    if stats.get('version') != STATS_VERSION or stats.get('source') != _source_signature(path):
+        return None
+    return stats
+
+
+def ensure_stats(path):
+    """返回最新的统计信息，不存在或已过期时重新计算并保存在文件旁"""
+    stats = load_stats(path)
+    if stats is not None:
+        return stats
+    with _stats_lock:
+        stats = load_stats(path)
+        if stats is None:
+            stats = compute_stats(path)
+            target = stats_path(path)
+            staging = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(staging, 'w', encoding='utf-8') as f:
+                json.dump(stats, f)
+            os.replace(staging, target)
+            logger.info(f"点云统计信息已保存到 {target}")
+    return stats
+
+
+def remove_stats(path):
+    """删除文件对应的统计信息"""
+    target = stats_path(path)
+    if os.path.exists(target):
+        os.unlink(target)
@@ -0,0 +1,271 @@
+import os
+import json
+import shutil
+import threading
+import logging
+import numpy as np
+from columnar import read_columns
+from downsample import stratified_indices
+from file_lock import FileLock, forget
+
+logger = logging.getLogger(__name__)
+
+INDEX_SUFFIX = '.index'  # 空间索引保存在 uploads/<文件名>.index/ 目录
+INDEX_FILE = 'index.json'
+INDEX_VERSION = 1
+POINTS_PER_CELL = 32  # 平均每个网格的目标点数
+MAX_CELLS = 1 << 21  # 网格总数上限，偏移数组最多占用16MB
+
+_build_lock = threading.Lock()
+
+
+def index_dir(path):
+    return path + INDEX_SUFFIX
+
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def grid_dims(lo, hi, count):
+    """按包围盒形状分配各轴网格数，使平均每个网格约 POINTS_PER_CELL 个点"""
+    extent = np.maximum(np.asarray(hi, dtype=np.float64) - lo, 0.0)
+    target = int(min(MAX_CELLS, max(1, count // POINTS_PER_CELL)))
+    active = extent > 0
+    if not active.any():
+        return np.ones(3, dtype=np.int64)
+    side = (np.prod(extent[active]) / target) ** (1 / active.sum())
+    dims = np.where(active, np.ceil(extent / side), 1).astype(np.int64)
+    # 取整后可能略超上限，逐步缩小最长的轴
+    while dims.prod() > MAX_CELLS:
+        dims[np.argmax(dims)] -= 1
+    return np.maximum(dims, 1)
+
+
+def _cell_coords(x, y, z, lo, cell_size, dims):
+    coords = []
+    for axis, values in enumerate((x, y, z)):
+        c = np.floor((np.asarray(values, dtype=np.float64) - lo[axis]) / cell_size[axis])
+        coords.append(np.clip(c, 0, dims[axis] - 1).astype(np.int64))
+    return coords
+
+
+def _cell_ids(x, y, z, lo, cell_size, dims):
+    cx, cy, cz = _cell_coords(x, y, z, lo, cell_size, dims)
+    return (cx * dims[1] + cy) * dims[2] + cz
+
+
+class GridIndex:
+    """
+    均匀网格空间索引
+
+    点按所在网格编号排序后保存为 order.npy，cell_start.npy 记录每个网格在 order 中的起始位置，
+    查询时只需检查与区域相交的网格内的点。
+    """
+
+    def __init__(self, directory, meta):
+        self.directory = directory
+        self.meta = meta
+        self.lo = np.array(meta['bounds'][0], dtype=np.float64)
+        self.hi = np.array(meta['bounds'][1], dtype=np.float64)
+        self.dims = np.array(meta['dims'], dtype=np.int64)
+        self.cell_size = np.array(meta['cell_size'], dtype=np.float64)
+        mmap_mode = 'r' if meta['count'] else None
+        self.order = np.load(os.path.join(directory, 'order.npy'), mmap_mode=mmap_mode)
+        self.cell_start = np.load(os.path.join(directory, 'cell_start.npy'), mmap_mode=mmap_mode)
+
+    def cell_ids(self, x, y, z):
+        return _cell_ids(x, y, z, self.lo, self.cell_size, self.dims)
+
+    def cells_in_box(self, lo, hi):
+        """返回与轴对齐包围盒相交的非空网格编号"""
+        lo = np.asarray(lo, dtype=np.float64)
+        hi = np.asarray(hi, dtype=np.float64)
+        if np.any(hi < self.lo) or np.any(lo > self.hi) or self.meta['count'] == 0:
+            return np.zeros(0, dtype=np.int64)
+        first = _cell_coords(*lo, self.lo, self.cell_size, self.dims)
+        last = _cell_coords(*hi, self.lo, self.cell_size, self.dims)
+        ranges = [np.arange(int(a), int(b) + 1) for a, b in zip(first, last)]
+        cx, cy, cz = np.meshgrid(*ranges, indexing='ij')
+        cells = ((cx * self.dims[1] + cy) * self.dims[2] + cz).ravel()
+        return cells[self.cell_start[cells + 1] > self.cell_start[cells]]
+
+    def cells_in_frustum(self, planes):
+        """
+        返回与视锥体相交的非空网格编号
+
+        planes 为 (a, b, c, d) 列表，满足 a*x + b*y + c*z + d >= 0 的点在平面内侧 (与three.js的Frustum一致)。
+        """
+        counts = np.diff(self.cell_start)
+        cells = np.nonzero(counts)[0]
+        cz = cells % self.dims[2]
+        cy = (cells // self.dims[2]) % self.dims[1]
+        cx = cells // (self.dims[1] * self.dims[2])
+        cell_lo = self.lo + np.column_stack([cx, cy, cz]) * self.cell_size
+        cell_hi = cell_lo + self.cell_size
+        keep = np.ones(len(cells), dtype=bool)
+        for a, b, c, d in planes:
+            normal = np.array([a, b, c], dtype=np.float64)
+            # 取网格在法线方向上最远的角点，该角点在平面外侧时整个网格都在外侧
+            corner = np.where(normal >= 0, cell_hi, cell_lo)
+            keep &= corner @ normal + d >= 0
+        return cells[keep]
+
+    def points_in_cells(self, cells):
+        """返回给定网格内所有点的索引"""
+        starts = np.asarray(self.cell_start[cells], dtype=np.int64)
+        counts = np.asarray(self.cell_start[cells + 1], dtype=np.int64) - starts
+        total = int(counts.sum())
+        if total == 0:
+            return np.zeros(0, dtype=np.int64)
+        # 把各网格的 [start, start+count) 区间拼接为一个位置数组
+        offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts)
+        positions = offsets + np.arange(total)
+        return np.asarray(self.order[positions], dtype=np.int64)
+
+
+def load_index(path):
+    """读取已构建的空间索引，源文件已变化或尚未构建时返回None"""
+    meta_path = os.path.join(index_dir(path), INDEX_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"读取空间索引失败: {str(e)}")
+        return None
+    if meta.get('version') != INDEX_VERSION or meta.get('source') != _source_signature(path):
+        return None
+    return GridIndex(index_dir(path), meta)
+
+
+def build_index(path):
+    """
+    为点云构建均匀网格空间索引，写入 <path>.index/
+
+    返回:
+        GridIndex: 构建好的索引
+    """
+    vertex = read_columns(path)
+    count = len(vertex)
+    coords = [np.asarray(vertex[axis], dtype=np.float64) for axis in ('x', 'y', 'z')]
+    if count:
+        lo = np.array([c.min() for c in coords])
+        hi = np.array([c.max() for c in coords])
+    else:
+        lo, hi = np.zeros(3), np.zeros(3)
+    dims = grid_dims(lo, hi, count)
+    extent = hi - lo
+    cell_size = np.where(extent > 0, extent / dims, 1.0)
+    logger.info(f"开始构建空间索引: {path}，网格 {dims.tolist()}")
+
+    meta = {
+        'version': INDEX_VERSION,
+        'source': _source_signature(path),
+        'count': int(count),
+        'bounds': [lo.tolist(), hi.tolist()],
+        'dims': dims.tolist(),
+        'cell_size': cell_size.tolist()
+    }
+
+    target = index_dir(path)
+    staging = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if os.path.exists(staging):
+        shutil.rmtree(staging)
+    os.makedirs(staging)
+
+    cells = _cell_ids(*coords, lo, cell_size, dims)
+    order = np.argsort(cells, kind='stable').astype(np.uint32 if count < 2 ** 32 else np.int64)
+    cell_start = np.concatenate([[0], np.cumsum(np.bincount(cells, minlength=int(dims.prod())))])
+    np.save(os.path.join(staging, 'order.npy'), order)
+    np.save(os.path.join(staging, 'cell_start.npy'), cell_start.astype(np.int64))
+    with open(os.path.join(staging, INDEX_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+    if os.path.exists(target):
+        shutil.rmtree(target)
+    os.replace(staging, target)
+    logger.info(f"空间索引构建完成，保存到 {target}")
+    return GridIndex(target, meta)
+
+
+def ensure_index(path):
+    """返回最新的空间索引，不存在或已过期时重新构建"""
+    index = load_index(path)
+    if index is not None:
+        return index
+    # 多个worker可能同时为同一文件构建，文件锁保证只构建一次，其他进程等待后直接读取结果
+    with _build_lock, FileLock(f'{index_dir(path)}.lock'):
+        index = load_index(path)
+        if index is None:
+            index = build_index(path)
+    return index
+
+
+def remove_index(path):
+    """删除文件对应的空间索引"""
+    target = index_dir(path)
+    if os.path.exists(target):
+        shutil.rmtree(target, ignore_errors=True)
+    if os.path.exists(f'{target}.lock'):
+        os.unlink(f'{target}.lock')
+        forget(f'{target}.lock')
+
+
+def query_region(path, box=None, sphere=None, frustum=None, budget=None, seed=0):
+    """
+    查询区域内的点
+
+    参数:
+        path (str): PLY文件路径
+        box (tuple): ((xmin, ymin, zmin), (xmax, ymax, zmax))
+        sphere (tuple): ((cx, cy, cz), radius)
+        frustum (list): 6个平面 (a, b, c, d)，内侧满足 a*x + b*y + c*z + d >= 0
+        budget (int): 最多返回的点数，区域内点数更多时按网格分层采样
+        seed (int): 分层采样的随机种子
+
+    返回:
+        (ndarray, int): 按原始顺序排列的点索引，以及区域内的总点数
+    """
+    if sum(region is not None for region in (box, sphere, frustum)) != 1:
+        raise ValueError('box、sphere、frustum 必须且只能指定一个')
+
+    index = ensure_index(path)
+    vertex = read_columns(path)
+
+    if box is not None:
+        lo, hi = np.asarray(box[0], dtype=np.float64), np.asarray(box[1], dtype=np.float64)
+        cells = index.cells_in_box(lo, hi)
+    elif sphere is not None:
+        center, radius = np.asarray(sphere[0], dtype=np.float64), float(sphere[1])
+        cells = index.cells_in_box(center - radius, center + radius)
+    else:
+        planes = np.asarray(frustum, dtype=np.float64)
+        if planes.shape != (6, 4):
+            raise ValueError('frustum 需要6个平面，每个平面4个系数')
+        cells = index.cells_in_frustum(planes)
+
+    candidates = index.points_in_cells(cells)
+    x, y, z = (np.asarray(vertex[axis][candidates], dtype=np.float64) for axis in ('x', 'y', 'z'))
+
+    # 网格只是粗筛，再逐点精确判断
+    if box is not None:
+        inside = (x >= lo[0]) & (x <= hi[0]) & (y >= lo[1]) & (y <= hi[1]) & (z >= lo[2]) & (z <= hi[2])
+    elif sphere is not None:
+        inside = (x - center[0]) ** 2 + (y - center[1]) ** 2 + (z - center[2]) ** 2 <= radius ** 2
+    else:
+        inside = np.ones(len(candidates), dtype=bool)
+        for a, b, c, d in planes:
+            inside &= a * x + b * y + c * z + d >= 0
+    selected = candidates[inside]
+    total = len(selected)
+
+    if budget is not None and total > budget:
+        # 按索引网格分层采样，保持区域内的空间分布
+        cells = index.cell_ids(x[inside], y[inside], z[inside])
+        keep = stratified_indices(cells, budget / total, budget, np.random.default_rng(seed))
+        selected = selected[keep]
+
+    return np.sort(selected), total
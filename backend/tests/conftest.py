@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 后端模块以顶层模块方式互相导入 (如 from cloud_cache import ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from preprocess import (NeighborGrid, estimate_cell_size, knn_mean_distances, point_spacing,
+                        statistical_outlier_mask, radius_outlier_mask)
+
+
+def brute_knn_mean(points, k):
+    dist = np.sqrt(((points[:, None] - points[None]) ** 2).sum(axis=-1))
+    np.fill_diagonal(dist, np.inf)
+    return np.sort(dist, axis=1)[:, :k].mean(axis=1)
+
+
+def brute_sor(points, k, std_ratio):
+    mean_distance = brute_knn_mean(points, k)
+    return mean_distance <= mean_distance.mean() + std_ratio * mean_distance.std()
+
+
+def plane_with_outliers(rng):
+    plane = np.column_stack([rng.random((6000, 2)), np.zeros(6000)])
+    return np.vstack([plane, rng.uniform(-1, 2, (60, 3))])
+
+
+def blob_with_outliers(rng):
+    return np.vstack([rng.normal(size=(4000, 3)), rng.uniform(-10, 10, (50, 3))])
+
+
+def far_outliers_and_duplicates(rng):
+    # 极远的离群点 (邻域覆盖整个点云) 和完全重合的点
+    return np.vstack([rng.normal(size=(3000, 3)), rng.uniform(-1e4, 1e4, (30, 3)), np.zeros((20, 3))])
+
+
+CLOUDS = [plane_with_outliers, blob_with_outliers, far_outliers_and_duplicates]
+
+
+@pytest.mark.parametrize('make_cloud', CLOUDS)
+@pytest.mark.parametrize('k', [1, 8])
+def test_knn_mean_distances_exact(make_cloud, k):
+    points = make_cloud(np.random.default_rng(0))
+    grid = NeighborGrid(points, estimate_cell_size(points, k))
+    result = np.empty(len(points))
+    result[grid.order] = knn_mean_distances(grid, np.arange(len(points)), k)
+    np.testing.assert_allclose(result, brute_knn_mean(points, k), rtol=1e-12, atol=1e-12)
+
+
+@pytest.mark.parametrize('make_cloud', CLOUDS)
+def test_statistical_outlier_mask_matches_brute_force(make_cloud):
+    points = make_cloud(np.random.default_rng(1))
+    np.testing.assert_array_equal(statistical_outlier_mask(points, k=8, std_ratio=2.0),
+                                  brute_sor(points, 8, 2.0))
+
+
+def test_statistical_outlier_mask_keeps_clean_plane():
+    points = plane_with_outliers(np.random.default_rng(2))
+    keep = statistical_outlier_mask(points)
+    assert keep[:6000].all()
+
+
+@pytest.mark.parametrize('make_cloud', CLOUDS)
+def test_radius_outlier_mask_matches_brute_force(make_cloud):
+    points = make_cloud(np.random.default_rng(3))
+    radius = 5 * point_spacing(points)
+    dist = np.sqrt(((points[:, None] - points[None]) ** 2).sum(axis=-1))
+    expected = (dist <= radius).sum(axis=1) - 1 >= 4
+    np.testing.assert_array_equal(radius_outlier_mask(points, radius, 4), expected)
+
+
+def test_knn_needs_more_than_k_points():
+    points = np.random.default_rng(4).random((5, 3))
+    with pytest.raises(ValueError):
+        knn_mean_distances(NeighborGrid(points, 0.1), np.arange(5), 8)
+    assert statistical_outlier_mask(points, k=8).all()
@@ -0,0 +1,35 @@
+"""
+生产环境入口
+
+Linux / macOS 使用 gunicorn (多进程，每个进程多线程):
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Windows 上 gunicorn 不可用，直接运行本文件使用 waitress (单进程多线程):
+    python wsgi.py
+
+进程数、线程数、端口和超时通过环境变量配置，见 gunicorn.conf.py。
+"""
+import os
+import logging
+from app import app, job_manager
+
+logger = logging.getLogger(__name__)
+
+application = app
+
+
+def serve_waitress():
+    from waitress import serve
+
+    port = int(os.environ.get('PORT', 8085))
+    threads = int(os.environ.get('WEB_THREADS', 8))
+    logger.info(f"waitress 启动在 http://0.0.0.0:{port}，线程数: {threads}")
+    try:
+        serve(app, host='0.0.0.0', port=port, threads=threads,
+              channel_timeout=int(os.environ.get('WEB_TIMEOUT', 300)))
+    finally:
+        job_manager.shutdown(wait=False)
+
+
+if __name__ == '__main__':
+    serve_waitress()